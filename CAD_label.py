@@ -3,15 +3,17 @@ load_backend("pyqt5")  # Use "qt-pyside2" if you're using PySide
 
 from OCC.Display.qtDisplay import qtViewer3d
 from OCC.Display.OCCViewer import get_color_from_name
-from OCC.Core.AIS import AIS_Shape
-from OCC.Core.TopExp import TopExp_Explorer
+from OCC.Core.AIS import AIS_Shape, AIS_ColoredShape
+from OCC.Core.TopExp import topexp
+from OCC.Core.TopTools import TopTools_IndexedMapOfShape
 from OCC.Core.TopAbs import TopAbs_SOLID, TopAbs_FACE, TopAbs_EDGE
 from OCC.Core.TopoDS import topods_Face, topods
 from OCC.Core.TopLoc import TopLoc_Location  
-from OCC.Core.STEPControl import STEPControl_Writer, STEPControl_AsIs
+from OCC.Core.STEPControl import STEPControl_Writer, STEPControl_AsIs, STEPControl_Reader
+from OCC.Core.IFSelect import IFSelect_RetDone
+from OCC.Core.BRepBuilderAPI import BRepBuilderAPI_Copy
 from OCC.Core.STEPConstruct import stepconstruct
 from OCC.Core.TCollection import TCollection_HAsciiString
-from OCC.Extend.DataExchange import read_step_file
 from OCC.Extend.TopologyUtils import TopologyExplorer
 from OCC.Display.qtDisplay import qtViewer3d
 from OCC.Core.Graphic3d import Graphic3d_MaterialAspect, Graphic3d_NameOfTextureEnv, Graphic3d_NameOfMaterial
@@ -28,11 +30,234 @@ from OCC.Core.Quantity import (
 
 from PyQt5 import QtCore, uic, QtWidgets
 from PyQt5.QtCore import Qt
-from PyQt5.QtGui import QIcon, QStandardItemModel, QStandardItem
-from PyQt5.QtWidgets import QApplication, QFileDialog, QInputDialog, QWidget, QVBoxLayout, QSizePolicy, QPushButton, QMdiSubWindow
+from PyQt5.QtGui import QIcon
+from PyQt5.QtWidgets import QApplication, QFileDialog, QInputDialog, QWidget, QVBoxLayout, QSizePolicy, QPushButton, QMdiSubWindow, QRubberBand
 
 import sys
-from Utils.occ_utils_addon import save_shape,  viewer_raytracing, viewer_rasterization, list_face
+import math
+import numpy as np
+from Utils.occ_utils_addon import save_shape, save_face_graph, viewer_raytracing, viewer_rasterization, face_labels_from_step, mesh_for_display, mesh_shape, face_triangulations, transfer_mesh, use_existing_mesh
+from Utils.shape_index import FaceIndex
+from Utils.face_selection import FaceSelection
+import Utils.parameters as param
+
+# Display color of every face label in param.label_names
+LABEL_COLORS = {
+    "Hole": Quantity_Color(1.0, 0.0, 0.0, Quantity_TOC_RGB),   # Red
+    "Slot": Quantity_Color(0.0, 1.0, 0.0, Quantity_TOC_RGB),   # Green
+    "Pocket": Quantity_Color(0.0, 0.0, 1.0, Quantity_TOC_RGB),   # Blue
+    "Passage": Quantity_Color(1.0, 0.0, 1.0, Quantity_TOC_RGB),   # Magenta
+    "Stock": Quantity_Color(0.0, 1.0, 1.0, Quantity_TOC_RGB),   # Cyan
+    "Groove": Quantity_Color(1.0, 0.5, 0.0, Quantity_TOC_RGB),   # Orange
+    "Step": Quantity_Color(0.6, 0.2, 0.8, Quantity_TOC_RGB),   # Purple
+    "Chamfer": Quantity_Color(0.3, 0.7, 0.5, Quantity_TOC_RGB),   # Teal-green
+    "Fillet": Quantity_Color(0.7, 0.3, 0.3, Quantity_TOC_RGB),   # Brownish-red
+    "Wall": Quantity_Color(0.3, 0.3, 0.7, Quantity_TOC_RGB),   # Deep blue
+    "Wall + Hole": Quantity_Color(0.4, 0.6, 0.2, Quantity_TOC_RGB),   # Olive-green
+    "Optical": Quantity_Color(0.6, 0.4, 0.2, Quantity_TOC_RGB),   # Dark tan
+}
+
+
+class StepImportThread(QtCore.QThread):
+    """
+    Reads a STEP file off the GUI thread.
+
+    Progress messages are emitted once the file is parsed and after every root is
+    transferred. Interruption is checked between those steps; the STEP parser itself
+    cannot be interrupted, so a cancelled read is dropped as soon as parsing returns.
+    """
+    progress = QtCore.pyqtSignal(str)
+    loaded = QtCore.pyqtSignal(object) # (TopoDS_Shape, FaceIndex, face labels, mesh info)
+    failed = QtCore.pyqtSignal(str)
+
+    def __init__(self, path, sub, shape_name, previous_title, parent=None):
+        super().__init__(parent)
+        self.path = path
+        self.sub = sub # QMdiSubWindow the shape is loaded into
+        self.shape_name = shape_name
+        self.previous_title = previous_title # title of sub, restored if the load fails or is cancelled
+
+    def run(self):
+        # an exception would end the thread silently, report it so the import state is reset
+        try:
+            self.read()
+        except Exception as exc:
+            self.failed.emit(f"❌ Failed to import {self.path}: {exc}")
+
+    def read(self):
+        reader = STEPControl_Reader()
+        self.progress.emit(f"⏳ Parsing {self.path} ...")
+        if reader.ReadFile(self.path) != IFSelect_RetDone:
+            self.failed.emit(f"❌ Failed to read {self.path}.")
+            return
+        if self.isInterruptionRequested():
+            return
+
+        nb_entities = reader.WS().Model().NbEntities()
+        nb_roots = reader.NbRootsForTransfer()
+        self.progress.emit(f"⏳ Parsed {nb_entities} STEP entities, transferring {nb_roots} root(s) ...")
+        for i in range(1, nb_roots + 1):
+            if self.isInterruptionRequested():
+                return
+            reader.TransferRoot(i)
+            self.progress.emit(f"⏳ Transferred root {i}/{nb_roots}.")
+
+        shape = reader.OneShape()
+        if shape.IsNull():
+            self.failed.emit(f"❌ No shape transferred from {self.path}.")
+            return
+        face_index = FaceIndex(shape)  # Stable integer ids for all faces of the shape
+        face_index.boxes()  # Face boxes used by box / lasso selection
+        face_labels = face_labels_from_step(reader, face_index, param.label_names)
+        if self.isInterruptionRequested():
+            return
+        self.progress.emit(f"⏳ Meshing {len(face_index)} faces ...")
+        mesh_info = mesh_for_display(shape)  # Coarse tessellation for the first frame, refined once displayed
+        if self.isInterruptionRequested():
+            return
+        self.loaded.emit((shape, face_index, face_labels, mesh_info))
+
+
+class MeshRefineThread(QtCore.QThread):
+    """
+    Meshes the finer display levels of a shape off the GUI thread.
+
+    The worker copies the shape once, without its mesh, and meshes every level on that
+    copy, so the displayed shape is only read while it is copied. The triangulations of
+    a finished level are emitted as handles and moved to the displayed shape on the GUI
+    thread; meshing the next level gives the copy new triangulations and leaves the
+    emitted ones alone.
+    """
+    refined = QtCore.pyqtSignal(object) # ([Poly_Triangulation] per face, level, mesh info)
+
+    def __init__(self, shape, levels, viewer, parent=None):
+        super().__init__(parent)
+        self.shape = shape # displayed shape, only read to copy it
+        self.levels = levels # [(linear_def, angular_def)] still to mesh, coarse to fine
+        self.viewer = viewer # qtViewer3d the shape is displayed in
+
+    def run(self):
+        if self.isInterruptionRequested():
+            return
+        shape = BRepBuilderAPI_Copy(self.shape, True, False).Shape()
+        for level, (linear_def, angular_def) in enumerate(self.levels, 1):
+            if self.isInterruptionRequested():
+                return
+            info = mesh_shape(shape, linear_def, angular_def)
+            triangulations = face_triangulations(shape)
+            if self.isInterruptionRequested():
+                return
+            self.refined.emit((triangulations, level, info))
+
+
+class ShapeTreeNode:
+    def __init__(self, shape, shape_type, child_type, row, parent):
+        self.shape = shape
+        self.shape_type = shape_type
+        self.child_type = child_type # TopAbs type of the children, None for leaves
+        self.row = row
+        self.parent = parent
+        self.children = []
+        self.child_map = None # TopTools_IndexedMapOfShape, built on first fetch
+
+
+class ShapeTreeModel(QtCore.QAbstractItemModel):
+    """
+    Shape hierarchy (solid -> face -> edge) enumerated on demand.
+
+    Children of a node are mapped with topexp.MapShapes only when the view asks for them
+    (canFetchMore/fetchMore on expansion) and rows are inserted FETCH_BATCH at a time,
+    so the cost scales with what is visible rather than with the size of the shape.
+    """
+    FETCH_BATCH = 256
+    CHILD_TYPE = {TopAbs_SOLID: TopAbs_FACE, TopAbs_FACE: TopAbs_EDGE, TopAbs_EDGE: None}
+    TYPE_NAME = {TopAbs_SOLID: "Solid", TopAbs_FACE: "Face", TopAbs_EDGE: "Edge"}
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.root = ShapeTreeNode(None, None, None, 0, None)
+
+    def set_shape(self, shape):
+        """Show the hierarchy of shape, None clears the model"""
+        self.beginResetModel()
+        self.root = ShapeTreeNode(None, None, None, 0, None)
+        if shape is not None:
+            solids = TopTools_IndexedMapOfShape()
+            topexp.MapShapes(shape, TopAbs_SOLID, solids)
+            # shells and loose faces start the hierarchy at face level
+            root_type = TopAbs_SOLID if solids.Size() > 0 else TopAbs_FACE
+            self.root = ShapeTreeNode(shape, None, root_type, 0, None)
+            if root_type == TopAbs_SOLID:
+                self.root.child_map = solids
+        self.endResetModel()
+
+    def _node(self, index):
+        if index.isValid():
+            return index.internalPointer()
+        return self.root
+
+    def index(self, row, column, parent=QtCore.QModelIndex()):
+        if not self.hasIndex(row, column, parent):
+            return QtCore.QModelIndex()
+        return self.createIndex(row, column, self._node(parent).children[row])
+
+    def parent(self, index):
+        if not index.isValid():
+            return QtCore.QModelIndex()
+        parent_node = index.internalPointer().parent
+        if parent_node is None or parent_node is self.root:
+            return QtCore.QModelIndex()
+        return self.createIndex(parent_node.row, 0, parent_node)
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        if parent.column() > 0:
+            return 0
+        return len(self._node(parent).children)
+
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        return 1
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or role != Qt.DisplayRole:
+            return None
+        node = index.internalPointer()
+        return f"{self.TYPE_NAME[node.shape_type]} {node.row}"
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            return "Shape Hierarchy"
+        return None
+
+    def hasChildren(self, parent=QtCore.QModelIndex()):
+        node = self._node(parent)
+        if node.child_type is None:
+            return False
+        if node.child_map is None:
+            return True # not mapped yet, solids and faces always have children
+        return node.child_map.Size() > 0
+
+    def canFetchMore(self, parent):
+        node = self._node(parent)
+        if node.child_type is None:
+            return False
+        return node.child_map is None or len(node.children) < node.child_map.Size()
+
+    def fetchMore(self, parent):
+        node = self._node(parent)
+        if node.child_map is None:
+            node.child_map = TopTools_IndexedMapOfShape()
+            topexp.MapShapes(node.shape, node.child_type, node.child_map)
+
+        start = len(node.children)
+        end = min(start + self.FETCH_BATCH, node.child_map.Size())
+        if end <= start:
+            return
+        self.beginInsertRows(parent, start, end - 1)
+        for row in range(start, end):
+            child = node.child_map.FindKey(row + 1)
+            node.children.append(ShapeTreeNode(child, node.child_type, self.CHILD_TYPE[node.child_type], row, node))
+        self.endInsertRows()
+
 
 class OCCViewer(QtWidgets.QMainWindow):
     def __init__(self):
@@ -45,13 +270,17 @@ class OCCViewer(QtWidgets.QMainWindow):
         # File Menu actions
         self.new_doc_actionBtn = self.findChild(QtWidgets.QAction, "newDocument")
         self.import_step_action = self.findChild(QtWidgets.QAction, "importStep")
+        self.cancel_import_action = self.findChild(QtWidgets.QAction, "cancelImport")
         self.export_step_action = self.findChild(QtWidgets.QAction, "exportStep")
+        self.export_face_graph_action = self.findChild(QtWidgets.QAction, "exportFaceGraph")
 
         # Selection Menu actions
         self.body_selection_action = self.findChild(QtWidgets.QAction, "selectBody")
         self.face_selection_action = self.findChild(QtWidgets.QAction, "selectFace")
         self.edge_selection_action = self.findChild(QtWidgets.QAction, "selectEdge")
         self.vertex_selection_action = self.findChild(QtWidgets.QAction, "selectVertex")
+        self.box_selection_action = self.findChild(QtWidgets.QAction, "selectBox")
+        self.lasso_selection_action = self.findChild(QtWidgets.QAction, "selectLasso")
 
         # View Menu actions
         self.front_view_action = self.findChild(QtWidgets.QAction, "actionFront")
@@ -84,20 +313,24 @@ class OCCViewer(QtWidgets.QMainWindow):
         self.active_viewer = None
         self.active_sub = None
 
-        self.selected_faces = {} # dictionary of selected faces {hash(face): TopDS_Face}
-        self.highlight_selected_faces = {} # dictionary of highlighted faces {hash(face): AIS_Shape}. 
-        self.face_map = {} # dictionary of face labels {hash(face): label}
-        self.color_labeled_faces = {} # dictionary of labeled faces {hash(face): AIS_Shape}
-        self.ais_shape = {} # dictionary of AIS_Shape objects {subwindow name: ais_shape}
+        self.selection = None # FaceSelection of the active document, selected faces and their highlights
+        self.ais_shape = {} # dictionary of shaded AIS_ColoredShape objects {loaded TopoDS_Shape: ais_shape}, labels are its face colors
 
-        self.face_list = [] # list of faces in the shape
+        self.face_index = None # FaceIndex of the active shape
+        self.face_labels = None # label per face id of the active shape, index into param.label_names or -1
 
         self._mouse_down_time = None
 
+        self.area_selection = None # None for click selection, "box" or "lasso" for drag selection of faces
+        self._area_points = [] # window pixels of the current box / lasso drag
+        self._rubber_band = None
+
+        self.import_thread = None # StepImportThread currently loading a file
+        self.cancelled_imports = [] # cancelled StepImportThread still inside the STEP parser
+        self.refine_threads = [] # MeshRefineThread of every document still being refined
 
         # Set up model and view
-        self.tree_model = QStandardItemModel()
-        self.tree_model.setHorizontalHeaderLabels(["Shape Hierarchy"])
+        self.tree_model = ShapeTreeModel()
         self.tree_view = self.findChild(QtWidgets.QTreeView, "treeView")
         self.tree_view.setModel(self.tree_model)
         # self.tree_view.expandAll()
@@ -110,13 +343,17 @@ class OCCViewer(QtWidgets.QMainWindow):
         # connect file menu buttons
         self.new_doc_actionBtn.triggered.connect(self.create_new_document)
         self.import_step_action.triggered.connect(self.import_step_to_active)
+        self.cancel_import_action.triggered.connect(self.cancel_import)
         self.export_step_action.triggered.connect(self.export_step_file_with_label)
+        self.export_face_graph_action.triggered.connect(self.export_face_graph)
 
         # connect selection menu buttons
         self.body_selection_action.triggered.connect(self.body_selection)
         self.face_selection_action.triggered.connect(self.face_selection)
         self.edge_selection_action.triggered.connect(self.edge_selection)
         self.vertex_selection_action.triggered.connect(self.vertex_selection)
+        self.box_selection_action.triggered.connect(self.box_selection)
+        self.lasso_selection_action.triggered.connect(self.lasso_selection)
 
         # connect view menu buttons
         self.front_view_action.triggered.connect(self.front_view)
@@ -150,10 +387,18 @@ class OCCViewer(QtWidgets.QMainWindow):
             if subwindow.widget() is not None:
                 self.active_viewer = subwindow.widget()
                 self.active_shape = self.active_viewer.shape
+                self.face_index = self.active_viewer.face_index
+                self.face_labels = self.active_viewer.face_labels
+                self.selection = self.active_viewer.selection
+                self.populate_shape_tree(self.active_shape)
                 print("Change active viewer and shape")
             else:
                 self.active_viewer = None
                 self.active_shape = None
+                self.face_index = None
+                self.face_labels = None
+                self.selection = None
+                self.populate_shape_tree(None)
                 print("No viewer in subwindow")
             print("Subwindow activated:", self.active_sub.windowTitle())
             self.console.append("Subwindow activated: " + subwindow.windowTitle())
@@ -197,27 +442,60 @@ class OCCViewer(QtWidgets.QMainWindow):
 
     def face_selection(self):
         self.clear_face_selection()
+        self.area_selection = None
         
-        # ais_shape = self.ais_shape[self.active_sub.windowTitle()]
+        # ais_shape = self.ais_shape[self.active_viewer.shape]
         # self.active_viewer._display.Context.Deactivate(ais_shape)
         # self.active_viewer._display.Context.Activate(ais_shape, 4, True)  # Mode 4 = Face selection
         self.active_viewer._display.SetSelectionModeFace()  
 
     def edge_selection(self):
         self.clear_face_selection()
-        # ais_shape = self.ais_shape[self.active_sub.windowTitle()]
+        self.area_selection = None
+        # ais_shape = self.ais_shape[self.active_viewer.shape]
         # self.active_viewer._display.Context.Deactivate(ais_shape)
         # self.active_viewer._display.Context.Activate(ais_shape, 2, True)  # Mode 4 = Face selection
         self.active_viewer._display.SetSelectionModeEdge()  
     
     def vertex_selection(self):
         self.clear_face_selection()
+        self.area_selection = None
         self.active_viewer._display.SetSelectionModeVertex()
     
     def body_selection(self):
         self.clear_face_selection()
+        self.area_selection = None
         self.active_viewer._display.SetSelectionModeShape()
 
+    def box_selection(self):
+        """Select faces by dragging a rectangle, Ctrl + drag deselects"""
+        self.clear_face_selection()
+        self.area_selection = "box"
+        self.active_viewer._display.SetSelectionModeFace()
+        self.console.append("Box face selection activated.")
+
+    def lasso_selection(self):
+        """Select faces by drawing a lasso, Ctrl + drag deselects"""
+        self.clear_face_selection()
+        self.area_selection = "lasso"
+        self.active_viewer._display.SetSelectionModeFace()
+        self.console.append("Lasso face selection activated.")
+
+    def select_area(self, points, deselect=False):
+        """Select or deselect all faces inside the box / lasso drawn in window pixels"""
+        view = self.active_viewer._display.View
+        faces = self.selection.faces_in_area(view, points, lasso=self.area_selection == "lasso")
+        if deselect:
+            fids = self.selection.deselect(faces)
+            message = f"❌ {len(fids)} faces deselected."
+        else:
+            fids = self.selection.select(faces)
+            message = f"✅ {len(fids)} faces selected."
+        stats = self.selection.stats()
+        print(f"{message} (area {stats['area']['last_ms']:.1f} ms, "
+              f"highlight {stats['deselect' if deselect else 'select']['last_ms']:.1f} ms)")
+        self.console.append(message)
+
     def create_new_document(self):
         sub = QMdiSubWindow()
         # sub.setWidget(viewer_widget)
@@ -230,46 +508,26 @@ class OCCViewer(QtWidgets.QMainWindow):
         self.console.append("🗂️ New document created.")
 
     def populate_shape_tree(self, shape):
-        solid_explorer = TopExp_Explorer(shape, TopAbs_SOLID)
-        solid_idx = 0
-        while solid_explorer.More():
-            solid = topods.Solid(solid_explorer.Current())
-            solid_item = QStandardItem(f"Solid {solid_idx}")
-            self.tree_model.appendRow(solid_item)
-
-            # Explore faces in solid
-            face_explorer = TopExp_Explorer(solid, TopAbs_FACE)
-            face_idx = 0
-            while face_explorer.More():
-                face = topods.Face(face_explorer.Current())
-                face_item = QStandardItem(f"  Face {face_idx}")
-                solid_item.appendRow(face_item)
-
-                # Explore edges in face
-                edge_explorer = TopExp_Explorer(face, TopAbs_EDGE)
-                edge_idx = 0
-                while edge_explorer.More():
-                    edge = topods.Edge(edge_explorer.Current())
-                    edge_item = QStandardItem(f"    Edge {edge_idx}")
-                    face_item.appendRow(edge_item)
-
-                    edge_explorer.Next()
-                    edge_idx += 1
-
-                face_explorer.Next()
-                face_idx += 1
-
-            solid_explorer.Next()
-            solid_idx += 1
+        """Show the hierarchy of shape in the tree view, children are enumerated lazily on expansion"""
+        self.tree_model.set_shape(shape)
 
     def import_step_to_active(self):
-        """Import a STEP file and display it in the viewer"""
+        """Import a STEP file in the background and display it in the viewer once loaded"""
         self.active_sub = self.mdi_area.activeSubWindow()
 
         if self.active_sub is None:
             self.console.append("⚠️ No active subwindow.")
             print ("⚠️ No active subwindow.")
             return
+
+        if self.import_thread is not None:
+            self.console.append("⚠️ An import is already running.")
+            print("⚠️ An import is already running.")
+            return
+        if self.cancelled_imports:
+            self.console.append("⚠️ A cancelled import is still finishing, try again in a moment.")
+            print("⚠️ A cancelled import is still finishing.")
+            return
         
         # Prompt for file path
         path, _ = QFileDialog.getOpenFileName(None, "Open STEP file", "", "STEP Files (*.step *.stp)")
@@ -278,12 +536,71 @@ class OCCViewer(QtWidgets.QMainWindow):
         
         # retreive file name and set document name on subwindow
         shape_name = path.split("/")[-1].split(".")[0]
+        previous_title = self.active_sub.windowTitle()
         self.active_sub.setWindowTitle(shape_name + " - Document")
 
-        # load step in pythonocc-core asTopoDS_Shape
-        shape = read_step_file(path)
+        # load step in pythonocc-core asTopoDS_Shape on a worker thread
+        thread = StepImportThread(path, self.active_sub, shape_name, previous_title, self)
+        thread.progress.connect(self.on_import_progress)
+        thread.failed.connect(self.on_import_failed)
+        thread.loaded.connect(self.on_step_loaded)
+        thread.finished.connect(self.on_import_finished)
+        self.import_thread = thread
+        thread.start()
+
+    def cancel_import(self):
+        """Cancel the running STEP import, its result is discarded"""
+        if self.import_thread is None:
+            self.console.append("⚠️ No import is running.")
+            return
+        thread = self.import_thread
+        thread.requestInterruption()
+        # the parser cannot be interrupted, keep the thread until it finishes
+        self.cancelled_imports.append(thread)
+        self.import_thread = None
+        self.restore_import_title(thread)
+        print("❌ Import cancelled.")
+        self.console.append("❌ Import cancelled.")
+
+    def on_import_progress(self, message):
+        print(message)
+        self.console.append(message)
+
+    def on_import_failed(self, message):
+        self.on_import_progress(message)
+        self.restore_import_title(self.sender())
+
+    def restore_import_title(self, thread):
+        if thread.sub in self.mdi_area.subWindowList():
+            thread.sub.setWindowTitle(thread.previous_title)
+
+    def on_import_finished(self):
+        thread = self.sender()
+        if self.import_thread is thread:
+            self.import_thread = None
+        if thread in self.cancelled_imports:
+            self.cancelled_imports.remove(thread)
+        thread.deleteLater()
+
+    def on_step_loaded(self, result):
+        """Swap the loaded shape into the sub-window the import was started from"""
+        thread = self.sender()
+        if thread.isInterruptionRequested():
+            return
+        shape, face_index, face_labels, mesh_info = result
+        sub, shape_name = thread.sub, thread.shape_name
+        if sub not in self.mdi_area.subWindowList():
+            self.console.append(f"⚠️ Document for {shape_name} was closed, import discarded.")
+            return
+
+        # a new shape replaces the one being refined in this document
+        if sub.widget() is not None:
+            self.stop_mesh_refinement(sub.widget())
+
+        self.active_sub = sub
         self.active_shape = shape
-        self.face_list = list_face(shape)  # Extract all faces from the shape
+        self.face_index = face_index
+        self.face_labels = face_labels
 
         # Populate tree
         self.populate_shape_tree(shape)
@@ -295,7 +612,12 @@ class OCCViewer(QtWidgets.QMainWindow):
         viewer.resize(self.active_sub.size().width(), self.active_sub.size().height())
         self.active_sub.setWidget(viewer)
         self.active_viewer = viewer
+        viewer.mesh_info = mesh_info
         self.active_viewer.shape = shape  # Store shape for export use
+        self.active_viewer.face_index = face_index  # Store face ids and labels per document
+        self.active_viewer.face_labels = face_labels
+        self.active_viewer.selection = FaceSelection(self.active_viewer._display.Context, face_index)
+        self.selection = self.active_viewer.selection
         # self.active_viewer.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
 
         # retrieve display, view and context
@@ -325,29 +647,99 @@ class OCCViewer(QtWidgets.QMainWindow):
         # display.register_select_callback(self.on_face_selected)
         display.register_select_callback(self._handle_selection)
 
+        # show labels read back from the STEP file
+        labeled = np.flatnonzero(face_labels >= 0)
+        if len(labeled) > 0:
+            self.highlight_labeled_faces(labeled)
+            self.console.append(f"🏷️ {len(labeled)} labeled faces restored.")
+
+        mesh_message = (f"🔺 Mesh quality '{mesh_info['tier']}' (diagonal {mesh_info['diagonal']:.1f}), "
+                        f"coarse mesh {self.mesh_summary(mesh_info)}, refining in {len(mesh_info['levels']) - 1} step(s) ...")
+        print(mesh_message)
+        self.console.append(mesh_message)
+        self.start_mesh_refinement(viewer)
+
         print(f"✅ Shape {shape_name} loaded.")
         self.console.append(f"✅ {shape_name} part loaded.")
 
     def display_shape_with_wire(self):
         display = self.active_viewer._display
 
-        ais_shaded = AIS_Shape(self.active_viewer.shape)
-        # Shaded view
+        ais_shaded = AIS_ColoredShape(self.active_viewer.shape)
+        # Shaded view, labeled faces are drawn as custom colors of this presentation
         material = Graphic3d_MaterialAspect(Graphic3d_NameOfMaterial.Graphic3d_NOM_PLASTIC)
         ais_shaded.SetMaterial(material)
         ais_shaded.SetColor(Quantity_Color(0.8, 0.8, 0.8, Quantity_TOC_RGB))  # light gray
         ais_shaded.SetDisplayMode(1)  # 1 = shaded
+        mesh_info = self.active_viewer.mesh_info
+        use_existing_mesh(ais_shaded, mesh_info['linear_def'], mesh_info['angular_def'])
         display.Context.Display(ais_shaded, True)
-        self.ais_shape[self.active_sub.windowTitle()] = ais_shaded  # Store AIS_Shape for later use
+        self.ais_shape[self.active_viewer.shape] = ais_shaded  # Store AIS_Shape for later use
 
         ais_wire = AIS_Shape(self.active_viewer.shape)
         # Wireframe overlay for edges
         ais_wire.SetDisplayMode(0)  # 0 = wireframe
         ais_wire.SetColor(Quantity_Color(0.0, 0.0, 0.0, Quantity_TOC_RGB))  # black
         ais_wire.SetWidth(2.0)  # thicker edges
+        use_existing_mesh(ais_wire, mesh_info['linear_def'], mesh_info['angular_def'])
         display.Context.Display(ais_wire, True)
+        self.active_viewer.presentations = (ais_shaded, ais_wire)
 
 
+    def mesh_summary(self, info):
+        return (f"linear {info['linear_def']:g}, angular {math.degrees(info['angular_def']):g}°: "
+                f"{info['triangles']} triangles in {info['seconds'] * 1e3:.0f} ms")
+
+    def start_mesh_refinement(self, viewer):
+        """Mesh the finer levels of the displayed shape in the background"""
+        levels = viewer.mesh_info['levels'][1:]
+        if not levels:
+            return
+        # the worker copies the shape itself, so the coarse mesh is painted without waiting for it
+        thread = MeshRefineThread(viewer.shape, levels, viewer, self)
+        thread.refined.connect(self.on_mesh_refined)
+        thread.finished.connect(self.on_mesh_refine_finished)
+        self.refine_threads.append(thread)
+        viewer.refine_thread = thread
+        thread.start()
+
+    def on_mesh_refined(self, result):
+        """Swap the refined triangulation into the presentations of its document"""
+        thread = self.sender()
+        viewer = thread.viewer
+        if thread.isInterruptionRequested() or getattr(viewer, "refine_thread", None) is not thread:
+            return
+        if viewer not in [sub.widget() for sub in self.mdi_area.subWindowList()]:
+            # document was closed
+            self.stop_mesh_refinement(viewer)
+            return
+        triangulations, level, info = result
+
+        transfer_mesh(triangulations, viewer.shape)
+        context = viewer._display.Context
+        for ais in viewer.presentations:
+            use_existing_mesh(ais, info['linear_def'], info['angular_def'])
+            context.Redisplay(ais, False)
+        context.UpdateCurrentViewer()
+        viewer.mesh_info.update(info)
+        viewer.mesh_info['level'] = level
+
+        message = f"🔺 Mesh refined {level}/{len(thread.levels)}, {self.mesh_summary(info)}."
+        print(message)
+        self.console.append(message)
+
+    def on_mesh_refine_finished(self):
+        thread = self.sender()
+        if thread in self.refine_threads:
+            self.refine_threads.remove(thread)
+        thread.deleteLater()
+
+    def stop_mesh_refinement(self, viewer):
+        thread = getattr(viewer, "refine_thread", None)
+        if thread is not None:
+            thread.requestInterruption()
+            viewer.refine_thread = None
+
     def shaded_on(self):
         """Shaded view"""
         display = self.active_viewer._display
@@ -359,120 +751,72 @@ class OCCViewer(QtWidgets.QMainWindow):
 
     def wireframe_on(self):
         """Wireframe view"""
-        ais_shape = self.ais_shape[self.active_sub.windowTitle()]
+        ais_shape = self.ais_shape[self.active_viewer.shape]
         display = self.active_viewer._display
         display.Context.Erase(ais_shape, True)
         # display.SetModeWireFrame()
         print("Wireframe mode activated.")
         self.console.append("Wireframe mode activated.")
 
-    def highlight_face(self, face):
-        """
-        Highlights a face in the OCC viewer by coloring and displaying it.
-        
-        :param viewer: qtViewer3d instance.
-        :param face: TopoDS_Face to be highlighted.
-        """
-        ais_face = AIS_Shape(face)
-        self.highlight_selected_faces[hash(face)] = ais_face
-        color = Quantity_Color(Quantity_NOC_YELLOW)  # Proper wrapper
-        self.active_viewer._display.Context.SetDisplayMode(ais_face, 1, True)
-        self.active_viewer._display.Context.SetColor(ais_face, color, False)
-        self.active_viewer._display.Context.Display(ais_face, True)
-        # self.active_viewer._display.Context.UpdateCurrentViewer()
-
     def clear_face_selection(self):
-        for ais_face in self.highlight_selected_faces.values():
-            self.active_viewer._display.Context.Erase(ais_face, True)
-            self.active_viewer._display.Context.Remove(ais_face, True)
-            # self.active_viewer._display.Context.UpdateCurrentViewer()
-        self.selected_faces.clear()
-        self.highlight_selected_faces.clear()
+        if self.selection is not None:
+            count = self.selection.clear()
+            print(f"Cleared {count} faces in {self.selection.stats()['clear']['last_ms']:.1f} ms")
         self.console.append("⚠️ Selection cleared.")
         print("⚠️ Selection cleared.")
 
     def on_face_selected(self, shapes, x=None, y=None):
-        for face in shapes:
-            if face.ShapeType() == TopAbs_FACE:
-                face_hash = hash(face)
-                if face_hash not in self.selected_faces:
-                    self.highlight_face(face)
-                    self.selected_faces[face_hash] = face
-                    if face_hash not in self.face_map:
-                        print(f"✅ Face {face_hash} selected.")
-                        self.console.append(f"✅ Face '{face_hash}' selected.")
-                    else:
-                        print(f"✅ Face {self.face_map[face_hash]} selected.")
-                        self.console.append(f"✅ Face '{self.face_map[face_hash]}' selected.")
+        for fid in self.selection.select(shapes):
+            if self.face_labels[fid] < 0:
+                print(f"✅ Face {fid} selected.")
+                self.console.append(f"✅ Face '{fid}' selected.")
+            else:
+                label = param.label_names[self.face_labels[fid]]
+                print(f"✅ Face {label} selected.")
+                self.console.append(f"✅ Face '{label}' selected.")
     
     def deselect_face(self, shapes):
         """Deselects a face in the OCC viewer by removing its highlight."""
-        for face in shapes:
-            if face.ShapeType() == TopAbs_FACE:
-                face_hash = hash(face)
-                if face_hash in self.selected_faces:
-                    self.active_viewer._display.Context.Erase(self.highlight_selected_faces[face_hash], True)
-                    self.active_viewer._display.Context.Remove(self.highlight_selected_faces[face_hash], True)
-                    # self.active_viewer._display.Context.UpdateCurrentViewer()
-                    del self.selected_faces[face_hash]
-                    del self.highlight_selected_faces[face_hash]
-                    if face_hash not in self.face_map:
-                        print(f"❌ Face {face_hash} deselected.")
-                        self.console.append(f"❌ Face {face_hash} deselected.")
-                    else:
-                        print(f"❌ Face '{self.face_map[face_hash]}' deselected.")
-                        self.console.append(f"❌ Face '{self.face_map[face_hash]}' deselected.")
+        for fid in self.selection.deselect(shapes):
+            if self.face_labels[fid] < 0:
+                print(f"❌ Face {fid} deselected.")
+                self.console.append(f"❌ Face {fid} deselected.")
+            else:
+                label = param.label_names[self.face_labels[fid]]
+                print(f"❌ Face '{label}' deselected.")
+                self.console.append(f"❌ Face '{label}' deselected.")
 
     def label_face(self):
+        if self.selection is None or len(self.selection) == 0:
+            self.console.append("⚠️ No face selected.")
+            return
         # prompt for label using a dropdown list
         # dropdown_list = ["Optical"]
-        dropdown_list = ["Hole", "Slot", "Pocket", "Passage", "Stock", "Groove", "Step", "Chamfer", "Fillet", "Wall", 'Wall + Hole']
+        dropdown_list = param.label_names
         label, ok = QInputDialog.getItem(None, "Label Face", "Select label for selected face:", dropdown_list, 0, False)
         if not ok or not label:
             return
-        for hash_face, face in self.selected_faces.items():
-            self.face_map[hash_face] = str(label)
-            self.highlight_labeled_faces(face, str(label))
+        fids = self.selection.ids()
+        self.face_labels[fids] = dropdown_list.index(label)
+        self.highlight_labeled_faces(fids)
         print("✅ Face labeled.")
         self.console.append("✅ Face labeled.")
         self.clear_face_selection()
-        # print(self.face_map)
+        # print(self.face_labels)
     
-    def highlight_labeled_faces(self,face, label):
+    def highlight_labeled_faces(self, fids):
         """
         Color the labeled faces in the viewer.
+
+        All faces are colored on the document's AIS_ColoredShape and the viewer is redrawn once.
+
+        :param fids: ids of the faces to color with their current label.
         """
-        ais_face = AIS_Shape(face)
-        self.color_labeled_faces[hash(face)] = ais_face
-
-        if label == "Hole":
-            color = Quantity_Color(1.0, 0.0, 0.0, Quantity_TOC_RGB)   # Red
-        elif label == "Slot":
-            color = Quantity_Color(0.0, 1.0, 0.0, Quantity_TOC_RGB)   # Green
-        elif label == "Pocket":
-            color = Quantity_Color(0.0, 0.0, 1.0, Quantity_TOC_RGB)   # Blue
-        elif label == "Passage":
-            color = Quantity_Color(1.0, 0.0, 1.0, Quantity_TOC_RGB)   # Magenta
-        elif label == "Stock":
-            color = Quantity_Color(0.0, 1.0, 1.0, Quantity_TOC_RGB)   # Cyan
-        elif label == "Groove":
-            color = Quantity_Color(1.0, 0.5, 0.0, Quantity_TOC_RGB)   # Orange
-        elif label == "Step":
-            color = Quantity_Color(0.6, 0.2, 0.8, Quantity_TOC_RGB)   # Purple
-        elif label == "Chamfer":
-            color = Quantity_Color(0.3, 0.7, 0.5, Quantity_TOC_RGB)   # Teal-green
-        elif label == "Fillet":
-            color = Quantity_Color(0.7, 0.3, 0.3, Quantity_TOC_RGB)   # Brownish-red
-        elif label == "Wall":
-            color = Quantity_Color(0.3, 0.3, 0.7, Quantity_TOC_RGB)   # Deep blue
-        elif label == 'Wall + Hole':
-            color = Quantity_Color(0.4, 0.6, 0.2, Quantity_TOC_RGB)   # Olive-green
-        elif label == 'Optical':
-            color = Quantity_Color(0.6, 0.4, 0.2, Quantity_TOC_RGB)   # Dark tan
-
-        self.active_viewer._display.Context.SetDisplayMode(ais_face, 1, True)
-        self.active_viewer._display.Context.SetColor(ais_face, color, False)
-        self.active_viewer._display.Context.Display(ais_face, True)
+        ais_shaded = self.ais_shape[self.active_viewer.shape]
+        for fid in fids:
+            color = LABEL_COLORS[param.label_names[self.face_labels[fid]]]
+            ais_shaded.SetCustomColor(self.face_index.face(fid), color)
+        self.active_viewer._display.Context.Redisplay(ais_shaded, True)
 
 
     def export_step_file_with_label(self):
@@ -484,8 +828,23 @@ class OCCViewer(QtWidgets.QMainWindow):
         path, _ = QFileDialog.getSaveFileName(None, "Save STEP file", "", "STEP Files (*.step *.stp)")
         if not path:
             return
-        face_map_copy = self.face_map.copy()
-        save_shape(self.active_shape, path, face_map_copy)
+        save_shape(self.active_shape, path, self.face_index, self.face_labels, param.label_names)
+
+    def export_face_graph(self):
+        """
+        Export the face adjacency graph of the shape with its labels to a .npz file.
+        """
+        if self.active_shape is None:
+            self.console.append("⚠️ No shape loaded.")
+            return
+
+        path, _ = QFileDialog.getSaveFileName(None, "Save face graph", "", "NumPy Archives (*.npz)")
+        if not path:
+            return
+        if save_face_graph(self.active_shape, path, self.face_index, self.face_labels, param.label_names):
+            self.console.append(f"💾 Face graph saved to {path}.")
+        else:
+            self.console.append(f"❌ Failed to save face graph to {path}, see the log for details.")
 
     def raytracing_on(self):
         viewer_raytracing(self.active_viewer._display)
@@ -528,20 +887,62 @@ class OCCViewer(QtWidgets.QMainWindow):
     def eventFilter(self, obj, event):
         if event.type() == QtCore.QEvent.MouseButtonPress and event.button() == QtCore.Qt.LeftButton:
             self._mouse_down_time = QtCore.QTime.currentTime()
+        if self.area_selection is not None and obj is self.active_viewer and self.selection is not None:
+            if self._area_selection_event(obj, event):
+                return True
         return super().eventFilter(obj, event)
 
+    def _area_selection_event(self, viewer, event):
+        """Track a box / lasso drag on the viewer, returns True when the event is consumed"""
+        if event.type() == QtCore.QEvent.MouseButtonPress and event.button() == QtCore.Qt.LeftButton:
+            self._area_points = [event.pos()]
+            if self._rubber_band is None or self._rubber_band.parent() is not viewer:
+                self._rubber_band = QRubberBand(QRubberBand.Rectangle, viewer)
+            self._rubber_band.setGeometry(QtCore.QRect(event.pos(), QtCore.QSize()))
+            self._rubber_band.show()
+            return True
+
+        if event.type() == QtCore.QEvent.MouseMove and self._area_points and event.buttons() & QtCore.Qt.LeftButton:
+            if self.area_selection == "box":
+                self._area_points = [self._area_points[0], event.pos()]
+            elif (event.pos() - self._area_points[-1]).manhattanLength() > 2:
+                self._area_points.append(event.pos())
+            xs = [p.x() for p in self._area_points]
+            ys = [p.y() for p in self._area_points]
+            self._rubber_band.setGeometry(QtCore.QRect(QtCore.QPoint(min(xs), min(ys)), QtCore.QPoint(max(xs), max(ys))))
+            return True
+
+        if event.type() == QtCore.QEvent.MouseButtonRelease and self._area_points and event.button() == QtCore.Qt.LeftButton:
+            self._rubber_band.hide()
+            # OCC works in device pixels
+            ratio = viewer.devicePixelRatioF()
+            points = [(p.x() * ratio, p.y() * ratio) for p in self._area_points]
+            self._area_points = []
+            if len(points) >= (2 if self.area_selection == "box" else 3):
+                self.select_area(points, deselect=bool(event.modifiers() & QtCore.Qt.ControlModifier))
+            return True
+
+        return False
+
     def reset_all(self):
         """Reset all parameters and clear the viewer"""
         self.active_shape = None
         self.active_viewer = None
         self.active_sub = None
-        self.selected_faces.clear()
-        self.highlight_selected_faces.clear()
-        self.face_map.clear()
+        self.selection = None
+        self.face_index = None
+        self.face_labels = None
+        self.populate_shape_tree(None)
         self.console.clear()
         self.console.append("🔄 All parameters reset.")
 
     def closeEvent(self, event):
+        threads = self.refine_threads + self.cancelled_imports
+        if self.import_thread is not None:
+            threads.append(self.import_thread)
+        for thread in threads:
+            thread.requestInterruption()
+            thread.wait()
         self.close()
 
 if __name__ == "__main__":
@@ -0,0 +1,218 @@
+"""
+Bounding volume hierarchy over a triangle set for numba accelerated ray casting.
+"""
+from typing import NamedTuple
+
+import numba as nb
+import numpy as np
+
+import Utils.geom_utils_numba as gun
+
+
+class BVH(NamedTuple):
+    '''
+    Flattened BVH, node 0 is the root.
+
+    Inner nodes have their children at left[i] and left[i] + 1. Leaves have left[i] == -1
+    and own triangles[start[i]:start[i] + count[i]].
+    '''
+    box_min: np.ndarray     # (K, 3) float64
+    box_max: np.ndarray     # (K, 3) float64
+    left: np.ndarray        # (K,) int32
+    start: np.ndarray       # (K,) int32
+    count: np.ndarray       # (K,) int32
+    triangles: np.ndarray   # (M, 3, 3) float64, in leaf order
+    tri_ids: np.ndarray     # (M,) int32, index of every leaf ordered triangle in the input array
+
+
+@nb.njit(cache=True)
+def _build(tri_min, tri_max, centroids, leaf_size):
+    num_tris = centroids.shape[0]
+    max_nodes = max(2 * num_tris - 1, 1)
+    box_min = np.empty((max_nodes, 3))
+    box_max = np.empty((max_nodes, 3))
+    left = np.full(max_nodes, -1, dtype=np.int32)
+    start = np.zeros(max_nodes, dtype=np.int32)
+    count = np.zeros(max_nodes, dtype=np.int32)
+    order = np.arange(num_tris).astype(np.int32)
+
+    # nodes waiting to be split: (node, first, last)
+    stack = np.empty((max_nodes, 3), dtype=np.int32)
+    stack[0, 0], stack[0, 1], stack[0, 2] = 0, 0, num_tris
+    stack_size = 1
+    num_nodes = 1
+    while stack_size > 0:
+        stack_size -= 1
+        node, first, last = stack[stack_size]
+
+        cmin = np.full(3, np.inf)
+        cmax = np.full(3, -np.inf)
+        for k in range(3):
+            box_min[node, k] = np.inf
+            box_max[node, k] = -np.inf
+        for i in range(first, last):
+            tri = order[i]
+            for k in range(3):
+                box_min[node, k] = min(box_min[node, k], tri_min[tri, k])
+                box_max[node, k] = max(box_max[node, k], tri_max[tri, k])
+                cmin[k] = min(cmin[k], centroids[tri, k])
+                cmax[k] = max(cmax[k], centroids[tri, k])
+        start[node] = first
+        count[node] = last - first
+
+        axis = np.argmax(cmax - cmin)
+        if last - first <= leaf_size or cmax[axis] - cmin[axis] <= 0.0:
+            continue
+
+        # median split along the longest centroid axis
+        members = order[first:last].copy()
+        members = members[np.argsort(centroids[members, axis])]
+        order[first:last] = members
+        mid = (first + last) // 2
+
+        left[node] = num_nodes
+        count[node] = 0
+        stack[stack_size, 0], stack[stack_size, 1], stack[stack_size, 2] = num_nodes, first, mid
+        stack[stack_size + 1, 0], stack[stack_size + 1, 1], stack[stack_size + 1, 2] = num_nodes + 1, mid, last
+        stack_size += 2
+        num_nodes += 2
+
+    return box_min[:num_nodes], box_max[:num_nodes], left[:num_nodes], start[:num_nodes], count[:num_nodes], order
+
+
+def build_bvh(triangles, leaf_size=4):
+    '''
+    input
+        triangles:  np.ndarray (M, 3, 3), vertices of every triangle
+        leaf_size:  int, maximum number of triangles in a leaf
+    output
+        bvh:        BVH
+    '''
+    triangles = np.ascontiguousarray(triangles, dtype=np.float64).reshape(-1, 3, 3)
+    if triangles.shape[0] == 0:
+        return BVH(np.full((1, 3), np.inf), np.full((1, 3), -np.inf), np.full(1, -1, dtype=np.int32),
+                   np.zeros(1, dtype=np.int32), np.zeros(1, dtype=np.int32), triangles, np.zeros(0, dtype=np.int32))
+
+    box_min, box_max, left, start, count, order = _build(triangles.min(axis=1), triangles.max(axis=1),
+                                                         triangles.mean(axis=1), leaf_size)
+    return BVH(box_min, box_max, left, start, count, np.ascontiguousarray(triangles[order]), order)
+
+
+@nb.njit(cache=True)
+def _ray_box(ox, oy, oz, ix, iy, iz, bmin, bmax, t_max):
+    '''Entry distance of the ray into the box, inf if it misses or enters beyond t_max.'''
+    t0 = (bmin[0] - ox) * ix
+    t1 = (bmax[0] - ox) * ix
+    tnear, tfar = min(t0, t1), max(t0, t1)
+    t0 = (bmin[1] - oy) * iy
+    t1 = (bmax[1] - oy) * iy
+    tnear, tfar = max(tnear, min(t0, t1)), min(tfar, max(t0, t1))
+    t0 = (bmin[2] - oz) * iz
+    t1 = (bmax[2] - oz) * iz
+    tnear, tfar = max(tnear, min(t0, t1)), min(tfar, max(t0, t1))
+    if tfar < tnear or tfar < 0.0 or tnear > t_max:
+        return np.inf
+    return tnear
+
+
+@nb.njit(cache=True)
+def _inv(d):
+    if abs(d) < 1e-300:
+        return 1e300
+    return 1.0 / d
+
+
+@nb.njit(cache=True)
+def _traverse(bvh, ray_origin, ray_direction, t_max, any_hit):
+    ox, oy, oz = ray_origin[0], ray_origin[1], ray_origin[2]
+    dx, dy, dz = ray_direction[0], ray_direction[1], ray_direction[2]
+    ix, iy, iz = _inv(dx), _inv(dy), _inv(dz)
+
+    best_t = t_max
+    best_id = -1
+    stack = np.empty(64, dtype=np.int32)
+    stack[0] = 0
+    stack_size = 1
+    while stack_size > 0:
+        stack_size -= 1
+        node = stack[stack_size]
+        if _ray_box(ox, oy, oz, ix, iy, iz, bvh.box_min[node], bvh.box_max[node], best_t) == np.inf:
+            continue
+
+        child = bvh.left[node]
+        if child < 0:
+            for i in range(bvh.start[node], bvh.start[node] + bvh.count[node]):
+                t = gun.ray_triangle_intersect_xyz(ox, oy, oz, dx, dy, dz, bvh.triangles[i])
+                if 0 < t < best_t:
+                    best_t = t
+                    best_id = bvh.tri_ids[i]
+                    if any_hit:
+                        return best_t, best_id
+            continue
+
+        # visit the nearer child first so best_t shrinks early
+        near_left = _ray_box(ox, oy, oz, ix, iy, iz, bvh.box_min[child], bvh.box_max[child], best_t)
+        near_right = _ray_box(ox, oy, oz, ix, iy, iz, bvh.box_min[child + 1], bvh.box_max[child + 1], best_t)
+        if near_left <= near_right:
+            stack[stack_size] = child + 1
+            stack[stack_size + 1] = child
+        else:
+            stack[stack_size] = child
+            stack[stack_size + 1] = child + 1
+        stack_size += 2
+
+    if best_id < 0:
+        return -np.inf, -1
+    return best_t, best_id
+
+
+@nb.njit(cache=True)
+def bvh_closest_hit(bvh, ray_origin, ray_direction):
+    '''
+    Nearest triangle hit in front of the ray origin.
+
+    input
+        bvh:            BVH
+        ray_origin:     np.ndarray (3,)
+        ray_direction:  np.ndarray (3,)
+    output
+        t:              float, ray parameter of the hit, -inf if nothing is hit
+                        (the value of geom_utils_numba.ray_triangle_set_intersect)
+        tri_id:         int, index of the hit triangle in the array given to build_bvh, -1 if nothing is hit
+    '''
+    return _traverse(bvh, ray_origin, ray_direction, np.inf, False)
+
+
+@nb.njit(cache=True)
+def bvh_any_hit(bvh, ray_origin, ray_direction, t_max=np.inf):
+    '''
+    input
+        bvh:            BVH
+        ray_origin:     np.ndarray (3,)
+        ray_direction:  np.ndarray (3,)
+        t_max:          float, only hits with 0 < t < t_max count
+    output
+        hit:            bool, the ray hits any triangle before t_max
+    '''
+    return _traverse(bvh, ray_origin, ray_direction, t_max, True)[1] >= 0
+
+
+@nb.njit(parallel=True, cache=True)
+def bvh_closest_hits(bvh, ray_origins, ray_directions):
+    '''
+    bvh_closest_hit for a batch of rays, parallel over the rays.
+
+    input
+        bvh:            BVH
+        ray_origins:    np.ndarray (R, 3)
+        ray_directions: np.ndarray (R, 3)
+    output
+        ts:             np.ndarray (R,) float64, -inf for rays that hit nothing
+        tri_ids:        np.ndarray (R,) int64, -1 for rays that hit nothing
+    '''
+    num_rays = ray_origins.shape[0]
+    ts = np.empty(num_rays)
+    tri_ids = np.empty(num_rays, dtype=np.int64)
+    for r in nb.prange(num_rays):
+        ts[r], tri_ids[r] = _traverse(bvh, ray_origins[r], ray_directions[r], np.inf, False)
+    return ts, tri_ids
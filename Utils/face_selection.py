@@ -0,0 +1,256 @@
+"""
+Face selection of a viewer document with batched viewer updates.
+"""
+import time
+import numpy as np
+
+from OCC.Core.AIS import AIS_Shape, AIS_SelectionScheme_Replace
+from OCC.Core.TopAbs import TopAbs_FACE
+from OCC.Core.Quantity import Quantity_Color, Quantity_NOC_YELLOW
+from OCC.Core.Graphic3d import Graphic3d_Vec2i
+from OCC.Core.TColgp import TColgp_Array1OfPnt2d
+from OCC.Core.gp import gp_Pnt2d
+
+# corner indices into a [xmin, ymin, zmin, xmax, ymax, zmax] box
+BOX_CORNERS = np.array([[0, 1, 2], [3, 1, 2], [0, 4, 2], [3, 4, 2],
+                        [0, 1, 5], [3, 1, 5], [0, 4, 5], [3, 4, 5]])
+
+
+def _mat4(mat):
+    return np.array([[mat.GetValue(row, col) for col in range(4)] for row in range(4)])
+
+
+def project_points(view, pts):
+    '''
+    Project 3d points to window pixels with the camera of view.
+
+    input
+        view:   V3d_View
+        pts:    np.ndarray (..., 3)
+    output
+        xy:     np.ndarray (..., 2) in window pixels, y pointing down
+        behind: np.ndarray (...) bool, the point is behind the camera and xy is meaningless
+    '''
+    camera = view.Camera()
+    mvp = _mat4(camera.ProjectionMatrix()) @ _mat4(camera.OrientationMatrix())
+    width, height = view.Window().Size()
+
+    clip = pts @ mvp[:, :3].T + mvp[:, 3]   # (..., 4)
+    w = clip[..., 3]
+    behind = w <= 1e-12
+    w = np.where(behind, 1.0, w)
+    x = (clip[..., 0] / w + 1.0) * 0.5 * width
+    y = (1.0 - clip[..., 1] / w) * 0.5 * height
+    return np.stack([x, y], axis=-1), behind
+
+
+def project_boxes(view, boxes):
+    '''
+    Project 3d boxes to window pixel rectangles with the camera of view.
+
+    input
+        view:   V3d_View
+        boxes:  np.ndarray (F, 6) of [xmin, ymin, zmin, xmax, ymax, zmax]
+    output
+        rects:  np.ndarray (F, 4) of [xmin, ymin, xmax, ymax] in window pixels, y pointing down.
+                Boxes reaching behind the camera cover the whole plane, void (NaN) boxes stay NaN.
+    '''
+    xy, behind = project_points(view, boxes[:, BOX_CORNERS])   # (F, 8, 2), (F, 8)
+    rects = np.concatenate([xy.min(axis=1), xy.max(axis=1)], axis=1)
+    rects[np.any(behind, axis=1)] = [-np.inf, -np.inf, np.inf, np.inf]
+    return rects
+
+
+class FaceSelection:
+    '''
+    Selected faces of one document and their highlight presentations.
+
+    Every operation queues its context changes with viewer updates disabled and
+    redraws once with UpdateCurrentViewer(). Timing counters per operation are kept
+    in self.timings and summarized by stats(), so latency can be tracked against
+    the number of faces touched.
+    '''
+    def __init__(self, context, face_index, color=None):
+        '''
+        input
+            context:    AIS_InteractiveContext of the document viewer
+            face_index: FaceIndex of the displayed shape
+            color:      Quantity_Color of the highlights, yellow by default
+        '''
+        self.context = context
+        self.face_index = face_index
+        self.color = color if color is not None else Quantity_Color(Quantity_NOC_YELLOW)
+        self.faces = {} # {face id: TopoDS_Face}
+        self.highlights = {} # {face id: AIS_Shape}
+        self.timings = {} # {operation: {'calls', 'faces', 'total', 'last', 'last_faces'}}, times in seconds
+
+    def __len__(self):
+        return len(self.faces)
+
+    def __contains__(self, fid):
+        return fid in self.faces
+
+    def ids(self):
+        return list(self.faces.keys())
+
+    def select(self, shapes):
+        '''
+        Highlight the faces among shapes that are not selected yet.
+
+        input
+            shapes: [TopoDS_Shape]
+        output
+            fids:   [int], ids of the newly selected faces
+        '''
+        start = time.perf_counter()
+        fids = []
+        for face in shapes:
+            if face.ShapeType() != TopAbs_FACE:
+                continue
+            fid = self.face_index.index(face)
+            if fid < 0 or fid in self.faces:
+                continue
+            ais_face = AIS_Shape(face)
+            self.context.SetDisplayMode(ais_face, 1, False)
+            self.context.SetColor(ais_face, self.color, False)
+            self.context.Display(ais_face, False)
+            self.faces[fid] = face
+            self.highlights[fid] = ais_face
+            fids.append(fid)
+
+        if fids:
+            self.context.UpdateCurrentViewer()
+        self._record('select', start, len(fids))
+        return fids
+
+    def deselect(self, shapes):
+        '''
+        Remove the highlight of the selected faces among shapes.
+
+        input
+            shapes: [TopoDS_Shape]
+        output
+            fids:   [int], ids of the deselected faces
+        '''
+        start = time.perf_counter()
+        fids = []
+        for face in shapes:
+            if face.ShapeType() != TopAbs_FACE:
+                continue
+            fid = self.face_index.index(face)
+            if fid not in self.faces:
+                continue
+            self.context.Remove(self.highlights.pop(fid), False)
+            del self.faces[fid]
+            fids.append(fid)
+
+        if fids:
+            self.context.UpdateCurrentViewer()
+        self._record('deselect', start, len(fids))
+        return fids
+
+    def faces_in_area(self, view, points, lasso=False):
+        '''
+        Faces inside a rectangle or lasso drawn on the view.
+
+        Candidates are found by projecting the precomputed face boxes of the FaceIndex
+        to the window: faces whose box misses the area are dropped, faces with a void box
+        are kept. When no face is a candidate the context is not picked at all, otherwise
+        the candidates are confirmed with the area selection of the context, which tests
+        the exact sensitive triangles of the faces. Only the selection mode active on the
+        context (face mode) yields faces.
+
+        input
+            view:   V3d_View
+            points: [(x, y)], window pixels, two rectangle corners or the lasso polygon
+            lasso:  bool, treat points as a polygon instead of a rectangle
+        output
+            faces:  [TopoDS_Face]
+        '''
+        start = time.perf_counter()
+        pnts = np.asarray(points, dtype=np.float64)
+        xmin, ymin = pnts.min(axis=0)
+        xmax, ymax = pnts.max(axis=0)
+        faces = []
+        if xmax - xmin < 1 or ymax - ymin < 1:
+            self._record('area', start, 0)
+            return faces
+
+        rects = project_boxes(view, self.face_index.boxes())
+        void = np.isnan(rects).any(axis=1)
+        overlap = (rects[:, 0] <= xmax) & (rects[:, 2] >= xmin) & (rects[:, 1] <= ymax) & (rects[:, 3] >= ymin)
+        candidates = overlap | void
+        if not candidates.any():
+            self._record('area', start, 0)
+            return faces
+
+        if lasso:
+            polygon = TColgp_Array1OfPnt2d(1, len(pnts))
+            for i, (x, y) in enumerate(pnts):
+                polygon.SetValue(i + 1, gp_Pnt2d(x, y))
+            self.context.SelectPolygon(polygon, view, AIS_SelectionScheme_Replace)
+        else:
+            self.context.SelectRectangle(Graphic3d_Vec2i(int(xmin), int(ymin)), Graphic3d_Vec2i(int(xmax), int(ymax)),
+                                         view, AIS_SelectionScheme_Replace)
+
+        self.context.InitSelected()
+        while self.context.MoreSelected():
+            if self.context.HasSelectedShape():
+                shape = self.context.SelectedShape()
+                if shape.ShapeType() == TopAbs_FACE:
+                    fid = self.face_index.index(shape)
+                    if fid >= 0 and candidates[fid]:
+                        faces.append(shape)
+            self.context.NextSelected()
+        # the picked faces are highlighted by select(), not by the context
+        self.context.ClearSelected(False)
+
+        self._record('area', start, len(faces))
+        return faces
+
+    def clear(self):
+        '''
+        Remove all highlights with a single viewer update.
+
+        output
+            count: int, number of faces that were selected
+        '''
+        start = time.perf_counter()
+        count = len(self.faces)
+        for ais_face in self.highlights.values():
+            self.context.Remove(ais_face, False)
+        self.faces.clear()
+        self.highlights.clear()
+
+        if count > 0:
+            self.context.UpdateCurrentViewer()
+        self._record('clear', start, count)
+        return count
+
+    def _record(self, operation, start, num_faces):
+        elapsed = time.perf_counter() - start
+        timing = self.timings.setdefault(operation, {'calls': 0, 'faces': 0, 'total': 0.0,
+                                                     'last': 0.0, 'last_faces': 0})
+        timing['calls'] += 1
+        timing['faces'] += num_faces
+        timing['total'] += elapsed
+        timing['last'] = elapsed
+        timing['last_faces'] = num_faces
+
+    def stats(self):
+        '''
+        output
+            stats: {operation: {'calls': int, 'faces': int, 'total_ms': float, 'last_ms': float,
+                                'last_faces': int, 'us_per_face': float}}
+        '''
+        stats = {}
+        for operation, timing in self.timings.items():
+            stats[operation] = {
+                'calls': timing['calls'],
+                'faces': timing['faces'],
+                'total_ms': timing['total'] * 1e3,
+                'last_ms': timing['last'] * 1e3,
+                'last_faces': timing['last_faces'],
+                'us_per_face': timing['total'] * 1e6 / max(timing['faces'], 1),
+            }
+        return stats
@@ -0,0 +1,241 @@
+"""
+Bulk generation of labeled drain parts (shape_factory.shape_drain) on a process pool.
+
+    python -m Utils.generate_dataset out_dir --count 100000 [--seed 0] [--processes 8]
+
+Sample i is generated with seed + i, so a dataset is reproducible and does not depend
+on which worker made which sample. Samples are produced in batches of batch_size:
+every sample writes out_dir/step/<i>.step with its face ids as STEP face names and its
+labels to out_dir/samples/<i>.json, and a finished batch collects the labels of all its
+samples, failed ones included, into out_dir/labels/batch_<b>.json and removes the per
+sample files. A restarted run skips only the samples whose STEP file and labels (in either
+file) are both on disk, failed and missing samples are generated again.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import time
+
+from OCC.Core.STEPControl import STEPControl_Writer, STEPControl_AsIs
+from OCC.Core.STEPConstruct import stepconstruct
+from OCC.Core.TCollection import TCollection_HAsciiString
+from OCC.Core.TopLoc import TopLoc_Location
+
+import Utils.numba_warmup as numba_warmup
+import Utils.shape_factory as shape_factory
+from Utils.performance_settings import PERFORMANCE_SETTINGS
+from Utils.shape_index import FaceIndex
+
+_worker_out_dir = None
+_worker_batch = False
+
+
+def step_path(out_dir, index):
+    return os.path.join(out_dir, 'step', f'{index:07d}.step')
+
+
+def label_path(out_dir, batch):
+    return os.path.join(out_dir, 'labels', f'batch_{batch:05d}.json')
+
+
+def sample_path(out_dir, index):
+    return os.path.join(out_dir, 'samples', f'{index:07d}.json')
+
+
+def drain_labels(face_index, name_map):
+    '''
+    Label lists of a shape_drain result in face id order.
+
+    input
+        face_index: FaceIndex of the drain shape
+        name_map:   {TopoDS_Face: int}, or (seg_map, ins_label, bottom_map) once a feature is made,
+                    as returned by shape_factory.shape_drain
+    output
+        labels:     {'seg': [int], 'inst': [[int]], 'bottom': [int]}
+    '''
+    if isinstance(name_map, tuple):
+        seg_map, ins_label, bottom_map = name_map
+    else:
+        seg_map, ins_label, bottom_map = name_map, [], {}
+
+    seg = [seg_map.get(face, shape_factory.LABEL_INDEX['other']) for face in face_index.faces()]
+    bottom = [bottom_map.get(face, 0) for face in face_index.faces()]
+    inst = []
+    for faces in ins_label:
+        fids = [face_index.index(face) for face in faces]
+        inst.append([fid for fid in fids if fid >= 0])
+    return {'seg': seg, 'inst': inst, 'bottom': bottom}
+
+
+def write_step(filename, shape, face_index):
+    '''
+    Write shape to a STEP file with the face id of every face as its entity name.
+    '''
+    writer = STEPControl_Writer()
+    writer.Transfer(shape, STEPControl_AsIs)
+
+    finderp = writer.WS().TransferWriter().FinderProcess()
+    loc = TopLoc_Location()
+    for fid in range(len(face_index)):
+        item = stepconstruct.FindEntity(finderp, face_index.face(fid), loc)
+        if item is None:
+            print(f"Warning: No step entities found for face {fid}")
+            continue
+        item.SetName(TCollection_HAsciiString(str(fid)))
+
+    writer.Write(filename)
+
+
+def _init_worker(out_dir, batch):
+    global _worker_out_dir, _worker_batch
+    _worker_out_dir = out_dir
+    _worker_batch = batch
+    # no per worker random state, shape_drain seeds random with the seed of each sample
+    # load the compiled kernels once per worker instead of stalling on a first call
+    numba_warmup.warmup()
+
+
+def _generate(task):
+    '''
+    input
+        task:   (index, seed)
+    output
+        sample: {'index', 'seed', 'name', 'seg', 'inst', 'bottom', 'seconds'}, or
+                {'index', 'seed', 'error'} if the sample failed
+    '''
+    index, seed = task
+    start = time.perf_counter()
+    try:
+        shape, name_map, _, shape_name = shape_factory.shape_drain(seed, _worker_batch)
+        face_index = FaceIndex(shape)
+        sample = {'index': index, 'seed': seed, 'name': shape_name}
+        sample.update(drain_labels(face_index, name_map))
+        write_step(step_path(_worker_out_dir, index), shape, face_index)
+        sample['seconds'] = time.perf_counter() - start
+        # written after the STEP file, so a sample with labels on disk is complete
+        _write_json(sample_path(_worker_out_dir, index), sample)
+    except Exception as e:
+        return {'index': index, 'seed': seed, 'error': str(e)}
+    return sample
+
+
+def _load_json(filename):
+    try:
+        with open(filename) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _finished_samples(out_dir, indices, batch):
+    '''
+    Samples of a batch that need no new run.
+
+    input
+        out_dir:    str
+        indices:    range, sample indices of the batch
+        batch:      int
+    output
+        done:       {index: sample}, samples without error that have their STEP file and labels
+                    in the batch label file or in their own sample file
+    '''
+    labels = _load_json(label_path(out_dir, batch))
+    done = {s['index']: s for s in (labels['samples'] if labels else []) if 'error' not in s}
+    for index in indices:
+        if index not in done:
+            sample = _load_json(sample_path(out_dir, index))
+            if sample is not None:
+                done[index] = sample
+    return {i: s for i, s in done.items() if os.path.exists(step_path(out_dir, i))}
+
+
+def _write_json(filename, data):
+    # write then rename, so an interrupted run never leaves a partial checkpoint
+    tmp = filename + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp, filename)
+
+
+def generate_dataset(out_dir, count, seed=0, batch_size=None, num_processes=None, chunk_size=None, batch_feats=False):
+    '''
+    Generate samples 0 .. count-1 into out_dir, resuming from the batches and samples already written.
+
+    input
+        out_dir:        str
+        count:          int, number of samples of the whole dataset
+        seed:           int, sample i is generated with seed + i
+        batch_size:     int, samples per label file, PERFORMANCE_SETTINGS['batch_processing']['batch_size'] by default
+        num_processes:  int, PERFORMANCE_SETTINGS['batch_processing']['num_processes'] by default
+        chunk_size:     int, samples per pool task, PERFORMANCE_SETTINGS['batch_processing']['chunk_size'] by default
+        batch_feats:    bool, add the features of a sample with one boolean operation, see shape_drain
+    output
+        report:         {'generated', 'failed', 'skipped_batches', 'skipped_samples', 'seconds', 'shapes_per_second'},
+                        skipped_batches counts the batches without a sample to generate
+    '''
+    settings = PERFORMANCE_SETTINGS['batch_processing']
+    batch_size = batch_size or settings['batch_size']
+    num_processes = num_processes or settings['num_processes']
+    chunk_size = chunk_size or settings['chunk_size']
+
+    os.makedirs(os.path.join(out_dir, 'step'), exist_ok=True)
+    os.makedirs(os.path.join(out_dir, 'labels'), exist_ok=True)
+    os.makedirs(os.path.join(out_dir, 'samples'), exist_ok=True)
+    _write_json(os.path.join(out_dir, 'dataset.json'),
+                {'count': count, 'seed': seed, 'batch_size': batch_size, 'batch_feats': batch_feats,
+                 'label_names': sorted(shape_factory.LABEL_INDEX, key=shape_factory.LABEL_INDEX.get)})
+
+    num_batches = (count + batch_size - 1) // batch_size
+    generated = failed = skipped = skipped_batches = 0
+    start = time.perf_counter()
+    with multiprocessing.Pool(num_processes, _init_worker, (out_dir, batch_feats)) as pool:
+        for batch in range(num_batches):
+            first = batch * batch_size
+            indices = range(first, min(first + batch_size, count))
+            done = _finished_samples(out_dir, indices, batch)
+            tasks = [(i, seed + i) for i in indices if i not in done]
+            skipped += len(done)
+            if not tasks and os.path.exists(label_path(out_dir, batch)):
+                skipped_batches += 1
+                continue
+
+            chunk = max(1, min(chunk_size, len(tasks) // (num_processes * 4)))
+            samples = sorted(list(done.values()) + list(pool.imap_unordered(_generate, tasks, chunk)),
+                             key=lambda s: s['index'])
+
+            errors = [s for s in samples if 'error' in s]
+            _write_json(label_path(out_dir, batch), {'batch': batch, 'samples': samples})
+            for s in samples:
+                if os.path.exists(sample_path(out_dir, s['index'])):
+                    os.remove(sample_path(out_dir, s['index']))
+
+            generated += len(tasks) - len(errors)
+            failed += len(errors)
+            elapsed = time.perf_counter() - start
+            print(f"batch {batch + 1}/{num_batches}: {len(tasks) - len(errors)} shapes, {len(errors)} failed, "
+                  f"{len(done)} resumed, {generated / elapsed:.2f} shapes/s overall")
+
+    seconds = time.perf_counter() - start
+    if skipped_batches:
+        print(f"Resumed: {skipped_batches} of {num_batches} batches were already complete")
+    report = {'generated': generated, 'failed': failed, 'skipped_batches': skipped_batches,
+              'skipped_samples': skipped,
+              'seconds': seconds, 'shapes_per_second': generated / seconds if seconds > 0 else 0.0}
+    print(f"Generated {generated} shapes ({failed} failed) in {seconds:.1f} s, "
+          f"{report['shapes_per_second']:.2f} shapes/s")
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('out_dir')
+    parser.add_argument('--count', type=int, required=True)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--batch-size', type=int)
+    parser.add_argument('--processes', type=int)
+    parser.add_argument('--chunk-size', type=int)
+    parser.add_argument('--batch-feats', action='store_true', help='one boolean operation for all features of a sample')
+    args = parser.parse_args()
+    generate_dataset(args.out_dir, args.count, args.seed, args.batch_size, args.processes, args.chunk_size,
+                     args.batch_feats)
@@ -106,12 +106,51 @@ def point_in_polygon_set(the_pnt, polygons):
 
     
 def points_in_polygon(bnd_pnts, verts, closed=True, normal=None):
-    idx = np.array([point_in_polygon(pnt, verts, closed, normal) for pnt in bnd_pnts])
-    in_pnts = bnd_pnts[idx]
+    in_pnts = bnd_pnts[points_in_polygon_mask(bnd_pnts, verts, closed, normal)]
     
     return in_pnts
 
 
+def points_in_polygon_mask(bnd_pnts, verts, closed=True, normal=None, chunk_size=65536):
+    '''
+    point_in_polygon for a whole point cloud, as P points x E edges half-plane tests.
+    input:
+        bnd_pnts: np.ndarray (P, 3)
+        verts: np.ndarray (V, 3), convex polygon
+        closed: bool, the last vertex connects back to the first one
+        normal: [float, float, float], required for V == 2
+        chunk_size: int, points tested per block, bounds the (block, E) distance matrix
+    output:
+        mask: np.ndarray (P,) bool
+    '''
+    bnd_pnts = np.asarray(bnd_pnts, dtype=np.float64).reshape(-1, 3)
+    verts = np.asarray(verts, dtype=np.float64)
+    num_v = len(verts)
+    assert num_v > 1
+
+    if num_v == 2:
+        assert normal is not None
+
+    if num_v > 2:
+        normal = np.cross(verts[1] - verts[0], verts[2] - verts[1])
+
+    if closed:
+        verts = np.append(verts, [verts[0]], axis=0)
+
+    # inward unit normal and offset of every edge line
+    perp_dirs = np.cross(normal, verts[1:] - verts[:-1])
+    with np.errstate(invalid='ignore', divide='ignore'):
+        perp_dirs = perp_dirs / np.linalg.norm(perp_dirs, axis=1, keepdims=True)
+    offsets = np.einsum('ij,ij->i', verts[:-1], perp_dirs)
+
+    mask = np.empty(len(bnd_pnts), dtype=bool)
+    for start in range(0, len(bnd_pnts), chunk_size):
+        dists = bnd_pnts[start:start + chunk_size] @ perp_dirs.T - offsets
+        # NaN distances (degenerate edges) do not exclude a point, as in point_in_polygon
+        mask[start:start + chunk_size] = ~np.any(dists <= 0.000001, axis=1)
+    return mask
+
+
 def dist_pnt_line(pnt, pnt1, pnt2, normal):
     line_dir = pnt2 - pnt1
     pnt_dir = pnt - pnt1
@@ -280,3 +319,134 @@ def outer_radius_triangle(pt1, pt2, pt3):
     c = np.linalg.norm(np.array(pt3) - np.array(pt1))
     p = (a + b + c) / 2
     return a * b * c / (4 * np.sqrt(p * (p - a) * (p - b) * (p - c)))
+
+
+def point_segment_distances(pnt, segments):
+    '''
+    input
+        pnt:        np.ndarray (3,)
+        segments:   np.ndarray (S, 2, 3)
+    output
+        dists:      np.ndarray (S,)
+    '''
+    starts = segments[:, 0]
+    dirs = segments[:, 1] - starts
+    lengths = np.einsum('ij,ij->i', dirs, dirs)
+    t = np.einsum('ij,ij->i', pnt - starts, dirs) / np.where(lengths > 0, lengths, 1.0)
+    t = np.clip(t, 0.0, 1.0)
+    return np.linalg.norm(starts + t[:, None] * dirs - pnt, axis=1)
+
+
+class SegmentGrid:
+    '''
+    Nearest-segment queries over a fixed set of labelled 3d segments.
+
+    The segments are split to at most one grid cell in length and bucketed in a
+    uniform grid. A query visits the grid in rings of cells around the point until
+    no unseen segment can be closer than the best one plus slack.
+    '''
+    def __init__(self, segments, labels, slack=0.0, resolution=64):
+        '''
+        input
+            segments:   np.ndarray (S, 2, 3)
+            labels:     np.ndarray (S,) int, label of every segment, e.g. the edge it approximates
+            slack:      float, candidates keeps every label within slack of the nearest segment
+            resolution: int, grid cells along the longest side of the bounding box
+        '''
+        segments = np.asarray(segments, dtype=np.float64).reshape(-1, 2, 3)
+        labels = np.asarray(labels)
+        self.slack = slack
+        pnts = segments.reshape(-1, 3)
+        self.origin = pnts.min(axis=0) if len(pnts) else np.zeros(3)
+        extent = (pnts.max(axis=0) - self.origin) if len(pnts) else np.zeros(3)
+        self.cell_size = max(extent.max() / resolution, 1e-9)
+        self.dims = np.floor(extent / self.cell_size).astype(np.int64) + 1
+
+        # split segments longer than a cell, so each one touches at most 2 cells per axis
+        lengths = np.linalg.norm(segments[:, 1] - segments[:, 0], axis=1)
+        pieces = np.maximum(np.ceil(lengths / self.cell_size), 1).astype(np.int64)
+        seg_ids = np.repeat(np.arange(len(segments)), pieces)
+        piece = np.arange(len(seg_ids)) - np.repeat(np.cumsum(pieces) - pieces, pieces)
+        t0 = (piece / pieces[seg_ids])[:, None]
+        t1 = ((piece + 1) / pieces[seg_ids])[:, None]
+        seg_dirs = segments[:, 1] - segments[:, 0]
+        self.segments = np.stack([segments[seg_ids, 0] + t0 * seg_dirs[seg_ids],
+                                  segments[seg_ids, 0] + t1 * seg_dirs[seg_ids]], axis=1)
+        self.labels = labels[seg_ids]
+
+        # insert every segment in the cells its box overlaps
+        lo = self._cell(self.segments.min(axis=1))
+        hi = self._cell(self.segments.max(axis=1))
+        span = hi - lo + 1
+        counts = span.prod(axis=1)
+        ids = np.repeat(np.arange(len(self.segments)), counts)
+        local = np.arange(len(ids)) - np.repeat(np.cumsum(counts) - counts, counts)
+        cells = lo[ids] + np.stack([local % span[ids, 0],
+                                    (local // span[ids, 0]) % span[ids, 1],
+                                    local // (span[ids, 0] * span[ids, 1])], axis=1)
+        keys = self._key(cells)
+        order = np.argsort(keys, kind='stable')
+        self.cell_keys, starts = np.unique(keys[order], return_index=True)
+        self.cell_starts = np.append(starts, len(keys))
+        self.cell_segments = ids[order]
+
+    def _cell(self, pnts):
+        return np.clip(np.floor((pnts - self.origin) / self.cell_size).astype(np.int64), 0, self.dims - 1)
+
+    def _key(self, cells):
+        return (cells[:, 2] * self.dims[1] + cells[:, 1]) * self.dims[0] + cells[:, 0]
+
+    def _ring(self, center, ring):
+        '''cells at Chebyshev distance ring from center, clipped to the grid'''
+        lo = np.maximum(center - ring, 0)
+        hi = np.minimum(center + ring, self.dims - 1)
+        axes = [np.arange(lo[k], hi[k] + 1) for k in range(3)]
+        cells = np.stack(np.meshgrid(*axes, indexing='ij'), axis=-1).reshape(-1, 3)
+        return cells[np.abs(cells - center).max(axis=1) == ring]
+
+    def _segments_in(self, cells):
+        keys = self._key(cells)
+        pos = np.searchsorted(self.cell_keys, keys)
+        valid = pos < len(self.cell_keys)
+        pos, keys = pos[valid], keys[valid]
+        pos = pos[self.cell_keys[pos] == keys]
+        if len(pos) == 0:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate([self.cell_segments[self.cell_starts[p]:self.cell_starts[p + 1]] for p in pos])
+
+    def candidates(self, pnt):
+        '''
+        input
+            pnt:    [float, float, float]
+        output
+            dists:  {label: float}, distance to the nearest segment of every label within
+                    slack of the nearest segment overall
+        '''
+        pnt = np.asarray(pnt, dtype=np.float64)
+        if len(self.segments) == 0:
+            return {}
+        # cells are clipped to the grid, so a point outside it starts from the nearest cell
+        center = self._cell(pnt)
+        outside = np.linalg.norm(pnt - np.clip(pnt, self.origin, self.origin + self.dims * self.cell_size))
+        max_ring = int(self.dims.max())
+
+        best = np.inf
+        seen = np.zeros(len(self.segments), dtype=bool)
+        label_dists = {}
+        for ring in range(max_ring + 1):
+            # segments in rings beyond this one are at least this far from pnt
+            if max(outside, (ring - 1) * self.cell_size) > best + self.slack:
+                break
+            seg_ids = self._segments_in(self._ring(center, ring))
+            seg_ids = seg_ids[~seen[seg_ids]]
+            if len(seg_ids) == 0:
+                continue
+            seen[seg_ids] = True
+            dists = point_segment_distances(pnt, self.segments[seg_ids])
+            best = min(best, dists.min())
+            for label, dist in zip(self.labels[seg_ids], dists):
+                if dist < label_dists.get(label, np.inf):
+                    label_dists[label] = dist
+
+        return {label: dist for label, dist in label_dists.items() if dist <= best + self.slack}
+
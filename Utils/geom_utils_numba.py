@@ -4,51 +4,57 @@ import numba as nb
 import Utils.numba_vec as nbv
 
 
-@nb.njit(fastmath=True)
+@nb.njit(fastmath=True, cache=True)
 def search_rect_inside_bound_1(verts, vec1, vec2, bnd_pnts):
     in_pnts = points_in_polygon(bnd_pnts, verts)
     if in_pnts.shape[0] == 0:
         return verts
 
     # find perpendicular unit vector of normal and line
-    normal = nbv.cross(vec2, verts[1] - verts[2])
-    line_dir = nbv.sub(verts[1], verts[2])
-    perp_dir = nbv.cross(normal, line_dir)
-    perp_dir = nbv.div(nbv.calc_l2_norm(perp_dir), perp_dir)
+    normal = nbv.cross_t(vec2, nbv.sub_t(verts[2], verts[1]))
+    line_dir = nbv.sub_t(verts[1], verts[2])
+    perp_dir = nbv.cross_t(normal, line_dir)
+    perp_dir = nbv.div_t(nbv.norm(perp_dir), perp_dir)
 
     # Projecting vec1 onto unit_perp_dir
     norm1 = nbv.dot(vec1, perp_dir)
     norm2 = nbv.dot(vec2, perp_dir)
-    dist = min([np.dot(pnt - verts[1], perp_dir) for pnt in in_pnts] + [norm1, norm2])
-    vec1 = nbv.div(norm1, nbv.mul(dist, vec1))
-    vec2 = nbv.div(norm2, nbv.mul(dist, vec2))
+    dist = min(norm1, norm2)
+    for pnt in in_pnts:
+        dist = min(dist, nbv.dot(nbv.sub_t(verts[1], pnt), perp_dir))
+    vec1 = nbv.div_t(norm1, nbv.mul_t(dist, vec1))
+    vec2 = nbv.div_t(norm2, nbv.mul_t(dist, vec2))
 
-    verts[0] = nbv.add(verts[1], vec1)
-    verts[3] = nbv.add(verts[2], vec2)
+    verts[0] = nbv.add_t(verts[1], vec1)
+    verts[3] = nbv.add_t(verts[2], vec2)
 
     return verts
 
 
-@nb.njit(fastmath=True)
+@nb.njit(fastmath=True, cache=True)
 def search_rect_inside_bound_2(verts, vec0, vec2, bnd_pnts):
     in_pnts = points_in_polygon(bnd_pnts, verts)
 
     if in_pnts.shape[0] == 0:
         return verts
 
-    vec0_len = nbv.calc_l2_norm(vec0)
-    vec0 = nbv.div(vec0_len, vec0)
-    vec2_len = nbv.calc_l2_norm(vec2)
-    vec2 = nbv.div(vec2_len, vec2)
-    len2 = min([nbv.dot(pnt - verts[1], vec2) for pnt in in_pnts] + [vec2_len])
-    len0 = min([nbv.dot(pnt - verts[1], vec0) for pnt in in_pnts] + [vec0_len])
+    vec0_len = nbv.norm(vec0)
+    vec0 = nbv.div_t(vec0_len, vec0)
+    vec2_len = nbv.norm(vec2)
+    vec2 = nbv.div_t(vec2_len, vec2)
+    len2 = vec2_len
+    len0 = vec0_len
+    for pnt in in_pnts:
+        pnt_dir = nbv.sub_t(verts[1], pnt)
+        len2 = min(len2, nbv.dot(pnt_dir, vec2))
+        len0 = min(len0, nbv.dot(pnt_dir, vec0))
 
-    vec0 = nbv.mul(len0, vec0)
-    vec2 = nbv.mul(len2, vec2)
+    vec0 = nbv.mul_t(len0, vec0)
+    vec2 = nbv.mul_t(len2, vec2)
 
-    verts[0] = nbv.add(vec0, verts[1])
-    verts[2] = nbv.add(vec2, verts[1])
-    verts[3] = nbv.add(nbv.add(vec0, vec2), verts[1])
+    verts[0] = nbv.add_t(vec0, verts[1])
+    verts[2] = nbv.add_t(vec2, verts[1])
+    verts[3] = nbv.add_t(nbv.add_t(vec0, vec2), verts[1])
 
     for vert in verts:
         assert not math.isnan(vert[0]), 'vert[0] is not a number'
@@ -59,35 +65,37 @@ def search_rect_inside_bound_2(verts, vec0, vec2, bnd_pnts):
 
 
 
-@nb.njit(fastmath=True)
+@nb.njit(fastmath=True, cache=True)
 def search_rect_inside_bound_3(verts, bnd_pnts):
-    vec1 = nbv.sub(verts[1], verts[0])
-    vec2 = nbv.sub(verts[2], verts[3])
+    vec1 = nbv.sub_t(verts[1], verts[0])
+    vec2 = nbv.sub_t(verts[2], verts[3])
 
     in_pnts = points_in_polygon(bnd_pnts, verts)
     if in_pnts.shape[0] == 0:
         return verts
 
     # Find perpendicular unit vector of normal and line
-    normal = nbv.cross(vec2, verts[1] - verts[2])
-    line_dir = nbv.sub(verts[1], verts[2])
-    perp_dir = nbv.cross(normal, line_dir)
-    perp_dir = nbv.div(nbv.calc_l2_norm(perp_dir), perp_dir)
+    normal = nbv.cross_t(vec2, nbv.sub_t(verts[2], verts[1]))
+    line_dir = nbv.sub_t(verts[1], verts[2])
+    perp_dir = nbv.cross_t(normal, line_dir)
+    perp_dir = nbv.div_t(nbv.norm(perp_dir), perp_dir)
 
     # Projecting vec1 onto unit_perp_dir
     norm1 = nbv.dot(vec1, perp_dir)
     norm2 = nbv.dot(vec2, perp_dir)
-    dist = min([nbv.dot(nbv.sub(verts[1], pnt), perp_dir) for pnt in in_pnts] + [norm1, norm2])
-    vec1 = nbv.div(norm1, nbv.mul(dist, vec1))
-    vec2 = nbv.div(norm2, nbv.mul(dist, vec2))
+    dist = min(norm1, norm2)
+    for pnt in in_pnts:
+        dist = min(dist, nbv.dot(nbv.sub_t(verts[1], pnt), perp_dir))
+    vec1 = nbv.div_t(norm1, nbv.mul_t(dist, vec1))
+    vec2 = nbv.div_t(norm2, nbv.mul_t(dist, vec2))
 
-    verts[0] = nbv.add(verts[1], vec1)
-    verts[3] = nbv.add(verts[2], vec2)
+    verts[0] = nbv.add_t(verts[1], vec1)
+    verts[3] = nbv.add_t(verts[2], vec2)
 
     return verts
 
 
-@nb.njit(fastmath=True)
+@nb.njit(fastmath=True, cache=True)
 def ray_triangle_set_intersect(ray_origin, ray_direction, tri_list):
     '''
     input:
@@ -109,7 +117,7 @@ def ray_triangle_set_intersect(ray_origin, ray_direction, tri_list):
     return min(results)
 
 
-@nb.njit(fastmath=True)
+@nb.njit(fastmath=True, cache=True)
 def ray_triangle_intersect(ray_origin, ray_direction, tri_v0, tri_v1, tri_v2):
     '''
     https://www.scratchapixel.com/lessons/3d-basic-rendering/ray-tracing-rendering-a-triangle/moller-trumbore-ray-triangle-intersection
@@ -118,9 +126,9 @@ def ray_triangle_intersect(ray_origin, ray_direction, tri_v0, tri_v1, tri_v2):
     output:
         float
     '''
-    v0v1 = nbv.sub(tri_v0, tri_v1)
-    v0v2 = nbv.sub(tri_v0, tri_v2)
-    pvec = nbv.cross(ray_direction, v0v2)
+    v0v1 = nbv.sub_t(tri_v0, tri_v1)
+    v0v2 = nbv.sub_t(tri_v0, tri_v2)
+    pvec = nbv.cross_t(ray_direction, v0v2)
 
     det = nbv.dot(v0v1, pvec)
 
@@ -129,13 +137,13 @@ def ray_triangle_intersect(ray_origin, ray_direction, tri_v0, tri_v1, tri_v2):
 
     invDet = 1.0 / det
 
-    tvec = nbv.sub(tri_v0, ray_origin)
+    tvec = nbv.sub_t(tri_v0, ray_origin)
     u = nbv.dot(tvec, pvec) * invDet
 
     if u < 0 or u > 1:
         return -np.inf
 
-    qvec = nbv.cross(tvec, v0v1)
+    qvec = nbv.cross_t(tvec, v0v1)
     v = nbv.dot(ray_direction, qvec) * invDet
 
     if v < 0 or u + v > 1:
@@ -146,7 +154,72 @@ def ray_triangle_intersect(ray_origin, ray_direction, tri_v0, tri_v1, tri_v2):
     return t
 
 
-@nb.njit(fastmath=True, parallel=True)
+@nb.njit(cache=True)
+def ray_triangle_intersect_xyz(ox, oy, oz, dx, dy, dz, tri):
+    '''
+    ray_triangle_intersect on scalars, without temporary arrays.
+    input:
+        ox, oy, oz: float, ray origin
+        dx, dy, dz: float, ray direction
+        tri: np.ndarray (3, 3), triangle vertices
+    output:
+        float
+    '''
+    e1x, e1y, e1z = tri[1, 0] - tri[0, 0], tri[1, 1] - tri[0, 1], tri[1, 2] - tri[0, 2]
+    e2x, e2y, e2z = tri[2, 0] - tri[0, 0], tri[2, 1] - tri[0, 1], tri[2, 2] - tri[0, 2]
+    px, py, pz = dy * e2z - dz * e2y, dz * e2x - dx * e2z, dx * e2y - dy * e2x
+    det = e1x * px + e1y * py + e1z * pz
+    if abs(det) < 0.000001:
+        return -np.inf
+    inv_det = 1.0 / det
+
+    tx, ty, tz = ox - tri[0, 0], oy - tri[0, 1], oz - tri[0, 2]
+    u = (tx * px + ty * py + tz * pz) * inv_det
+    if u < 0 or u > 1:
+        return -np.inf
+
+    qx, qy, qz = ty * e1z - tz * e1y, tz * e1x - tx * e1z, tx * e1y - ty * e1x
+    v = (dx * qx + dy * qy + dz * qz) * inv_det
+    if v < 0 or u + v > 1:
+        return -np.inf
+
+    return (e2x * qx + e2y * qy + e2z * qz) * inv_det
+
+
+@nb.njit(parallel=True, cache=True)
+def ray_triangle_set_intersect_batch(ray_origins, ray_directions, tri_list):
+    '''
+    ray_triangle_set_intersect for a batch of rays, parallel over the rays.
+    For large triangle sets use bvh_numba.bvh_closest_hits instead.
+    input:
+        ray_origins: np.ndarray (R, 3)
+        ray_directions: np.ndarray (R, 3)
+        tri_list: np.ndarray (M, 3, 3)
+    output:
+        ts: np.ndarray (R,) float64, nearest positive hit per ray, -inf if none
+        tri_ids: np.ndarray (R,) int64, index of the hit triangle, -1 if none
+    '''
+    num_rays = ray_origins.shape[0]
+    ts = np.empty(num_rays)
+    tri_ids = np.empty(num_rays, dtype=np.int64)
+    for r in nb.prange(num_rays):
+        ox, oy, oz = ray_origins[r, 0], ray_origins[r, 1], ray_origins[r, 2]
+        dx, dy, dz = ray_directions[r, 0], ray_directions[r, 1], ray_directions[r, 2]
+        best_t = np.inf
+        best_id = -1
+        for i in range(tri_list.shape[0]):
+            t = ray_triangle_intersect_xyz(ox, oy, oz, dx, dy, dz, tri_list[i])
+            if 0 < t < best_t:
+                best_t = t
+                best_id = i
+        if best_id < 0:
+            best_t = -np.inf
+        ts[r] = best_t
+        tri_ids[r] = best_id
+    return ts, tri_ids
+
+
+@nb.njit(fastmath=True, parallel=True, cache=True)
 def ray_segment_set_intersect(ray_pnt, ray_dir, segs):
     """
     Compute intersections between a ray and multiple segments using parallel processing
@@ -173,19 +246,19 @@ def ray_segment_set_intersect(ray_pnt, ray_dir, segs):
     return temp_intersects[temp_intersects >= 0.0]
 
 
-@nb.njit(fastmath=True)
+@nb.njit(fastmath=True, cache=True)
 def ray_segment_intersect(ray_pnt, ray_dir, pnt1, pnt2):
     thres = 0.000001
 
-    seg_dir = nbv.sub(pnt1, pnt2)
-    ray_dir = nbv.div(nbv.norm(ray_dir), ray_dir)
+    seg_dir = nbv.sub_t(pnt1, pnt2)
+    ray_dir = nbv.div_t(nbv.norm(ray_dir), ray_dir)
 
     # check if ray origin lie on segment
-    vec1 = nbv.sub(ray_pnt, pnt1)
-    vec2 = nbv.sub(ray_pnt, pnt2)
+    vec1 = nbv.sub_t(ray_pnt, pnt1)
+    vec2 = nbv.sub_t(ray_pnt, pnt2)
 
-    origin_on_segment = nbv.norm(nbv.cross(vec1, vec2)) < thres
-    normal = nbv.cross(seg_dir, ray_dir)
+    origin_on_segment = nbv.norm(nbv.cross_t(vec1, vec2)) < thres
+    normal = nbv.cross_t(seg_dir, ray_dir)
 
     if origin_on_segment:
         if nbv.dot(vec1, vec2) < thres:
@@ -211,11 +284,11 @@ def ray_segment_intersect(ray_pnt, ray_dir, pnt1, pnt2):
         return -np.inf
 
     # check if segment lie on one side of ray
-    if nbv.dot(np.cross(vec1, ray_dir), nbv.cross(vec2, ray_dir)) > 0:
+    if nbv.dot(nbv.cross_t(vec1, ray_dir), nbv.cross_t(vec2, ray_dir)) > 0:
         return -np.inf
 
-    seg_normal = nbv.cross(normal, seg_dir)
-    seg_normal = nbv.div(nbv.norm(seg_normal), seg_normal)
+    seg_normal = nbv.cross_t(normal, seg_dir)
+    seg_normal = nbv.div_t(nbv.norm(seg_normal), seg_normal)
     dist = nbv.dot(vec1, seg_normal) / nbv.dot(ray_dir, seg_normal)
 
     try:
@@ -226,7 +299,7 @@ def ray_segment_intersect(ray_pnt, ray_dir, pnt1, pnt2):
 
 
 
-@nb.njit(fastmath=True)
+@nb.njit(fastmath=True, cache=True)
 def points_in_polygon(bnd_pnts, verts, closed=True, normal=None):
     num_v = verts.shape[0]
     assert num_v > 1
@@ -234,24 +307,63 @@ def points_in_polygon(bnd_pnts, verts, closed=True, normal=None):
     if num_v == 2:
         assert normal is not None
 
-    if num_v > 2:
-        vec1 = nbv.sub(verts[0], verts[1])
-        vec2 = nbv.sub(verts[1], verts[2])
-        normal = nbv.cross(vec1, vec2)
-
     if closed:
         new_verts = np.zeros(shape=(verts.shape[0] + 1, verts.shape[1]), dtype=verts.dtype)
         new_verts[:verts.shape[0]] = verts
         new_verts[-1] = verts[0]
         verts = new_verts
 
-    idx = np.array([point_in_polygon(pnt, verts, normal) for pnt in bnd_pnts])
-    in_pnts = bnd_pnts[idx]
+    # `normal is None` lets numba prune the branch that would hand None to the mask kernel
+    if normal is None or num_v > 2:
+        normal_t = nbv.cross_t(nbv.sub_t(verts[0], verts[1]), nbv.sub_t(verts[1], verts[2]))
+        mask = points_in_polygon_mask(bnd_pnts, verts, normal_t)
+    else:
+        mask = points_in_polygon_mask(bnd_pnts, verts, normal)
+
+    return bnd_pnts[mask]
 
-    return in_pnts
 
+@nb.njit(fastmath=True, parallel=True, cache=True)
+def points_in_polygon_mask(bnd_pnts, verts, normal):
+    """
+    point_in_polygon for a whole point cloud, parallel over the points.
 
-@nb.njit(fastmath=True)
+    :param bnd_pnts: (P, 3) points.
+    :param verts: (V + 1, 3) closed convex polygon, the last vertex equal to the first one.
+    :param normal: polygon normal.
+    :return: (P,) bool mask of the points strictly inside.
+    """
+    num_e = verts.shape[0] - 1
+    # inward unit normal and offset of every edge line
+    perp_dirs = np.zeros((num_e, 3))
+    offsets = np.zeros(num_e)
+    # degenerate edges (duplicate or collinear vertices) never exclude a point; they are
+    # skipped by this flag rather than an infinite offset, which fastmath assumes away
+    valid = np.zeros(num_e, dtype=np.bool_)
+    for i in range(num_e):
+        perp_dir = nbv.cross_t(normal, nbv.sub_t(verts[i], verts[i + 1]))
+        length = nbv.norm(perp_dir)
+        if length == 0.0:
+            continue
+        perp_dir = nbv.div_t(length, perp_dir)
+        perp_dirs[i] = perp_dir
+        offsets[i] = nbv.dot(verts[i], perp_dir)
+        valid[i] = True
+
+    mask = np.empty(bnd_pnts.shape[0], dtype=np.bool_)
+    for p in nb.prange(bnd_pnts.shape[0]):
+        inside = True
+        for i in range(num_e):
+            if not valid[i]:
+                continue
+            if nbv.dot(bnd_pnts[p], perp_dirs[i]) - offsets[i] <= 0.000001:
+                inside = False
+                break
+        mask[p] = inside
+    return mask
+
+
+@nb.njit(fastmath=True, cache=True)
 def point_in_polygon(the_pnt, verts, normal=None):
     dists = np.array([dist_pnt_line(the_pnt, verts[i], verts[i + 1], normal) for i in range(len(verts) - 1)])
     summation = 0
@@ -266,7 +378,7 @@ def point_in_polygon(the_pnt, verts, normal=None):
         return True
 
 
-@nb.njit(fastmath=True)
+@nb.njit(fastmath=True, cache=True)
 def point_in_polygon_face_numba(face_pnts, query_pnt):
     """ Finds if a point lies within the bounds of a polygon.
 
@@ -286,12 +398,12 @@ def point_in_polygon_face_numba(face_pnts, query_pnt):
     :param normal:
     :return:
     """
-    u = nbv.sub(face_pnts[0], face_pnts[1])
-    v = nbv.sub(face_pnts[0], face_pnts[2])
-    normal = nbv.cross(u, v)
+    u = nbv.sub_t(face_pnts[0], face_pnts[1])
+    v = nbv.sub_t(face_pnts[0], face_pnts[2])
+    normal = nbv.cross_t(u, v)
     D = -(normal[0] * face_pnts[0][0] + normal[1] * face_pnts[0][1] + normal[2] * face_pnts[0][2])
     dis = query_pnt[0] * normal[0] + query_pnt[1] * normal[1] + query_pnt[2] * normal[2] + D
-    distance = dis / nbv.calc_l2_norm(normal)
+    distance = dis / nbv.norm(normal)
 
     if distance > 0:
         return False
@@ -299,7 +411,7 @@ def point_in_polygon_face_numba(face_pnts, query_pnt):
         return True
 
 
-@nb.njit(fastmath=True)
+@nb.njit(fastmath=True, cache=True)
 def dist_pnt_line(query_pnt, pnt0, pnt1, normal):
     """Calculates the distance of a query point from a line.
 
@@ -310,15 +422,15 @@ def dist_pnt_line(query_pnt, pnt0, pnt1, normal):
     :param pnt1: Second point of line.
     :return: Distance of query point from line.
     """
-    query_dir = nbv.sub(pnt0, query_pnt)
-    line_dir = nbv.sub(pnt0, pnt1)
-    perp_dir = nbv.cross(normal, line_dir)
-    perp_dir = nbv.div(nbv.calc_l2_norm(perp_dir), perp_dir)
+    query_dir = nbv.sub_t(pnt0, query_pnt)
+    line_dir = nbv.sub_t(pnt0, pnt1)
+    perp_dir = nbv.cross_t(normal, line_dir)
+    perp_dir = nbv.div_t(nbv.norm(perp_dir), perp_dir)
 
     return nbv.dot(query_dir, perp_dir)
 
 
-@nb.njit(fastmath=True)
+@nb.njit(fastmath=True, cache=True)
 def dist_pnt_from_line_numba(query_pnt, pnt0, pnt1):
     """Calculates the distance of a query point from a line.
 
@@ -329,29 +441,29 @@ def dist_pnt_from_line_numba(query_pnt, pnt0, pnt1):
     :param pnt1: Second point of line.
     :return: Distance of query point from line.
     """
-    query_dir = query_pnt - pnt0
-    line_dir = pnt1 - pnt0
-    cross_product = nbv.cross(query_dir, line_dir)
-    A = nbv.calc_l2_norm(cross_product)
-    line_norm = nbv.calc_l2_norm(line_dir)
+    query_dir = nbv.sub_t(pnt0, query_pnt)
+    line_dir = nbv.sub_t(pnt0, pnt1)
+    cross_product = nbv.cross_t(query_dir, line_dir)
+    A = nbv.norm(cross_product)
+    line_norm = nbv.norm(line_dir)
 
     result = A / line_norm
 
     return result
 
 
-@nb.njit(fastmath=True)
+@nb.njit(fastmath=True, cache=True)
 def dist_point_plane_numba(pnt, pl_pnt, pl_normal):
-    p_dir = nbv.sub(pl_pnt, pnt)
+    p_dir = nbv.sub_t(pl_pnt, pnt)
     dist = nbv.dot(p_dir, pl_normal)
 
     return dist
 
 
-@nb.njit(fastmath=True)
+@nb.njit(fastmath=True, cache=True)
 def outer_radius_triangle(pt1, pt2, pt3):
-    a = nbv.calc_l2_norm(nbv.sub(pt2, pt1))
-    b = nbv.calc_l2_norm(nbv.sub(pt3, pt2))
-    c = nbv.calc_l2_norm(nbv.sub(pt1, pt3))
+    a = nbv.norm(nbv.sub_t(pt2, pt1))
+    b = nbv.norm(nbv.sub_t(pt3, pt2))
+    c = nbv.norm(nbv.sub_t(pt1, pt3))
     p = (a + b + c) / 2
     return a * b * c / (4 * math.sqrt(p * (p - a) * (p - b) * (p - c)))
@@ -7,7 +7,7 @@ import math
 import numpy as np
 
 
-@nb.njit(fastmath=True)
+@nb.njit(fastmath=True, cache=True)
 def add(vec1, vec2):
     result = np.zeros(3)
     result[0] = vec1[0] + vec2[0]
@@ -17,7 +17,7 @@ def add(vec1, vec2):
     return result
 
 
-@nb.njit(fastmath=True)
+@nb.njit(fastmath=True, cache=True)
 def sub(vec1, vec2):
     result = np.zeros(3)
     result[0] = vec2[0] - vec1[0]
@@ -27,7 +27,7 @@ def sub(vec1, vec2):
     return result
     
 
-@nb.njit(fastmath=True)
+@nb.njit(fastmath=True, cache=True)
 def mul(a, vec):
     """ Calculate the product of a scalar and a 3d vector and store the result in the second parameter."""
     result = np.zeros(3)
@@ -38,7 +38,7 @@ def mul(a, vec):
     return result
 
 
-@nb.njit(fastmath=True)
+@nb.njit(fastmath=True, cache=True)
 def div(a, vec):
     """ Divide a 3d vector by a scalar and store the result in the third parameter. """
     result = np.zeros(3)
@@ -49,7 +49,7 @@ def div(a, vec):
     return result
 
 
-@nb.njit(fastmath=True)
+@nb.njit(fastmath=True, cache=True)
 def sum(vec):
     total = 0.0
     for i in range(vec.shape[0]):
@@ -57,7 +57,7 @@ def sum(vec):
     return total
 
 
-@nb.njit(fastmath=True)
+@nb.njit(fastmath=True, cache=True)
 def cross(vec1, vec2):
     """ Calculate the cross product of two 3d vectors. """
     result = np.zeros(3)
@@ -70,21 +70,51 @@ def cross(vec1, vec2):
     return result
 
 
-@nb.njit(fastmath=True)
+@nb.njit(fastmath=True, cache=True)
 def dot(vec1, vec2):
     """ Calculate the dot product of two 3d vectors. """
     return vec1[0] * vec2[0] + vec1[1] * vec2[1] + vec1[2] * vec2[2]
 
 
-@nb.njit(fastmath=True)
+@nb.njit(fastmath=True, cache=True)
 def norm(vec):
     """ Calculate the norm of a 3d vector. """
     return math.sqrt(vec[0] * vec[0] + vec[1] * vec[1] + vec[2] * vec[2])
 
 
-@nb.njit(fastmath=True)
+@nb.njit(fastmath=True, cache=True)
 def calc_l2_norm(v):
     s = 0
     for i in range(v.shape[0]):
         s += v[i] ** 2
-    return math.sqrt(s)
\ No newline at end of file
+    return math.sqrt(s)
+
+# Tuple variants of the functions above. They take arrays or 3-tuples and return
+# 3-tuples, which numba keeps in registers instead of allocating an array per call.
+# Argument order and semantics are the same as the array versions, sub_t(a, b) is b - a.
+
+@nb.njit(fastmath=True, cache=True)
+def add_t(vec1, vec2):
+    return vec1[0] + vec2[0], vec1[1] + vec2[1], vec1[2] + vec2[2]
+
+
+@nb.njit(fastmath=True, cache=True)
+def sub_t(vec1, vec2):
+    return vec2[0] - vec1[0], vec2[1] - vec1[1], vec2[2] - vec1[2]
+
+
+@nb.njit(fastmath=True, cache=True)
+def mul_t(a, vec):
+    return a * vec[0], a * vec[1], a * vec[2]
+
+
+@nb.njit(fastmath=True, cache=True)
+def div_t(a, vec):
+    return vec[0] / a, vec[1] / a, vec[2] / a
+
+
+@nb.njit(fastmath=True, cache=True)
+def cross_t(vec1, vec2):
+    a1, a2, a3 = nb.double(vec1[0]), nb.double(vec1[1]), nb.double(vec1[2])
+    b1, b2, b3 = nb.double(vec2[0]), nb.double(vec2[1]), nb.double(vec2[2])
+    return a2 * b3 - a3 * b2, a3 * b1 - a1 * b3, a1 * b2 - a2 * b1
@@ -0,0 +1,81 @@
+"""
+Eager compilation of the numba kernels for their float64 array forms.
+
+All kernels are declared with cache=True, so compiled code is stored next to the
+modules (or in NUMBA_CACHE_DIR) and loaded instead of re-compiled by every new
+process. warmup() compiles the signatures below up front, so a worker process pays
+the cache load once at start instead of a JIT stall on its first call.
+
+    python -m Utils.numba_warmup    # fill the on-disk cache, e.g. after an install
+"""
+import time
+
+import numpy as np
+from numba import types, typeof
+
+import Utils.bvh_numba as bvh_numba
+import Utils.geom_utils_numba as gun
+
+f8 = types.float64
+i8 = types.int64
+vec = types.Array(f8, 1, 'C')         # (3,) point or direction
+rows = types.Array(f8, 2, 'C')        # (N, 3) points
+tris = types.Array(f8, 3, 'C')        # (M, 3, 3) triangles
+default = types.Omitted
+
+
+def _bvh_type():
+    return typeof(bvh_numba.build_bvh(np.zeros((1, 3, 3))))
+
+
+def signatures():
+    '''
+    output
+        [(dispatcher, (numba types,))]
+    '''
+    bvh = _bvh_type()
+    return [
+        (gun.ray_triangle_intersect, (vec, vec, vec, vec, vec)),
+        (gun.ray_triangle_set_intersect, (vec, vec, tris)),
+        (gun.ray_triangle_set_intersect_batch, (rows, rows, tris)),
+        (gun.ray_segment_intersect, (vec, vec, vec, vec)),
+        (gun.ray_segment_set_intersect, (vec, vec, tris)),
+        (gun.points_in_polygon, (rows, rows, default(True), default(None))),
+        (gun.points_in_polygon_mask, (rows, rows, vec)),
+        (gun.search_rect_inside_bound_1, (rows, vec, vec, rows)),
+        (gun.search_rect_inside_bound_2, (rows, vec, vec, rows)),
+        (gun.search_rect_inside_bound_3, (rows, rows)),
+        (gun.point_in_polygon_face_numba, (rows, vec)),
+        (gun.dist_pnt_line, (vec, vec, vec, vec)),
+        (gun.dist_pnt_from_line_numba, (vec, vec, vec)),
+        (gun.dist_point_plane_numba, (vec, vec, vec)),
+        (gun.outer_radius_triangle, (vec, vec, vec)),
+        (bvh_numba._build, (rows, rows, rows, i8)),
+        (bvh_numba.bvh_closest_hit, (bvh, vec, vec)),
+        (bvh_numba.bvh_any_hit, (bvh, vec, vec, default(np.inf))),
+        (bvh_numba.bvh_any_hit, (bvh, vec, vec, f8)),
+        (bvh_numba.bvh_closest_hits, (bvh, rows, rows)),
+    ]
+
+
+def warmup(verbose=False):
+    '''
+    Compile (or load from the cache) every kernel in signatures().
+
+    output
+        seconds: float, time spent
+    '''
+    start = time.perf_counter()
+    for dispatcher, sig in signatures():
+        t = time.perf_counter()
+        dispatcher.compile(sig)
+        if verbose:
+            print(f"{dispatcher.py_func.__module__}.{dispatcher.py_func.__name__}: {time.perf_counter() - t:.3f} s")
+    seconds = time.perf_counter() - start
+    if verbose:
+        print(f"numba warm-up done in {seconds:.2f} s")
+    return seconds
+
+
+if __name__ == '__main__':
+    warmup(verbose=True)
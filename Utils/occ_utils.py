@@ -7,11 +7,13 @@ Created on Thu Oct 25 11:43:39 2018
 import random
 import os
 import sys
+import multiprocessing
+import numpy as np
 
 # from OCC.Core.TopExp import TopExp_Explorer, topexp, topexp.MapShapesAndAncestors
 from OCC.Core.TopExp import TopExp_Explorer, topexp
 from OCC.Core.TopAbs import TopAbs_FACE, TopAbs_REVERSED, TopAbs_EDGE, TopAbs_VERTEX
-from OCC.Core.TopoDS import topods, TopoDS_Shape, TopoDS_Vertex, TopoDS_Face, TopoDS_Edge
+from OCC.Core.TopoDS import topods, TopoDS_Shape, TopoDS_Vertex, TopoDS_Face, TopoDS_Edge, TopoDS_Compound, TopoDS_Iterator
 from OCC.Core.Bnd import Bnd_Box
 from OCC.Core.BRepMesh import BRepMesh_IncrementalMesh
 from OCC.Core.BRepBndLib import brepbndlib_Add
@@ -19,19 +21,23 @@ from OCC.Core.BRepTools import breptools
 from OCC.Core.IntTools import IntTools_FClass2d
 from OCC.Core.gp import gp_Pnt2d, gp_Pnt, gp_Dir, gp_Vec
 from OCC.Core.BRepAdaptor import BRepAdaptor_Surface, BRepAdaptor_Curve
-from OCC.Core.BRep import BRep_Tool, BRep_Tool_Curve
+from OCC.Core.GCPnts import GCPnts_QuasiUniformDeflection
+from OCC.Core.BRep import BRep_Tool, BRep_Tool_Curve, BRep_Builder
 from OCC.Core.GeomLProp import GeomLProp_SLProps
 from OCC.Core.TopLoc import TopLoc_Location
 from OCC.Core.StlAPI import StlAPI_Reader
 from OCC.Core.BRepExtrema import BRepExtrema_DistShapeShape
 from OCC.Core.BRepBuilderAPI import BRepBuilderAPI_MakeVertex, BRepBuilderAPI_MakeEdge, BRepBuilderAPI_MakeWire, BRepBuilderAPI_MakeFace
-from OCC.Core.TopTools import TopTools_IndexedDataMapOfShapeListOfShape
+from OCC.Core.TopTools import TopTools_IndexedMapOfShape
 from OCC.Core.BRepBuilderAPI import BRepBuilderAPI_MakeEdge, BRepBuilderAPI_MakeVertex, BRepBuilderAPI_MakeWire, BRepBuilderAPI_MakeFace
 from OCC.Core.gp import gp_Pnt
-from OCC.Core.TopOpeBRepBuild import TopOpeBRepBuild_Tools
 from OCC.Display import SimpleGui
 from OCC.Extend.TopologyUtils import TopologyExplorer, WireExplorer
 
+import Utils.geom_utils as geom_utils
+from Utils.performance_settings import PERFORMANCE_SETTINGS
+from Utils.shape_index import topology_index, face_descriptor_of
+
 
 SURFACE_TYPE = ['plane', 'cylinder', 'cone', 'sphere', 'torus', 'bezier', 'bspline', 'revolution', 'extrusion', 'offset', 'other']
 CURVE_TYPE = ['line', 'circle', 'ellipse', 'hyperbola', 'parabola', 'bezier', 'bspline', 'offset', 'other']
@@ -101,9 +107,16 @@ def list_edge(shape):
 
 
 def edges_at_vertex(vert, face):    #  Finds all edges connected to a given vertex on a specific face.
-    f_topo = TopologyExplorer(face)
-    v_edges = [edge for edge in f_topo.edges_from_vertex(vert)]
-    return v_edges
+    # deliberately not through TopologyIndex: one walk over the edges of the face is cheaper than
+    # indexing the face, and a per face index would evict whole-shape indexes from topology_index
+    edges = TopTools_IndexedMapOfShape()
+    exp = TopExp_Explorer(face, TopAbs_EDGE)
+    while exp.More():
+        edge = topods.Edge(exp.Current())
+        if topexp.FirstVertex(edge).IsSame(vert) or topexp.LastVertex(edge).IsSame(vert):
+            edges.Add(edge)
+        exp.Next()
+    return [topods.Edge(edges.FindKey(i)) for i in range(1, edges.Size() + 1)]
 
 
 def list_verts_ordered(face):   # Lists vertices of a face in an ordered manner based on a traversal of its edges.
@@ -152,11 +165,16 @@ def as_occ(pnt, occ_type):   # Converts Python list coordinates into OCCT geomet
         return occ_type(pnt[0], pnt[1], pnt[2])
 
     
-def type_face(face):    # Identifies the type of a surface of a face (plane, cylinder, cone, etc.).
+def type_face(face, shape=None):    # Identifies the type of a surface of a face (plane, cylinder, cone, etc.).
     if type(face) is not TopoDS_Face:
         print(face, 'not face')
         return None
-        
+
+    # shape owning face, read the cached face descriptors of it if given
+    row = face_descriptor_of(shape, face, ('surface_type',)) if shape is not None else None
+    if row is not None:
+        return SURFACE_TYPE[row['surface_type']]
+
     surf_adaptor = BRepAdaptor_Surface(face)        
     return SURFACE_TYPE[surf_adaptor.GetType()]
 
@@ -228,7 +246,6 @@ def sample_point(face): #  Randomly samples a point on a face's surface and calc
 
     itool = IntTools_FClass2d(face, 1e-6)
     while itool.Perform(gp_Pnt2d(u,v)) != 0:
-        print('outside')
         u = random.uniform(u_min, u_max)
         v = random.uniform(v_min, v_max)
 
@@ -257,7 +274,7 @@ def shape_from_stl(filename):   # Loads a 3D shape from an STL file.
     return the_shape
 
 
-def normal_to_face_center(face):    #  Calculates the normal vector at the center of a face.
+def normal_to_face_center(face, shape=None):    #  Calculates the normal vector at the center of a face.
     """Finds normal at center of face.
 
     Calculates max and min parametric points subscribing face bounding box.
@@ -265,8 +282,13 @@ def normal_to_face_center(face):    #  Calculates the normal vector at the cente
     Create surface of face and find normal at midpoint.
 
     :param face (TopoDS_Face): face to interograte
+    :param shape (TopoDS_Shape): shape owning face, read the cached face descriptors of it if given
     :return: normal (list): normal at center of face
     """
+    row = face_descriptor_of(shape, face, ('normal',)) if shape is not None else None
+    if row is not None and np.any(row['normal']):
+        return gp_Dir(*row['normal'])
+
     u_min, u_max, v_min, v_max = breptools.UVBounds(face)
     u_mid = (u_min + u_max) / 2.
     v_mid = (v_min + v_max) / 2.
@@ -327,6 +349,19 @@ def dist_point_to_edge(pnt, edge):    # Computes the shortest distance from a po
 
     
 def dist_point_to_edges(the_pnt, edges):
+    '''
+    input
+        the_pnt:    [float, float, float]
+        edges:      [TopoDS_Edge] or EdgeDistanceIndex, the index prunes the exact distances
+                    to the few nearest edges
+    output
+        min_d:      float
+        nearest_pnt: [float, float, float]
+    '''
+    if isinstance(edges, EdgeDistanceIndex):
+        min_d, nearest_pnt, _ = edges.nearest(the_pnt)
+        return min_d, nearest_pnt
+
     min_d = sys.float_info.max
     nearest_pnt = None
     for edge in edges:
@@ -337,7 +372,115 @@ def dist_point_to_edges(the_pnt, edges):
             min_d = dist
             nearest_pnt = pnt     
     return min_d, nearest_pnt
-    
+
+
+class EdgeDistanceIndex:
+    '''
+    Nearest-edge queries over a fixed set of edges.
+
+    Every edge is discretized into a polyline whose points lie on the edge, within
+    deflection of it. A geom_utils.SegmentGrid over the polyline segments keeps the
+    edges whose polyline distance is within 2 * deflection of the best one, and the
+    exact BRepExtrema distance runs only on those.
+    '''
+    def __init__(self, edges, deflection=None, resolution=64):
+        '''
+        input
+            edges:      [TopoDS_Edge]
+            deflection: float, polyline tolerance, 1e-3 of the bounding box size by default
+            resolution: int, grid cells along the longest side of the bounding box
+        '''
+        self.edges = list(edges)
+        if deflection is None:
+            bbox = Bnd_Box()
+            for edge in self.edges:
+                brepbndlib_Add(edge, bbox)
+            deflection = 1e-3
+            if not bbox.IsVoid():
+                xmin, ymin, zmin, xmax, ymax, zmax = bbox.Get()
+                deflection = max(xmax - xmin, ymax - ymin, zmax - zmin, 1e-6) * 1e-3
+        self.deflection = deflection
+
+        segments = []
+        seg_edges = []
+        for eid, edge in enumerate(self.edges):
+            polyline = _edge_polyline(edge, deflection)
+            if len(polyline) < 2:
+                continue
+            segments.append(np.stack([polyline[:-1], polyline[1:]], axis=1))
+            seg_edges.append(np.full(len(polyline) - 1, eid, dtype=np.int32))
+        segments = np.concatenate(segments) if segments else np.empty((0, 2, 3))
+        seg_edges = np.concatenate(seg_edges) if seg_edges else np.empty(0, dtype=np.int32)
+        self.grid = geom_utils.SegmentGrid(segments, seg_edges, 2 * deflection, resolution)
+
+    def polyline_distances(self, pnt):
+        '''
+        input
+            pnt:    [float, float, float]
+        output
+            dists:  {edge id: float}, polyline distance of the edges that can be the nearest one
+        '''
+        return self.grid.candidates(pnt)
+
+    def _nearest(self, pnt):
+        min_d = sys.float_info.max
+        nearest_pnt = None
+        nearest_id = -1
+        for eid in sorted(self.polyline_distances(pnt)):
+            dist, near = dist_point_to_edge(pnt, self.edges[eid])
+            if dist is not None and dist < min_d:
+                min_d, nearest_pnt, nearest_id = dist, near, eid
+        return min_d, nearest_pnt, nearest_id
+
+    def nearest(self, pnt):
+        '''
+        input
+            pnt:        [float, float, float]
+        output
+            min_d:      float, sys.float_info.max if there is no edge
+            nearest_pnt: [float, float, float], None if there is no edge
+            edge:       TopoDS_Edge, None if there is no edge
+        '''
+        min_d, nearest_pnt, eid = self._nearest(pnt)
+        return min_d, nearest_pnt, (self.edges[eid] if eid >= 0 else None)
+
+    def nearest_many(self, pnts):
+        '''
+        input
+            pnts:           np.ndarray (P, 3)
+        output
+            dists:          np.ndarray (P,), sys.float_info.max where no edge is found
+            nearest_pnts:   np.ndarray (P, 3), NaN rows where no edge is found
+            edge_ids:       np.ndarray (P,) int32, index into self.edges, -1 where no edge is found
+        '''
+        pnts = np.asarray(pnts, dtype=np.float64).reshape(-1, 3)
+        dists = np.full(len(pnts), sys.float_info.max)
+        nearest_pnts = np.full((len(pnts), 3), np.nan)
+        edge_ids = np.full(len(pnts), -1, dtype=np.int32)
+        for i, pnt in enumerate(pnts):
+            dist, near, eid = self._nearest(pnt)
+            if eid >= 0:
+                dists[i], nearest_pnts[i], edge_ids[i] = dist, near, eid
+        return dists, nearest_pnts, edge_ids
+
+
+def _edge_polyline(edge, deflection):
+    '''
+    input
+        edge:       TopoDS_Edge
+        deflection: float
+    output
+        pnts:       np.ndarray (n, 3), points on the edge, empty for degenerated edges
+    '''
+    if BRep_Tool.Degenerated(edge):
+        return np.empty((0, 3))
+    curve = BRepAdaptor_Curve(edge)
+    discretizer = GCPnts_QuasiUniformDeflection(curve, deflection)
+    if not discretizer.IsDone():
+        return np.array([curve.Value(curve.FirstParameter()).Coord(), curve.Value(curve.LastParameter()).Coord()])
+    return np.array([discretizer.Value(i).Coord() for i in range(1, discretizer.NbPoints() + 1)])
+
+
 '''
 input
     shape:          TopoDS_Shape
@@ -397,6 +540,245 @@ def triangulation_from_shape(shape):
     return pts, uvs, triangles, triangle_faces
 
 
+def _trsf_to_numpy(trsf):
+    '''
+    input
+        trsf:   gp_Trsf
+    output
+        rot:    np.ndarray (3, 3)
+        trans:  np.ndarray (3,)
+    '''
+    mat = np.array([[trsf.Value(row, col) for col in range(1, 5)] for row in range(1, 4)])
+    return mat[:, :3], mat[:, 3]
+
+
+def face_triangulation_arrays(face, with_uvs=True):
+    '''
+    Triangulation stored in a meshed face as arrays.
+
+    pythonocc has no bulk accessor for Poly_Triangulation, so this is one Python loop over
+    the nodes of the face, reading the node and its UV node together, and one over the
+    triangles. See benchmarks/bench_triangulation.py for what that costs.
+
+    input
+        face:       TopoDS_Face
+        with_uvs:   bool, also read the UV nodes
+    output
+        pts:        np.ndarray (n, 3) float64, transformed by the face location
+        uvs:        np.ndarray (n, 2) float64, None if with_uvs is False or the face has no UVs
+        triangles:  np.ndarray (m, 3) int32, 0-based node ids of the face, oriented by the face
+    '''
+    aLoc = TopLoc_Location()
+    aTriangulation = BRep_Tool().Triangulation(face, aLoc)
+    if aTriangulation is None:
+        return np.empty((0, 3)), (np.empty((0, 2)) if with_uvs else None), np.empty((0, 3), dtype=np.int32)
+
+    num_nodes = aTriangulation.NbNodes()
+    aNodes = aTriangulation.Nodes()
+    pts = np.empty((num_nodes, 3), dtype=np.float64)
+    uvs = None
+    if with_uvs and aTriangulation.HasUVNodes():
+        aUVNodes = aTriangulation.UVNodes()
+        uvs = np.empty((num_nodes, 2), dtype=np.float64)
+        for i in range(num_nodes):
+            pts[i] = aNodes.Value(i + 1).Coord()
+            uvs[i] = aUVNodes.Value(i + 1).Coord()
+    else:
+        for i in range(num_nodes):
+            pts[i] = aNodes.Value(i + 1).Coord()
+    if not aLoc.IsIdentity():
+        rot, trans = _trsf_to_numpy(aLoc.Transformation())
+        pts = pts @ rot.T + trans
+
+    aTriangles = aTriangulation.Triangles()
+    triangles = np.array([aTriangles.Value(i).Get() for i in range(1, aTriangulation.NbTriangles() + 1)],
+                         dtype=np.int32).reshape(-1, 3) - 1
+    if face.Orientation() == TopAbs_REVERSED:
+        triangles = triangles[:, [1, 0, 2]]
+
+    return pts, uvs, triangles
+
+
+'''
+input
+    shape:          TopoDS_Shape
+    with_uvs:       bool, skip the UV nodes when False
+    parallel:       bool, read the faces with triangulation_arrays_sharded
+output
+    pts:            np.ndarray (N, 3) float64
+    uvs:            np.ndarray (N, 2) float64, None if with_uvs is False
+    triangles:      np.ndarray (M, 3) int32, indices into pts
+    triangle_faces: np.ndarray (M,) int32, id of the face of each triangle in list_face(shape) order
+'''
+
+def triangulation_arrays_from_shape(shape, with_uvs=True, parallel=False):
+    linear_deflection = 0.01
+    angular_deflection = 0.5
+    # the constructor meshes the shape, a second Perform() would mesh it again
+    mesh = BRepMesh_IncrementalMesh(shape, linear_deflection, False, angular_deflection, True)
+    assert mesh.IsDone()
+
+    if parallel:
+        return triangulation_arrays_sharded(list_face(shape), with_uvs)
+    return merge_face_arrays([face_triangulation_arrays(f, with_uvs) for f in list_face(shape)], with_uvs)
+
+
+def merge_face_arrays(face_arrays, with_uvs=True):
+    '''
+    Concatenate per face triangulations, offsetting the node ids of every face.
+
+    input
+        face_arrays:    [(pts, uvs, triangles)] per face, see face_triangulation_arrays
+        with_uvs:       bool
+    output
+        pts, uvs, triangles, triangle_faces, see triangulation_arrays_from_shape, face ids
+        are positions in face_arrays
+    '''
+    num_pts = sum(len(f_pts) for f_pts, _, _ in face_arrays)
+    num_triangles = sum(len(f_tris) for _, _, f_tris in face_arrays)
+    pts = np.empty((num_pts, 3), dtype=np.float64)
+    uvs = np.zeros((num_pts, 2), dtype=np.float64) if with_uvs else None
+    triangles = np.empty((num_triangles, 3), dtype=np.int32)
+    triangle_faces = np.empty(num_triangles, dtype=np.int32)
+
+    offset = 0
+    tri_offset = 0
+    for fid, (f_pts, f_uvs, f_tris) in enumerate(face_arrays):
+        pts[offset:offset + len(f_pts)] = f_pts
+        if with_uvs and f_uvs is not None:
+            uvs[offset:offset + len(f_pts)] = f_uvs
+        triangles[tri_offset:tri_offset + len(f_tris)] = f_tris + offset
+        triangle_faces[tri_offset:tri_offset + len(f_tris)] = fid
+        offset += len(f_pts)
+        tri_offset += len(f_tris)
+
+    return pts, uvs, triangles, triangle_faces
+
+
+def _triangulation_shard(task):
+    '''
+    input
+        task:   (TopoDS_Compound, with_uvs), the faces of one shard as direct children of the compound
+    output
+        pts, uvs, triangles, triangle_faces of the shard, see merge_face_arrays
+    '''
+    compound, with_uvs = task
+    face_arrays = []
+    it = TopoDS_Iterator(compound)
+    while it.More():
+        face_arrays.append(face_triangulation_arrays(topods.Face(it.Value()), with_uvs))
+        it.Next()
+    return merge_face_arrays(face_arrays, with_uvs)
+
+
+def triangulation_arrays_sharded(faces, with_uvs=True, num_processes=None, chunk_size=None):
+    '''
+    Triangulation of meshed faces as arrays, read in shards of chunk_size faces by a process pool.
+
+    Every shard goes to its worker as one compound of its faces, so the geometry and the
+    triangulation of a shard are serialised once and the faces keep their orientation and
+    location. Shards come back in order and are joined with the node offset of each shard.
+    With fewer than 2 processes, or a single shard, the faces are read in this process.
+
+    input
+        faces:          [TopoDS_Face], already meshed, duplicates are kept
+        with_uvs:       bool
+        num_processes:  int, PERFORMANCE_SETTINGS['batch_processing']['num_processes'] by default
+        chunk_size:     int, faces per shard, PERFORMANCE_SETTINGS['batch_processing']['chunk_size'] by default
+    output
+        pts, uvs, triangles, triangle_faces, see triangulation_arrays_from_shape, face ids are
+        positions in faces
+    '''
+    settings = PERFORMANCE_SETTINGS['batch_processing']
+    num_processes = num_processes or settings['num_processes']
+    chunk_size = chunk_size or settings['chunk_size']
+
+    if num_processes < 2 or len(faces) <= chunk_size:
+        return merge_face_arrays([face_triangulation_arrays(f, with_uvs) for f in faces], with_uvs)
+
+    builder = BRep_Builder()
+    tasks = []
+    for start in range(0, len(faces), chunk_size):
+        compound = TopoDS_Compound()
+        builder.MakeCompound(compound)
+        for face in faces[start:start + chunk_size]:
+            builder.Add(compound, face)
+        tasks.append((compound, with_uvs))
+
+    with multiprocessing.Pool(min(num_processes, len(tasks))) as pool:
+        shards = pool.map(_triangulation_shard, tasks)
+
+    node_offsets = np.cumsum([0] + [len(shard_pts) for shard_pts, _, _, _ in shards])
+    pts = np.concatenate([shard[0] for shard in shards])
+    uvs = np.concatenate([shard[1] for shard in shards]) if with_uvs else None
+    triangles = np.concatenate([shard[2] + offset for shard, offset in zip(shards, node_offsets)]).astype(np.int32)
+    face_starts = range(0, len(faces), chunk_size)
+    triangle_faces = np.concatenate([shard[3] + start for shard, start in zip(shards, face_starts)]).astype(np.int32)
+    return pts, uvs, triangles, triangle_faces
+
+
+def sample_points(face, num_points, project=False, rng=None, linear_deflection=0.01, angular_deflection=0.5):
+    '''
+    Points drawn uniformly by area over a face, from its triangulation.
+
+    The face is meshed first if it has no triangulation. Every point picks a triangle with
+    probability proportional to its area and uniform barycentric weights inside it.
+
+    input
+        face:               TopoDS_Face
+        num_points:         int
+        project:            bool, move the points onto the exact surface through the interpolated
+                            UV nodes and take the surface normals there, raises ValueError if
+                            the triangulation of the face has no UV nodes
+        rng:                np.random.Generator, np.random.default_rng() by default
+        linear_deflection:  float, mesh settings used when the face is not meshed yet
+        angular_deflection: float
+    output
+        pts:                np.ndarray (num_points, 3) float64
+        normals:            np.ndarray (num_points, 3) float64, unit, reversed for reversed faces
+    '''
+    rng = rng if rng is not None else np.random.default_rng()
+    if BRep_Tool().Triangulation(face, TopLoc_Location()) is None:
+        mesh = BRepMesh_IncrementalMesh(face, linear_deflection, False, angular_deflection, True)
+        assert mesh.IsDone()
+
+    nodes, uvs, triangles = face_triangulation_arrays(face, with_uvs=project)
+    if len(triangles) == 0:
+        return np.empty((0, 3)), np.empty((0, 3))
+
+    corners = nodes[triangles]   # (M, 3, 3)
+    cross = np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+    areas = np.linalg.norm(cross, axis=1)
+    if areas.sum() <= 0.0:
+        return np.empty((0, 3)), np.empty((0, 3))
+    tri_ids = rng.choice(len(triangles), size=num_points, p=areas / areas.sum())
+
+    # uniform barycentric weights, sqrt(r1) folds the unit square onto the triangle
+    r1 = np.sqrt(rng.random(num_points))
+    r2 = rng.random(num_points)
+    weights = np.stack([1.0 - r1, r1 * (1.0 - r2), r1 * r2], axis=1)   # (N, 3)
+    pts = np.einsum('nk,nkd->nd', weights, corners[tri_ids])
+
+    # triangles are already oriented by the face, so the facet normals point outward
+    normals = cross[tri_ids] / np.maximum(areas[tri_ids], 1e-300)[:, None]
+    if not project:
+        return pts, normals
+    if uvs is None:
+        raise ValueError('sample_points: the triangulation of the face has no UV nodes to project with')
+
+    sample_uvs = np.einsum('nk,nkd->nd', weights, uvs[triangles[tri_ids]])
+    props = GeomLProp_SLProps(BRep_Tool.Surface(face), 1, 1e-6)
+    for i, (u, v) in enumerate(sample_uvs):
+        props.SetParameters(u, v)
+        pts[i] = props.Value().Coord()
+        # keep the facet normal where the surface normal is undefined, e.g. at a cone apex
+        if props.IsNormalDefined():
+            normal = props.Normal().Coord()
+            normals[i] = normal if face.Orientation() != TopAbs_REVERSED else np.negative(normal)
+
+    return pts, normals
+
+
 # def face_polygon(pnts):
 #     wire_maker = BRepBuilderAPI_MakeWire()
 #     verts = [BRepBuilderAPI_MakeVertex(as_occ(pnt, gp_Pnt)).Vertex() for pnt in pnts]
@@ -456,15 +838,16 @@ def face_polygon(pnts):
         return None
 
     
-def face_adjacent(shape, face, edge):
-    efmap = TopTools_IndexedDataMapOfShapeListOfShape()
-    # topexp.MapShapesAndAncestors(shape, TopAbs_EDGE, TopAbs_FACE, efmap)
-    topexp.MapShapesAndAncestors(shape, TopAbs_EDGE, TopAbs_FACE, efmap)
-    adjface = TopoDS_Face()
-    if TopOpeBRepBuild_Tools.GetAdjacentFace(face, edge, efmap, adjface):
-        return adjface
-    else:
+def face_adjacent(shape, face, edge):   # Face of shape on the other side of edge, None if there is none
+    index = topology_index(shape)  # built once per shape, see Utils.shape_index.topology_index
+    eid = index.edge_id(edge)
+    if eid < 0:
         return None
+    fid = index.face_id(face)
+    for other in index.faces_of_edge(eid):
+        if other != fid:
+            return index.face(other)
+    return None
         
         
 # if __name__ == '__main__':
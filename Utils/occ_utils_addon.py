@@ -1,11 +1,20 @@
 from OCC.Display.qtDisplay import qtViewer3d
 from OCC.Core.AIS import AIS_Shape
 from OCC.Core.TopAbs import TopAbs_FACE
-from OCC.Core.TopoDS import topods_Face
+from OCC.Core.TopoDS import topods_Face, topods
 from OCC.Core.TopLoc import TopLoc_Location  
 from OCC.Core.STEPControl import STEPControl_Writer, STEPControl_AsIs
 from OCC.Core.STEPConstruct import stepconstruct
 from OCC.Core.TCollection import TCollection_HAsciiString
+from OCC.Core.StepRepr import StepRepr_RepresentationItem
+from OCC.Core.Bnd import Bnd_Box
+from OCC.Core.BRepBndLib import brepbndlib_Add
+from OCC.Core.BRepMesh import BRepMesh_IncrementalMesh
+from OCC.Core.BRep import BRep_Tool, BRep_Builder
+from OCC.Core.BRepTools import breptools
+from OCC.Core.TopExp import topexp
+from OCC.Core.TopTools import TopTools_IndexedMapOfShape
+from OCC.Core.Aspect import Aspect_TOD_ABSOLUTE
 from OCC.Extend.DataExchange import read_step_file
 from OCC.Extend.TopologyUtils import TopologyExplorer
 from OCC.Display.qtDisplay import qtViewer3d
@@ -25,6 +34,13 @@ from OCC.Core.V3d import V3d_SpotLight, V3d_XnegYnegZpos
 from OCC.Core.gp import gp_Vec, gp_Pnt
 
 import sys
+import math
+import time
+import numpy as np
+
+from Utils.performance_settings import PERFORMANCE_SETTINGS, mesh_quality_for_size
+from Utils.shape_index import topology_index
+import Utils.occ_utils as occ_utils
 
 def viewer_raytracing(display):
     """Set the viewer to raytracing mode."""
@@ -65,47 +81,234 @@ def list_face(shape):   # Extracts all face elements from a given 3D shape.
 
     return list(topo.faces())
 
-def save_shape(shape, step_path, label_map):
+def mesh_shape(shape, linear_def, angular_def):
+    '''
+    Tessellate shape in parallel over its faces.
+
+    input
+        shape:          TopoDS_Shape
+        linear_def:     float, absolute chordal deflection
+        angular_def:    float, angular deflection in radians
+    output
+        info:   {'linear_def': float, 'angular_def': float, 'seconds': float, 'triangles': int}
+    '''
+    start = time.perf_counter()
+    # the constructor meshes the shape, Perform() would run a second pass
+    BRepMesh_IncrementalMesh(shape, linear_def, False, angular_def, True)
+    seconds = time.perf_counter() - start
+
+    triangles = 0
+    for face in list_face(shape):
+        triangulation = BRep_Tool.Triangulation(face, TopLoc_Location())
+        if triangulation is not None:
+            triangles += triangulation.NbTriangles()
+
+    return {'linear_def': linear_def, 'angular_def': angular_def, 'seconds': seconds, 'triangles': triangles}
+
+
+def mesh_levels(shape):
+    '''
+    Deflections of the progressive display meshes of shape.
+
+    The last level is the mesh_quality tier matching the bounding box diagonal, its
+    angular_def is given in degrees. The first level is a coarse mesh whose deflection
+    scales with the diagonal, so its triangle count does not grow with the part size.
+    The levels in between follow PERFORMANCE_SETTINGS['lod']['refine_steps'].
+
+    input
+        shape:  TopoDS_Shape
+    output
+        tier:       str, key of PERFORMANCE_SETTINGS['mesh_quality']
+        diagonal:   float
+        levels:     [(linear_def, angular_def in radians)], coarse to fine
+    '''
+    bbox = Bnd_Box()
+    brepbndlib_Add(shape, bbox, False)
+    diagonal = 0.0
+    if not bbox.IsVoid():
+        xmin, ymin, zmin, xmax, ymax, zmax = bbox.Get()
+        diagonal = math.sqrt((xmax - xmin) ** 2 + (ymax - ymin) ** 2 + (zmax - zmin) ** 2)
+    tier, settings = mesh_quality_for_size(diagonal)
+    lod = PERFORMANCE_SETTINGS['lod']
+
+    coarse_angular = math.radians(lod['coarse_angular_def'])
+    levels = [(max(diagonal * lod['coarse_fraction'], float(settings['linear_def'])), coarse_angular)]
+    for step in lod['refine_steps']:
+        linear_def = float(settings['linear_def']) * step
+        angular_def = min(math.radians(settings['angular_def'] * step), coarse_angular)
+        # skip steps that would not be finer than the level shown before
+        if linear_def < levels[-1][0] or (linear_def == levels[-1][0] and angular_def < levels[-1][1]):
+            levels.append((linear_def, angular_def))
+    return tier, diagonal, levels
+
+
+def mesh_for_display(shape):
+    '''
+    Tessellate shape with the coarse level of mesh_levels(), the finer levels are
+    meshed afterwards by the viewer.
+
+    input
+        shape:  TopoDS_Shape
+    output
+        info:   {'tier': str, 'diagonal': float, 'levels': [(float, float)], 'level': int,
+                 'linear_def': float, 'angular_def': float (radians), 'seconds': float, 'triangles': int}
+    '''
+    tier, diagonal, levels = mesh_levels(shape)
+    info = mesh_shape(shape, *levels[0])
+    info.update({'tier': tier, 'diagonal': diagonal, 'levels': levels, 'level': 0})
+    return info
+
+
+def face_triangulations(shape):
+    '''
+    Triangulation handles of the faces of shape in topexp.MapShapes order.
+
+    Re-meshing shape gives its faces new Poly_Triangulation objects, the handles taken
+    here keep describing the mesh they were taken from.
+
+    output
+        triangulations: [Poly_Triangulation or None] per face
+    '''
+    faces = TopTools_IndexedMapOfShape()
+    topexp.MapShapes(shape, TopAbs_FACE, faces)
+    return [BRep_Tool.Triangulation(topods.Face(faces.FindKey(i)), TopLoc_Location())
+            for i in range(1, faces.Size() + 1)]
+
+
+def transfer_mesh(triangulations, target):
+    '''
+    Replace the triangulations of target by the ones taken with face_triangulations
+    from a copy of target (BRepBuilderAPI_Copy), which has its faces in the same
+    topexp.MapShapes order. Edge polygons of the old triangulation are removed with it,
+    edges are drawn from their curves afterwards.
+    '''
+    target_faces = TopTools_IndexedMapOfShape()
+    topexp.MapShapes(target, TopAbs_FACE, target_faces)
+    assert len(triangulations) == target_faces.Size()
+
+    breptools.Clean(target)
+    builder = BRep_Builder()
+    for i, triangulation in enumerate(triangulations, 1):
+        if triangulation is not None:
+            builder.UpdateFace(topods.Face(target_faces.FindKey(i)), triangulation)
+
+
+def use_existing_mesh(ais_shape, linear_def, angular_def):
+    '''
+    Make ais_shape draw the triangulation already stored in its shape instead of
+    re-meshing it with the default viewer deflection.
+    '''
+    drawer = ais_shape.Attributes()
+    drawer.SetTypeOfDeflection(Aspect_TOD_ABSOLUTE)
+    drawer.SetMaximalChordialDeviation(linear_def)
+    drawer.SetDeviationAngle(angular_def)
+    drawer.SetAutoTriangulation(False)
+
+
+def save_shape(shape, step_path, face_index, face_labels, label_names):
     """
-    Saves the given shape to a STEP file at 'step_path' with face labels from 'label_map'.
+    Saves the given shape to a STEP file at 'step_path' with the labels of 'face_labels'
+    (indices into 'label_names', one per face id of 'face_index') as face names.
     """
     try:
         print(f"Saving: {step_path}")
-        shape_with_fid_to_step(step_path, shape, label_map)
+        shape_with_fid_to_step(step_path, shape, face_index, face_labels, label_names)
         print(f"Successfully saved: {step_path}")
     except Exception as e:
         print(f"Error saving STEP file: {str(e)}")
 
-def shape_with_fid_to_step(filename, shape, id_map):
+def shape_with_fid_to_step(filename, shape, face_index, face_labels, label_names):
     """Save shape to a STEP file format.
 
     :param filename: Name to save shape as.
     :param shape: Shape to be saved.
-    :param id_map: Variable mapping labels to faces in shape.
+    :param face_index: FaceIndex of shape.
+    :param face_labels: Label index per face id, -1 for unlabeled faces.
+    :param label_names: Names written to the STEP entities of labeled faces.
     """
     writer = STEPControl_Writer()
     writer.Transfer(shape, STEPControl_AsIs)
 
     finderp = writer.WS().TransferWriter().FinderProcess()
-    faces = list_face(shape) # a list of TopoDS_Face objects
     loc = TopLoc_Location() 
 
-    for face in faces:
+    for fid in np.flatnonzero(face_labels >= 0):
+        face = face_index.face(fid)
         item = stepconstruct.FindEntity(finderp, face, loc)
         if item is None:
-            print(f"Warning: Could not find step entities for face {face}")
+            print(f"Warning: No step entities found for face {fid}")
             continue
-        
-        # Ensure that id_map[hash(face)] exists and is not a tuple
-        face_hash = hash(face)
-        if face_hash in id_map and isinstance(id_map[face_hash], str):
-            face_label = id_map[face_hash]
-            item.SetName(TCollection_HAsciiString(str(face_label)))
-            # remove face_hash from id_map
-            del id_map[face_hash]
-    
-    if not id_map:
-        for face_hash in id_map.keys() and id_map[face_hash] is not None:
-            print(f"Warning: No step entities found for face with hash {face_hash}")
+        item.SetName(TCollection_HAsciiString(label_names[face_labels[fid]]))
     
     writer.Write(filename)
+
+def face_labels_from_step(reader, face_index, label_names):
+    """Read the face labels written by shape_with_fid_to_step back from a transferred reader.
+
+    :param reader: STEPControl_Reader the shape of face_index was transferred from.
+    :param face_index: FaceIndex of the transferred shape.
+    :param label_names: Names of the labels.
+    :return: Label index per face id, -1 for faces without a known label.
+    """
+    treader = reader.WS().TransferReader()
+    label_ids = {name: i for i, name in enumerate(label_names)}
+    face_labels = face_index.new_labels()
+
+    for fid in range(len(face_index)):
+        item = treader.EntityFromShapeResult(face_index.face(fid), 1)
+        if item is None:
+            continue
+        item = StepRepr_RepresentationItem.DownCast(item)
+        if item is None or item.Name() is None:
+            continue
+        name = item.Name().ToCString()
+        if name in label_ids:
+            face_labels[fid] = label_ids[name]
+
+    return face_labels
+
+
+def face_graph_arrays(shape, face_index, face_labels):
+    """Face adjacency graph of shape with per-face descriptors, as numpy arrays.
+
+    Nodes are the face ids of face_index, two faces are connected when they share an edge.
+
+    :param shape: TopoDS_Shape of face_index.
+    :param face_index: FaceIndex of the shape.
+    :param face_labels: Label index per face id, -1 for unlabeled faces.
+    :return: {'edge_index': (2, A) int64 COO pairs, both directions,
+              'surface_type': (F,) int8 index into occ_utils.SURFACE_TYPE,
+              'area': (F,) float64, 'centroid': (F, 3) float64,
+              'normal': (F, 3) float64 at the UV center, zero where undefined,
+              'labels': (F,) int16}
+    """
+    topology = topology_index(shape)
+    num_faces = len(face_index)
+    assert topology.fmap.Size() == num_faces
+
+    indptr, neighbours = topology.face_adjacency
+    edge_index = np.stack([np.repeat(np.arange(num_faces), np.diff(indptr)), neighbours]).astype(np.int64)
+
+    # only what the graph stores, the UV projection and boxes of the table are left uncomputed
+    table = topology.face_descriptors(fields=('surface_type', 'area', 'centroid', 'normal'))
+    return {'edge_index': edge_index, 'surface_type': table['surface_type'], 'area': table['area'],
+            'centroid': table['centroid'], 'normal': table['normal'], 'labels': np.asarray(face_labels, dtype=np.int16)}
+
+
+def save_face_graph(shape, npz_path, face_index, face_labels, label_names):
+    """
+    Saves the face adjacency graph of 'shape' with its face descriptors and labels to a
+    compressed .npz at 'npz_path', see face_graph_arrays for the arrays. The names of
+    the labels and surface types are stored as 'label_names' and 'surface_types'.
+    Returns True when the file was written, False on error.
+    """
+    try:
+        print(f"Saving: {npz_path}")
+        arrays = face_graph_arrays(shape, face_index, face_labels)
+        np.savez_compressed(npz_path, label_names=np.array(label_names), surface_types=np.array(occ_utils.SURFACE_TYPE),
+                            **arrays)
+        print(f"Successfully saved: {npz_path}")
+        return True
+    except Exception as e:
+        print(f"Error saving face graph: {str(e)}")
+        return False
@@ -72,4 +72,7 @@ feat_names = ['chamfer', #0
               "rounded_triangular_pocket", #40
               "rounded_rectangular_pocket", #41
               "rounded_six_sides_pocket", #42
-              'stock'] #43
\ No newline at end of file
+              'stock'] #43
+
+# Face labels of the labeling tool, faces store an index into this list
+label_names = ['Hole', 'Slot', 'Pocket', 'Passage', 'Stock', 'Groove', 'Step', 'Chamfer', 'Fillet', 'Wall', 'Wall + Hole']
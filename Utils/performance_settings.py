@@ -10,6 +10,15 @@ PERFORMANCE_SETTINGS = {
         'large': {'linear_def': 5.0, 'angular_def': 10.0},      # For models > 500mm but within a moderate range
         'very_large': {'linear_def': 10, 'angular_def': 50}  # For models that are very large
     },
+    # Progressive display: a coarse mesh is shown first, then refined in the background.
+    # coarse_fraction: linear_def of the coarse mesh as a fraction of the bounding box diagonal.
+    # coarse_angular_def: angular_def of the coarse mesh in degrees.
+    # refine_steps: multiples of the mesh_quality deflections meshed after it, ending with the tier itself.
+    'lod': {
+        'coarse_fraction': 0.01,
+        'coarse_angular_def': 45.0,
+        'refine_steps': [4, 2, 1]
+    },
     'batch_processing': {
         'batch_size': 5000,
         'num_processes': max(os.cpu_count() - 2, 1),
@@ -37,4 +46,26 @@ PERFORMANCE_SETTINGS = {
 
 # max_concurrent_features
 # If your shapes are large or you see out-of-memory errors, lower this.
-# If you want more complexity and have plenty of memory, you can increase it.
\ No newline at end of file
+# If you want more complexity and have plenty of memory, you can increase it.
+
+# Upper bound of the bounding-box diagonal (mm) for each mesh_quality tier, checked in order.
+# Parts larger than the last bound use 'very_large'.
+MESH_QUALITY_SIZES = [('small', 100.0), ('medium', 500.0), ('large', 2000.0)]
+
+
+def mesh_quality_for_size(diagonal):
+    '''
+    Pick the mesh_quality tier for a part.
+
+    input
+        diagonal: float, bounding box diagonal of the part
+    output
+        tier:     str, key of PERFORMANCE_SETTINGS['mesh_quality']
+        settings: {'linear_def': float, 'angular_def': float}, angular_def in degrees
+    '''
+    tier = 'very_large'
+    for name, bound in MESH_QUALITY_SIZES:
+        if diagonal < bound:
+            tier = name
+            break
+    return tier, PERFORMANCE_SETTINGS['mesh_quality'][tier]
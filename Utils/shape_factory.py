@@ -7,9 +7,10 @@ Created on Mon Oct 22 15:57:43 2018
 
 from math import pi
 import random
+import numpy as np
 
 from OCC.Core.BRepBuilderAPI import (BRepBuilderAPI_Transform, BRepBuilderAPI_MakeWire,
-                                BRepBuilderAPI_MakeEdge, BRepBuilderAPI_MakeFace)
+                                BRepBuilderAPI_MakeEdge, BRepBuilderAPI_MakeFace, BRepBuilderAPI_Copy)
 from OCC.Core.BRepFeat import BRepFeat_MakePrism
 from OCC.Core.BRepPrimAPI import BRepPrimAPI_MakePrism
 from OCC.Core.gp import gp_Ax2, gp_Pnt, gp_Dir, gp_Ax1, gp_Trsf, gp_Vec, gp_OZ, gp_Circ
@@ -20,9 +21,14 @@ from OCC.Core.TopoDS import topods_Face
 from OCC.Core.TopAbs import TopAbs_FORWARD, TopAbs_REVERSED
 from OCC.Core.GC import GC_MakeArcOfCircle, GC_MakeSegment
 from OCC.Core.ShapeAnalysis import ShapeAnalysis_Surface
-from OCC.Core.TopTools import TopTools_ListIteratorOfListOfShape
+from OCC.Core.TopTools import (TopTools_ListIteratorOfListOfShape, TopTools_IndexedMapOfShape,
+                               TopTools_ListOfShape)
+from OCC.Core.TopLoc import TopLoc_Location
+from OCC.Core.BRepAlgoAPI import BRepAlgoAPI_Cut, BRepAlgoAPI_Fuse
 from OCC.Core.BRep import BRep_Tool
+
 import Utils.occ_utils as occ_utils
+from Utils.shape_index import topology_index, face_descriptor_of
 
 DRAIN_R = 10.0
 DRAIN_S = 0.5
@@ -186,13 +192,65 @@ def len_seq_natural(pos, pos_list):
     return j - i
 
 
-def list_wire_combo(num_cell, ang, offset, radius):
+def wire_template(func, templates):
+    '''
+        wire of func scaled to the cell size DRAIN_S, placed cells copy it, see placed_wire
+    input
+        func:       one of FLIST except wire_sweep_circle
+        templates:  {function: TopoDS_Wire}, wires already made for the current drain
+    output
+        wire:       TopoDS_Wire
+    '''
+    if func in templates:
+        return templates[func]
+
+    trsf = gp_Trsf()
+    trsf.SetScale(DRAIN_RCS.Location(), DRAIN_S)
+    wire = topods.Wire(BRepBuilderAPI_Transform(func(), trsf).Shape())
+    # wire_triangle2 draws a random apex angle on every call, so only fixed wires are kept
+    if func in (wire_circle, wire_rectangle, wire_triangle3):
+        templates[func] = wire
+    return wire
+
+
+def placed_wire(wire, loc):
+    '''
+        copy of wire placed at loc; every placement gets its own edges, since boolean
+        operations add pcurves and tolerances to the edges of the wires they cut
+    input
+        wire:   TopoDS_Wire
+        loc:    TopLoc_Location
+    output
+        wire:   TopoDS_Wire
+    '''
+    return topods.Wire(BRepBuilderAPI_Copy(wire).Shape()).Moved(loc)
+
+
+def cell_location(radius, angle):
+    '''
+        rigid placement of a cell: move out to radius along the x direction, then rotate about the drain axis
+    input
+        radius: float
+        angle:  float
+    output
+        loc:    TopLoc_Location
+    '''
+    trsf_trans = gp_Trsf()
+    trsf_trans.SetTranslation(gp_Vec(DRAIN_RCS.XDirection()) * radius)
+    trsf = gp_Trsf()
+    trsf.SetRotation(gp_Ax1(DRAIN_RCS.Location(), DRAIN_RCS.Direction()), angle)
+    trsf.Multiply(trsf_trans)
+    return TopLoc_Location(trsf)
+
+
+def list_wire_combo(num_cell, ang, offset, radius, templates):
     '''
     input
        nc:              int, number of cells to be combined
        ang:             float, angle between adjaent cells
        offset:          float, offset angle of start position
        ri:              float, radius of this ring
+       templates:       {function: TopoDS_Wire}, see wire_template
     output
         wlist:          {TopoDS_Wire: string}
         combo_name:     ''
@@ -212,14 +270,7 @@ def list_wire_combo(num_cell, ang, offset, radius):
 #       3 choose a random shape
         func = random.choice(FLIST)
 #        print(pos_list, pos, l, fname[FLIST.index(func)])
-        trsf_scale = gp_Trsf()
-        trsf_scale.SetScale(DRAIN_RCS.Location(), DRAIN_S)
-        trsf_trans = gp_Trsf()
         trans_vec = gp_Vec(DRAIN_RCS.XDirection()) * radius
-        trsf_trans.SetTranslation(trans_vec)
-        trsf_rotate = gp_Trsf()
-        trsf_rotate.SetRotation(gp_Ax1(DRAIN_RCS.Location(), DRAIN_RCS.Direction()),
-                                offset + pos * ang)
         if func == wire_sweep_circle and len_seq > 1:
             cir1 = DRAIN_RCS.Location()
             cir2 = DRAIN_RCS.Location()
@@ -230,13 +281,7 @@ def list_wire_combo(num_cell, ang, offset, radius):
                         offset + (pos + len_seq -1) * ang)
             wire = wire_sweep_circle(cir1, cir2)
         elif func != wire_sweep_circle and len_seq == 1:
-            wire = func()
-            bresp_trsf = BRepBuilderAPI_Transform(wire, trsf_scale)
-            wire = topods.Wire(bresp_trsf.Shape())
-            bresp_trsf = BRepBuilderAPI_Transform(wire, trsf_trans)
-            wire = topods.Wire(bresp_trsf.Shape())
-            bresp_trsf = BRepBuilderAPI_Transform(wire, trsf_rotate)
-            wire = topods.Wire(bresp_trsf.Shape())
+            wire = placed_wire(wire_template(func, templates), cell_location(radius, offset + pos * ang))
         else:
             continue
 
@@ -262,6 +307,8 @@ def list_wire_random():
     #    number of rings
     numr = int((DRAIN_R/4/DRAIN_S-0.5))
     wires = {}
+    # scaled wires of this drain, every placed cell is a copy of one, see placed_wire
+    templates = {}
 
     for i in range(numr):
 #        radius of ith ring
@@ -281,7 +328,7 @@ def list_wire_random():
             offset = 0.
         if offset > ang:
             offset = ang
-        wlist, combo_name = list_wire_combo(combo, ang, offset, radius)
+        wlist, combo_name = list_wire_combo(combo, ang, offset, radius, templates)
         wires.update(wlist)
         wire_name += str(combo) + '(' + combo_name + ')'
         nump = nump // combo
@@ -291,11 +338,9 @@ def list_wire_random():
         for j in range(1, nump):
             trsf = gp_Trsf()
             trsf.SetRotation(gp_Ax1(DRAIN_RCS.Location(), DRAIN_RCS.Direction()), ang * j)
+            loc = TopLoc_Location(trsf)
             for wire in wlist:
-                wname = wlist[wire]
-                bresp_trsf = BRepBuilderAPI_Transform(wire, trsf)
-                wire = topods.Wire(bresp_trsf.Shape())
-                wires[wire] = wname
+                wires[placed_wire(wire, loc)] = wlist[wire]
 
     return wires, wire_name
 
@@ -310,7 +355,7 @@ def face_bottom(shape):
     f_list = occ_utils.list_face(shape)
     face = None
     for face in f_list:
-        normal = occ_utils.normal_to_face_center(face)
+        normal = occ_utils.normal_to_face_center(face, shape)
         if normal.IsEqual(DRAIN_RCS.Direction(), 0.01):
             break
 
@@ -375,10 +420,29 @@ def same_shape_in_list(the_shape, slist):
     return None
 
 
-def ask_face_centroid(face):
+def indexed_face_map(faces):
+    '''
+        hash indexed lookup of faces, FindIndex(face) - 1 is the position of the face
+        in faces (IsSame semantics), -1 if it is not among them
+    input
+        faces:      [TopoDS_Face]
+    output
+        face_map:   TopTools_IndexedMapOfShape
+    '''
+    face_map = TopTools_IndexedMapOfShape()
+    for face in faces:
+        face_map.Add(face)
+    return face_map
+
+
+def ask_face_centroid(face, shape=None):
     """
-    Get centroid of B-Rep face.
+    Get centroid of B-Rep face, from the cached face descriptors of shape if given.
     """
+    row = face_descriptor_of(shape, face, ('centroid',)) if shape is not None else None
+    if row is not None:
+        return tuple(row['centroid'])
+
     from OCC.Core.GProp import GProp_GProps
     from OCC.Core.BRepGProp import brepgprop
     mass_props = GProp_GProps()
@@ -390,7 +454,8 @@ def ask_face_centroid(face):
 
 def ask_point_normal_face(uv, face):
     """
-    Ask the normal vector of a point given the uv coordinate of the point on a face
+    Ask the normal vector of a point given the uv coordinate of the point on a face.
+    The normal at the centroid of a face is cached as 'centroid_normal', see face_descriptor_of.
     """
     face_ds = topods.Face(face)
     surface = BRep_Tool().Surface(face_ds)
@@ -406,7 +471,8 @@ def ask_point_normal_face(uv, face):
 def ask_point_uv2(xyz, face):
     """
     This is a general function which gives the uv coordinates from the xyz coordinates.
-    The uv value is not normalised.
+    The uv value is not normalised. The uv of the centroid of a face is cached as
+    'centroid_uv', see face_descriptor_of.
     """
     gpPnt = gp_Pnt(float(xyz[0]), float(xyz[1]), float(xyz[2]))
     surface = BRep_Tool().Surface(face)
@@ -445,35 +511,39 @@ def map_from_shape_and_name(fmap, old_labels, new_shape, new_name, feature_dir=N
     else:
         assert False, 'Invalid map type: %s' % type(old_labels)
 
-    new_faces = occ_utils.list_face(new_shape)
-    new_faces_backup = occ_utils.list_face(new_shape)
-    
+    all_faces = occ_utils.list_face(new_shape)
+    face_map = indexed_face_map(all_faces)
+    claimed = [False] * len(all_faces)
+
     # after making, some original faces has been modified
     for oldf in fmap:
         old_seg_name = seg_map[oldf]
         old_bottom_name = bottom_map[oldf]
-        for samef in fmap[oldf]:            
-            samef = same_shape_in_list(samef, new_faces)            
-            if samef is None:
+        for samef in fmap[oldf]:
+            idx = face_map.FindIndex(samef) - 1
+            if idx < 0 or claimed[idx]:
                 print('no same face')
                 continue
+            samef = all_faces[idx]
             # update segmantic label
             new_map[samef] = old_seg_name
             # update bottom face label
             new_bottom_label[samef] = old_bottom_name
-            new_faces.remove(samef)
-    
+            claimed[idx] = True
+
+    new_faces = [face for face, is_claimed in zip(all_faces, claimed) if not is_claimed]
+    if feature_dir:
+        index = topology_index(new_shape)
+        table = index.face_descriptors([index.face_id(face) for face in new_faces], ('centroid_normal',))
     # new added faces are belong to new feature
     for n_face in new_faces:
         new_map[n_face] = new_name
         # determine machning feature fead direction
         # the normal vector of bottom face is parallel to the machning fead direction
         if feature_dir:
-            centroid = ask_face_centroid(n_face)
-            uv = ask_point_uv2(centroid, n_face)
-            norm_vec = ask_point_normal_face(uv, n_face)
-            norm_vec = occ_utils.as_occ(norm_vec, gp_Dir)
-            isParallel = feature_dir.IsParallel(norm_vec, 1e-6)
+            # normal at the centroid, as ask_point_normal_face(ask_point_uv2(ask_face_centroid(f)))
+            norm_vec = table['centroid_normal'][index.face_id(n_face)]
+            isParallel = bool(np.any(norm_vec)) and feature_dir.IsParallel(occ_utils.as_occ(norm_vec, gp_Dir), 1e-6)
             new_bottom_label[n_face] = int(isParallel)
         else: # no direction feature, such as charmder and round
             new_bottom_label[n_face] = 0
@@ -486,12 +556,12 @@ def map_from_shape_and_name(fmap, old_labels, new_shape, new_name, feature_dir=N
                 if old_face not in fmap:
                     print('mssing old face, which may be deleted')
                     continue
-                for same_face in fmap[old_face]:            
-                    same_face = same_shape_in_list(same_face, new_faces_backup)            
-                    if same_face is None:
+                for same_face in fmap[old_face]:
+                    idx = face_map.FindIndex(same_face) - 1
+                    if idx < 0:
                         print('no same face')
                         continue
-                    new_inst.append(same_face)
+                    new_inst.append(all_faces[idx])
             ins_label[ins_idx] = new_inst
     # add new instance faces
     ins_label.append(new_faces)
@@ -500,6 +570,25 @@ def map_from_shape_and_name(fmap, old_labels, new_shape, new_name, feature_dir=N
 
 
 
+def random_feat_type():
+    '''
+    output
+        ftype:      string, one of FEAT_TYPE
+        direction:  gp_Dir, feed direction from the bottom face
+        fuse:       bool, the feature adds material
+        length:     float, feature depth
+    '''
+    # shuffle a copy, so the draw only depends on the random state and not on earlier calls
+    feat_types = list(FEAT_TYPE)
+    random.shuffle(feat_types)
+    ftype = random.choice(feat_types)
+    if ftype == 'hole':
+        return ftype, DRAIN_RCS.Direction(), False, DRAIN_T
+    if ftype == 'blind':
+        return ftype, DRAIN_RCS.Direction(), False, DRAIN_T / 2
+    return ftype, -DRAIN_RCS.Direction(), True, DRAIN_T / 2
+
+
 def shape_multiple_hole_feats(base, wlist):
     '''
         one face and one hole feature for each wire
@@ -512,20 +601,7 @@ def shape_multiple_hole_feats(base, wlist):
         ftype:      ''
     '''
     b_face = face_bottom(base)
-    random.shuffle(FEAT_TYPE)
-    ftype = random.choice(FEAT_TYPE)
-    if ftype == 'hole':
-        direction = DRAIN_RCS.Direction()
-        fuse = False
-        length = DRAIN_T
-    elif ftype == 'blind':
-        direction = DRAIN_RCS.Direction()
-        fuse = False
-        length = DRAIN_T / 2
-    else:
-        direction = -DRAIN_RCS.Direction()
-        fuse = True
-        length = DRAIN_T / 2
+    ftype, direction, fuse, length = random_feat_type()
 
     base_map = map_from_name(base, LABEL_INDEX['base'])
     for wire in wlist:
@@ -547,6 +623,70 @@ def shape_multiple_hole_feats(base, wlist):
     return base, base_map, ftype
 
 
+def shape_multiple_hole_feats_batch(base, wlist):
+    '''
+        all wires applied with one boolean operation, with the labels propagated once through
+        the history of the operation; meant to match shape_multiple_hole_feats in face count,
+        volume and per label face counts, benchmarks/bench_drain_feats.py checks this
+    input
+        base:       TopoDS_Shape
+        wlist:      {TopoDS_Wire:string}
+    output
+        base:       TopoDS_Shape
+        name_map:   {TopoDS_Face:int}
+        ftype:      ''
+    '''
+    ftype, direction, fuse, length = random_feat_type()
+    base_map = map_from_name(base, LABEL_INDEX['base'])
+    if len(wlist) == 0:
+        return base, base_map, ftype
+
+    # every tool starts half the thickness behind the bottom face (inside the base for bosses),
+    # so no tool face is coplanar with a face of the base
+    depth = 2 * DRAIN_T if ftype == 'hole' else DRAIN_T / 2 + length
+    trsf = gp_Trsf()
+    trsf.SetTranslation(gp_Vec(direction) * (-DRAIN_T / 2))
+    loc = TopLoc_Location(trsf)
+
+    tools = []
+    tool_list = TopTools_ListOfShape()
+    for wire in wlist:
+        face_p = BRepBuilderAPI_MakeFace(wire).Face()
+        tool = BRepPrimAPI_MakePrism(face_p, gp_Vec(direction) * depth).Shape().Moved(loc)
+        tools.append((tool, LABEL_INDEX[ftype + '_' + wlist[wire]]))
+        tool_list.Append(tool)
+
+    arg_list = TopTools_ListOfShape()
+    arg_list.Append(base)
+    feature_maker = BRepAlgoAPI_Fuse() if fuse else BRepAlgoAPI_Cut()
+    feature_maker.SetArguments(arg_list)
+    feature_maker.SetTools(tool_list)
+    feature_maker.Build()
+    assert feature_maker.IsDone(), 'boolean operation failed for %d %s features' % (len(tools), ftype)
+    shape = feature_maker.Shape()
+
+    fmap = map_face_before_and_after_feat(base, feature_maker)
+    new_map, ins_label, bottom_label = map_from_shape_and_name(fmap, base_map, shape, LABEL_INDEX['other'])
+
+    # faces from the tools replace the single instance map_from_shape_and_name gives to all new faces
+    all_faces = occ_utils.list_face(shape)
+    face_map = indexed_face_map(all_faces)
+    ins_label.pop()
+    for tool, label in tools:
+        fmap = map_face_before_and_after_feat(tool, feature_maker)
+        inst = []
+        for tool_face in fmap:
+            for result_face in fmap[tool_face]:
+                idx = face_map.FindIndex(result_face) - 1
+                if idx < 0:
+                    continue
+                new_map[all_faces[idx]] = label
+                inst.append(all_faces[idx])
+        ins_label.append(inst)
+
+    return shape, (new_map, ins_label, bottom_label), ftype
+
+
 # def shape_base_drain():
 #     '''
 #     output
@@ -587,8 +727,11 @@ def shape_base_drain():
 
 
 
-def shape_drain():
+def shape_drain(seed=None, batch=False):
     '''
+    input
+        seed:           int, seed of the random module, fresh system entropy if None
+        batch:          bool, add all features with one boolean operation (shape_multiple_hole_feats_batch)
     output
         shape:          TopoDS_Shape
         face_map:       {TopoDS_Face: int}
@@ -596,7 +739,7 @@ def shape_drain():
         shape_name:     ''
     '''
 #    print('shape_drain')
-    random.seed()
+    random.seed(seed)
 #    step1, create the base
     base = shape_base_drain()
 
@@ -604,7 +747,10 @@ def shape_drain():
     wlist, wire_name = list_wire_random()
 
 #    step3, add hole feature from wire
-    shape, name_map, feat_name = shape_multiple_hole_feats(base, wlist)
+    if batch:
+        shape, name_map, feat_name = shape_multiple_hole_feats_batch(base, wlist)
+    else:
+        shape, name_map, feat_name = shape_multiple_hole_feats(base, wlist)
 
     shape_name = feat_name + '-' + wire_name
 
@@ -0,0 +1,382 @@
+"""
+Integer indices for the sub-shapes of a TopoDS_Shape.
+"""
+from collections import OrderedDict
+
+import numpy as np
+
+from OCC.Core.Bnd import Bnd_Box
+from OCC.Core.BRep import BRep_Tool
+from OCC.Core.BRepAdaptor import BRepAdaptor_Surface
+from OCC.Core.BRepBndLib import brepbndlib_Add
+from OCC.Core.BRepGProp import brepgprop
+from OCC.Core.BRepTools import breptools
+from OCC.Core.GeomLProp import GeomLProp_SLProps
+from OCC.Core.GProp import GProp_GProps
+from OCC.Core.ShapeAnalysis import ShapeAnalysis_Surface
+from OCC.Core.TopAbs import TopAbs_FACE, TopAbs_EDGE, TopAbs_VERTEX, TopAbs_REVERSED
+from OCC.Core.TopExp import TopExp_Explorer, topexp
+from OCC.Core.TopTools import TopTools_IndexedMapOfShape
+from OCC.Core.TopoDS import topods
+from OCC.Core.gp import gp_Pnt
+
+
+class FaceIndex:
+    '''
+    Maps every face of a shape to a 0-based integer id.
+
+    Ids follow topexp.MapShapes order, so they are deterministic for a given shape.
+    Lookups go through the indexed map (IsSame semantics) instead of hash(face).
+    '''
+    def __init__(self, shape):
+        self.shape = shape
+        self.fmap = TopTools_IndexedMapOfShape()
+        topexp.MapShapes(shape, TopAbs_FACE, self.fmap)
+        self._boxes = None
+
+    def __len__(self):
+        return self.fmap.Size()
+
+    def index(self, face):
+        '''
+        input
+            face: TopoDS_Face
+        output
+            fid: int, -1 if face does not belong to the shape
+        '''
+        return self.fmap.FindIndex(face) - 1
+
+    def face(self, fid):
+        '''
+        input
+            fid: int, numpy integers are accepted
+        output
+            face: TopoDS_Face
+        '''
+        return topods.Face(self.fmap.FindKey(int(fid) + 1))
+
+    def faces(self):
+        return [self.face(fid) for fid in range(len(self))]
+
+    def boxes(self):
+        '''
+        Axis aligned bounding box of every face, computed on first use.
+
+        output
+            boxes: np.ndarray (F, 6) of [xmin, ymin, zmin, xmax, ymax, zmax] per face id,
+                   NaN rows for faces without a box
+        '''
+        if self._boxes is None:
+            boxes = np.full((len(self), 6), np.nan)
+            for fid in range(len(self)):
+                bbox = Bnd_Box()
+                brepbndlib_Add(self.fmap.FindKey(int(fid) + 1), bbox, True)
+                if not bbox.IsVoid():
+                    boxes[fid] = bbox.Get()
+            self._boxes = boxes
+        return self._boxes
+
+    def new_labels(self):
+        '''
+        output
+            labels: np.ndarray(int16) with one entry per face, -1 for unlabeled faces
+        '''
+        return np.full(len(self), -1, dtype=np.int16)
+
+
+# one row per face id of TopologyIndex.face_descriptors()
+FACE_DESCRIPTOR_DTYPE = np.dtype([
+    ('surface_type', np.int8),              # GeomAbs_SurfaceType, index into occ_utils.SURFACE_TYPE
+    ('area', np.float64),
+    ('centroid', np.float64, (3,)),
+    ('normal', np.float64, (3,)),           # at the center of the UV bounds, zero where undefined
+    ('centroid_uv', np.float64, (2,)),      # centroid projected to the surface
+    ('centroid_normal', np.float64, (3,)),  # at centroid_uv, zero where undefined
+    ('box', np.float64, (6,)),              # [xmin, ymin, zmin, xmax, ymax, zmax], NaN if void
+])
+
+
+def _surface_normal(surface, u, v, tolerance, reversed_face):
+    props = GeomLProp_SLProps(surface, u, v, 1, tolerance)
+    if not props.IsNormalDefined():
+        return (0.0, 0.0, 0.0)
+    normal = props.Normal()
+    if reversed_face:
+        normal.Reverse()
+    return normal.Coord()
+
+
+# FACE_DESCRIPTOR_DTYPE fields by the group of OCC queries that computes them, in computation order
+DESCRIPTOR_GROUPS = [
+    ('surface_type', ('surface_type',)),
+    ('mass', ('area', 'centroid')),
+    ('normal', ('normal',)),
+    ('centroid_uv', ('centroid_uv', 'centroid_normal')),    # needs the centroid of 'mass'
+    ('box', ('box',)),
+]
+GROUP_OF_FIELD = {field: group for group, fields in DESCRIPTOR_GROUPS for field in fields}
+
+
+def descriptor_groups(fields=None):
+    '''
+    input
+        fields: [str], FACE_DESCRIPTOR_DTYPE field names, all by default
+    output
+        groups: [int], indices into DESCRIPTOR_GROUPS computing the fields, in computation order
+    '''
+    names = {GROUP_OF_FIELD[field] for field in (fields if fields is not None else GROUP_OF_FIELD)}
+    if 'centroid_uv' in names:
+        names.add('mass')
+    return [i for i, (group, _) in enumerate(DESCRIPTOR_GROUPS) if group in names]
+
+
+def face_descriptor(face, row, groups=None):
+    '''
+    Fill the fields of one FACE_DESCRIPTOR_DTYPE row with the descriptors of face.
+
+    input
+        face:   TopoDS_Face
+        row:    np.void of FACE_DESCRIPTOR_DTYPE
+        groups: [int], indices into DESCRIPTOR_GROUPS to compute, see descriptor_groups,
+                all by default. 'centroid_uv' reads the centroid already in row.
+    '''
+    names = {DESCRIPTOR_GROUPS[i][0] for i in (groups if groups is not None else range(len(DESCRIPTOR_GROUPS)))}
+    reversed_face = face.Orientation() == TopAbs_REVERSED
+    surface = BRep_Tool.Surface(face) if names & {'normal', 'centroid_uv'} else None
+
+    if 'surface_type' in names:
+        row['surface_type'] = BRepAdaptor_Surface(face).GetType()
+
+    if 'mass' in names:
+        props = GProp_GProps()
+        brepgprop.SurfaceProperties(face, props)
+        row['area'] = props.Mass()
+        row['centroid'] = props.CentreOfMass().Coord()
+
+    if 'normal' in names:
+        u_min, u_max, v_min, v_max = breptools.UVBounds(face)
+        row['normal'] = _surface_normal(surface, (u_min + u_max) / 2., (v_min + v_max) / 2., 0.01, reversed_face)
+
+    if 'centroid_uv' in names:
+        uv = ShapeAnalysis_Surface(surface).ValueOfUV(gp_Pnt(*row['centroid']), 0.01).Coord()
+        row['centroid_uv'] = uv
+        row['centroid_normal'] = _surface_normal(surface, uv[0], uv[1], 1e-6, reversed_face)
+
+    if 'box' in names:
+        bbox = Bnd_Box()
+        brepbndlib_Add(face, bbox, True)
+        row['box'] = bbox.Get() if not bbox.IsVoid() else np.nan
+
+
+def _csr(rows, cols, num_rows):
+    '''
+    input
+        rows, cols: np.ndarray (N,) int, COO pairs
+        num_rows:   int
+    output
+        indptr:     np.ndarray (num_rows + 1,) int64
+        indices:    np.ndarray (N,) int32, cols grouped by row, ascending within a row
+    '''
+    order = np.lexsort((cols, rows))
+    indptr = np.zeros(num_rows + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=num_rows), out=indptr[1:])
+    return indptr, np.asarray(cols, dtype=np.int32)[order]
+
+
+class TopologyIndex:
+    '''
+    Face / edge / vertex incidence of a shape as integer CSR arrays.
+
+    Ids are 0-based and follow topexp.MapShapes order, so face ids match FaceIndex.
+    Every relation is stored as an (indptr, indices) pair: the neighbours of row i are
+    indices[indptr[i]:indptr[i + 1]]. Build it through topology_index(shape), which
+    caches the index per shape.
+    '''
+    def __init__(self, shape):
+        self.shape = shape
+        self._descriptors = None
+        self._described = None
+        self.fmap = TopTools_IndexedMapOfShape()
+        self.emap = TopTools_IndexedMapOfShape()
+        self.vmap = TopTools_IndexedMapOfShape()
+        topexp.MapShapes(shape, TopAbs_FACE, self.fmap)
+        topexp.MapShapes(shape, TopAbs_EDGE, self.emap)
+        topexp.MapShapes(shape, TopAbs_VERTEX, self.vmap)
+        num_faces, num_edges, num_verts = self.fmap.Size(), self.emap.Size(), self.vmap.Size()
+
+        # face -> edge incidences, each edge once per face
+        fe_faces = []
+        fe_edges = []
+        for fid in range(num_faces):
+            edges = set()
+            exp = TopExp_Explorer(self.fmap.FindKey(int(fid) + 1), TopAbs_EDGE)
+            while exp.More():
+                edges.add(self.emap.FindIndex(exp.Current()) - 1)
+                exp.Next()
+            fe_faces.extend([fid] * len(edges))
+            fe_edges.extend(edges)
+        fe_faces = np.array(fe_faces, dtype=np.int64)
+        fe_edges = np.array(fe_edges, dtype=np.int64)
+        self.face_edges = _csr(fe_faces, fe_edges, num_faces)
+        self.edge_faces = _csr(fe_edges, fe_faces, num_edges)
+
+        # edge -> end vertices, closed edges list their vertex twice
+        self.edge_vertices = np.full((num_edges, 2), -1, dtype=np.int32)
+        for eid in range(num_edges):
+            edge = topods.Edge(self.emap.FindKey(int(eid) + 1))
+            first, last = topexp.FirstVertex(edge), topexp.LastVertex(edge)
+            if not first.IsNull():
+                self.edge_vertices[eid, 0] = self.vmap.FindIndex(first) - 1
+            if not last.IsNull():
+                self.edge_vertices[eid, 1] = self.vmap.FindIndex(last) - 1
+        ev_edges = np.repeat(np.arange(num_edges), 2)
+        ev_verts = self.edge_vertices.ravel().astype(np.int64)
+        keep = ev_verts >= 0
+        keep[1::2] &= self.edge_vertices[:, 1] != self.edge_vertices[:, 0]
+        self.vertex_edges = _csr(ev_verts[keep], ev_edges[keep], num_verts)
+
+        # face -> vertex through its edges
+        fv_faces = np.repeat(fe_faces, 2)
+        fv_verts = self.edge_vertices[fe_edges].ravel().astype(np.int64)
+        pairs = np.unique(fv_faces[fv_verts >= 0] * num_verts + fv_verts[fv_verts >= 0])
+        self.face_vertices = _csr(pairs // max(num_verts, 1), pairs % max(num_verts, 1), num_faces)
+
+        # face -> faces sharing an edge: join the incidences of every edge with each other
+        indptr, faces = self.edge_faces
+        sizes = np.diff(indptr)
+        group_start = np.repeat(indptr[:-1], sizes)
+        group_size = np.repeat(sizes, sizes)
+        first = np.repeat(np.arange(len(faces)), group_size)
+        second = np.repeat(group_start, group_size) + (np.arange(len(first)) - np.repeat(np.cumsum(group_size) - group_size, group_size))
+        a, b = faces[first].astype(np.int64), faces[second].astype(np.int64)
+        pairs = np.unique(a[a != b] * num_faces + b[a != b])
+        self.face_adjacency = _csr(pairs // max(num_faces, 1), pairs % max(num_faces, 1), num_faces)
+
+    @staticmethod
+    def _row(csr, i):
+        indptr, indices = csr
+        return indices[indptr[i]:indptr[i + 1]]
+
+    def face_id(self, face):
+        return self.fmap.FindIndex(face) - 1
+
+    def edge_id(self, edge):
+        return self.emap.FindIndex(edge) - 1
+
+    def vertex_id(self, vert):
+        return self.vmap.FindIndex(vert) - 1
+
+    def face(self, fid):
+        return topods.Face(self.fmap.FindKey(int(fid) + 1))
+
+    def edge(self, eid):
+        return topods.Edge(self.emap.FindKey(int(eid) + 1))
+
+    def vertex(self, vid):
+        return topods.Vertex(self.vmap.FindKey(int(vid) + 1))
+
+    def edges_of_face(self, fid):
+        return self._row(self.face_edges, fid)
+
+    def faces_of_edge(self, eid):
+        return self._row(self.edge_faces, eid)
+
+    def edges_of_vertex(self, vid):
+        return self._row(self.vertex_edges, vid)
+
+    def vertices_of_face(self, fid):
+        return self._row(self.face_vertices, fid)
+
+    def adjacent_faces(self, fid):
+        return self._row(self.face_adjacency, fid)
+
+    def face_descriptors(self, fids=None, fields=None):
+        '''
+        Geometric descriptors of the faces, every field of a row computed on its first request.
+
+        input
+            fids:   [int], face ids that are needed, all faces by default
+            fields: [str], FACE_DESCRIPTOR_DTYPE fields that are needed, all by default
+        output
+            table:  np.ndarray (F,) of FACE_DESCRIPTOR_DTYPE indexed by face id, fields that
+                    were never requested are zero
+        '''
+        if self._descriptors is None:
+            self._descriptors = np.zeros(self.fmap.Size(), dtype=FACE_DESCRIPTOR_DTYPE)
+            self._described = np.zeros((self.fmap.Size(), len(DESCRIPTOR_GROUPS)), dtype=bool)
+        fids = np.arange(self.fmap.Size()) if fids is None else np.asarray(fids, dtype=np.int64)
+        groups = descriptor_groups(fields)
+        for fid in fids[~self._described[fids][:, groups].all(axis=1)]:
+            missing = [g for g in groups if not self._described[fid, g]]
+            face_descriptor(self.face(fid), self._descriptors[fid], missing)
+            self._described[fid, missing] = True
+        return self._descriptors
+
+
+TOPOLOGY_CACHE_SIZE = 8
+_topology_cache = OrderedDict() # {hash(shape): TopologyIndex}, least recently used first
+
+
+def topology_index(shape):
+    '''
+    TopologyIndex of shape, reused while shape is among the TOPOLOGY_CACHE_SIZE most
+    recently indexed shapes.
+
+    input
+        shape:  TopoDS_Shape
+    output
+        index:  TopologyIndex
+    '''
+    key = hash(shape)
+    index = _topology_cache.get(key)
+    if index is not None and index.shape.IsSame(shape):
+        _topology_cache.move_to_end(key)
+        return index
+
+    index = TopologyIndex(shape)
+    _topology_cache[key] = index
+    _topology_cache.move_to_end(key)
+    while len(_topology_cache) > TOPOLOGY_CACHE_SIZE:
+        _topology_cache.popitem(last=False)
+    return index
+
+
+def invalidate_topology_index(shape=None):
+    '''
+    Drop the cached TopologyIndex (and its face descriptors) of shape, or of every shape
+    if shape is None. Shapes rebuilt by a modeling operation get a new index on their own,
+    this is only needed after editing a shape in place, e.g. with BRep_Builder.
+    '''
+    if shape is None:
+        _topology_cache.clear()
+        return
+    index = _topology_cache.get(hash(shape))
+    if index is not None and index.shape.IsSame(shape):
+        del _topology_cache[hash(shape)]
+
+
+def face_descriptor_of(shape, face, fields=None):
+    '''
+    Cached descriptors of one face of shape, with the normals in the orientation of face.
+
+    The table holds the normals of the face as it is mapped in shape, face may be the same
+    face with the other orientation, e.g. the face of a reversed shell.
+
+    input
+        shape:  TopoDS_Shape
+        face:   TopoDS_Face
+        fields: [str], FACE_DESCRIPTOR_DTYPE fields that are needed, all by default
+    output
+        row:    np.void of FACE_DESCRIPTOR_DTYPE, None if face does not belong to shape
+    '''
+    index = topology_index(shape)
+    fid = index.face_id(face)
+    if fid < 0:
+        return None
+    row = index.face_descriptors([fid], fields)[fid]
+    if (face.Orientation() == TopAbs_REVERSED) == (index.face(fid).Orientation() == TopAbs_REVERSED):
+        return row
+    row = row.copy()
+    row['normal'] = -row['normal']
+    row['centroid_normal'] = -row['centroid_normal']
+    return row
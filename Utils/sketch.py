@@ -51,7 +51,19 @@ def triangulation_from_face(face):
     return pts, triangles, vt_map, et_map
 
 
-def triangles_from_faces(faces):
+def triangles_from_faces(faces, parallel=False):
+    '''
+    input
+        faces:      [TopoDS_Face], meshed
+        parallel:   bool, read the faces in shards with occ_utils.triangulation_arrays_sharded
+    output
+        tri_list:   [([float,float,float], [float,float,float], [float,float,float])]
+    '''
+    if parallel:
+        pts, _, triangles, _ = occ_utils.triangulation_arrays_sharded(list(faces), with_uvs=False)
+        # same corner order as triangulation_from_face
+        return [tuple(tri) for tri in pts[np.sort(triangles, axis=1)].tolist()]
+
     tri_list = []
     for face in faces:
         pts, triangles, vt_map, et_map = triangulation_from_face(face)
@@ -0,0 +1,134 @@
+"""
+Benchmark of the drain feature modes of Utils/shape_factory.py: one BRepFeat_MakePrism per wire
+(shape_multiple_hole_feats) against one boolean operation for all wires (shape_multiple_hole_feats_batch).
+
+    python benchmarks/bench_drain_feats.py [--radius 30] [--seeds 0 1 2] [--ftypes hole boss] [--output results.json]
+
+The number of wires grows with the drain radius, the default radius gives 200+ holes. Both modes
+run on the same base and wire list for every feature type in --ftypes. When both modes run, the
+face count, volume and per label face counts of the batch result are checked against the
+sequential one, mismatches are reported and make the script exit with status 1.
+"""
+import argparse
+import collections
+import datetime
+import json
+import os
+import platform
+import random
+import sys
+import time
+
+from OCC.Core.BRepGProp import brepgprop
+from OCC.Core.GProp import GProp_GProps
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import Utils.occ_utils as occ_utils
+import Utils.shape_factory as shape_factory
+
+MODES = {
+    'sequential': shape_factory.shape_multiple_hole_feats,
+    'batch': shape_factory.shape_multiple_hole_feats_batch,
+}
+
+
+def label_counts(shape, name_map):
+    '''
+    output
+        counts:     {label: number of faces}
+        instances:  int, number of feature instances
+    '''
+    seg_map, ins_label = (name_map[0], name_map[1]) if isinstance(name_map, tuple) else (name_map, [])
+    counts = collections.Counter(seg_map.get(face, shape_factory.LABEL_INDEX['other'])
+                                 for face in occ_utils.list_face(shape))
+    return dict(sorted(counts.items())), len(ins_label)
+
+
+def volume(shape):
+    props = GProp_GProps()
+    brepgprop.VolumeProperties(shape, props)
+    return props.Mass()
+
+
+def run_mode(mode, seed, ftype):
+    random.seed(seed)
+    base = shape_factory.shape_base_drain()
+    wlist, _ = shape_factory.list_wire_random()
+
+    # a single feature type makes random_feat_type return it
+    feat_types = shape_factory.FEAT_TYPE
+    shape_factory.FEAT_TYPE = [ftype]
+    try:
+        start = time.perf_counter()
+        shape, name_map, ftype = MODES[mode](base, wlist)
+        seconds = time.perf_counter() - start
+    finally:
+        shape_factory.FEAT_TYPE = feat_types
+
+    counts, instances = label_counts(shape, name_map)
+    return {'mode': mode, 'seed': seed, 'ftype': ftype, 'wires': len(wlist), 'seconds': seconds,
+            'faces': len(occ_utils.list_face(shape)), 'volume': volume(shape), 'instances': instances,
+            'label_counts': counts}
+
+
+def mismatches(sequential, batch, rel_tol=1e-6):
+    '''
+    output
+        problems:   [str], differences of the batch result from the sequential one
+    '''
+    problems = []
+    for key in ('faces', 'instances', 'label_counts'):
+        if sequential[key] != batch[key]:
+            problems.append(f"{key} {batch[key]} != {sequential[key]}")
+    if abs(sequential['volume'] - batch['volume']) > rel_tol * abs(sequential['volume']):
+        problems.append(f"volume {batch['volume']:.6f} != {sequential['volume']:.6f}")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--radius', type=float, default=30.0, help='drain radius, shape_factory.DRAIN_R')
+    parser.add_argument('--seeds', type=int, nargs='+', default=[0, 1, 2])
+    parser.add_argument('--modes', nargs='+', choices=list(MODES), default=list(MODES))
+    parser.add_argument('--ftypes', nargs='+', choices=shape_factory.FEAT_TYPE, default=shape_factory.FEAT_TYPE)
+    parser.add_argument('--output', default='bench_drain_feats.json')
+    args = parser.parse_args()
+
+    shape_factory.DRAIN_R = args.radius
+    results = []
+    failures = []
+    for seed in args.seeds:
+        for ftype in args.ftypes:
+            by_mode = {}
+            for mode in args.modes:
+                result = run_mode(mode, seed, ftype)
+                results.append(result)
+                by_mode[mode] = result
+                print(f"seed {seed:<4}{mode:<12}{result['ftype']:<7}{result['wires']:>5} wires  "
+                      f"{result['faces']:>6} faces  {result['seconds']:10.3f} s")
+                print(f"    labels {result['label_counts']}, {result['instances']} instances")
+            if len(by_mode) == len(MODES):
+                problems = mismatches(by_mode['sequential'], by_mode['batch'])
+                for problem in problems:
+                    print(f"    MISMATCH {problem}")
+                if problems:
+                    failures.append({'seed': seed, 'ftype': ftype, 'problems': problems})
+
+    report = {
+        'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'args': vars(args),
+        'results': results,
+        'mismatches': failures,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+    if failures:
+        print(f"{len(failures)} runs of the batch mode differ from the sequential mode")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
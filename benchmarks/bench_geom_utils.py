@@ -0,0 +1,161 @@
+"""
+Benchmark of the geometry kernels in Utils/geom_utils.py (NumPy), Utils/geom_utils_numba.py
+(numba, single and batched) and Utils/bvh_numba.py on synthetic meshes and point sets.
+
+    python benchmarks/bench_geom_utils.py [--sizes 1000 10000 100000] [--output results.json]
+
+Every case is timed on its first call, then --repeat more times. The kernels are compiled
+with cache=True, so the first call loads them from numba's on-disk cache when it is filled
+(e.g. by python -m Utils.numba_warmup) and only compiles on a cold cache. To measure the
+compilation itself, run with an empty cache directory:
+
+    NUMBA_CACHE_DIR=$(mktemp -d) python benchmarks/bench_geom_utils.py
+
+The results are written as JSON so runs can be compared over time.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+
+import numba as nb
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import Utils.geom_utils as gu
+import Utils.geom_utils_numba as gun
+import Utils.bvh_numba as bvh_numba
+
+
+def synthetic_mesh(rng, num_triangles):
+    '''Small random triangles scattered in a 100 x 100 x 100 box.'''
+    centers = rng.random((num_triangles, 1, 3)) * 100
+    return centers + rng.normal(size=(num_triangles, 3, 3))
+
+
+def synthetic_rays(rng, num_rays):
+    return rng.random((num_rays, 3)) * 100, rng.normal(size=(num_rays, 3))
+
+
+def synthetic_polygon(num_verts):
+    '''Regular polygon of radius 50 in the z = 0 plane, counter-clockwise.'''
+    angles = np.linspace(0, 2 * np.pi, num_verts, endpoint=False)
+    return np.c_[50 * np.cos(angles), 50 * np.sin(angles), np.zeros(num_verts)]
+
+
+def synthetic_points(rng, num_points):
+    return np.c_[rng.uniform(-60, 60, (num_points, 2)), np.zeros(num_points)]
+
+
+def time_case(func, args, repeat):
+    start = time.perf_counter()
+    func(*args)
+    first = time.perf_counter() - start
+
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        times.append(time.perf_counter() - start)
+    return {'first_call_jit_or_cache_load_s': first, 'min_s': min(times), 'median_s': statistics.median(times)}
+
+
+def cases(rng, size, max_python):
+    '''
+    output
+        [(kernel, implementation, func, args)] for one problem size
+    '''
+    tris = synthetic_mesh(rng, size)
+    origins, directions = synthetic_rays(rng, 64)
+    origin, direction = origins[0], directions[0]
+    # a slice of tris would be an A-layout array, which the warmed up C-layout signature does not cover
+    segs = np.ascontiguousarray(tris[:, :2])
+    points = synthetic_points(rng, size)
+    square = np.array([[-20, 20, 0], [-20, -20, 0], [20, -20, 0], [20, 20, 0]], dtype=np.float64)
+    polygon = synthetic_polygon(200)
+    python_ok = size <= max_python
+
+    result = []
+    if python_ok:
+        result.append(('ray_triangle_set_intersect', 'numpy', gu.ray_triangle_set_intersect, (origin, direction, tris)))
+    result += [
+        ('ray_triangle_set_intersect', 'numba', gun.ray_triangle_set_intersect, (origin, direction, tris)),
+        ('ray_triangle_set_intersect x64', 'numba_batched', gun.ray_triangle_set_intersect_batch, (origins, directions, tris)),
+        ('ray_triangle_set_intersect x64', 'bvh_batched', lambda o, d, t: bvh_numba.bvh_closest_hits(bvh_numba.build_bvh(t), o, d),
+         (origins, directions, tris)),
+    ]
+    bvh = bvh_numba.build_bvh(tris)
+    result.append(('ray_triangle_set_intersect x64', 'bvh_batched_prebuilt', bvh_numba.bvh_closest_hits, (bvh, origins, directions)))
+
+    if python_ok:
+        result.append(('ray_segment_set_intersect', 'numpy', gu.ray_segment_set_intersect, (origin, direction, segs)))
+    result.append(('ray_segment_set_intersect', 'numba', gun.ray_segment_set_intersect, (origin, direction, segs)))
+
+    result += [
+        ('points_in_polygon', 'numpy', gu.points_in_polygon, (points, polygon)),
+        ('points_in_polygon', 'numba', gun.points_in_polygon, (points, polygon)),
+    ]
+
+    # grid spacing chosen so the rectangle holds about size points
+    resolution = 100.0 / np.sqrt(size)
+    result.append(('points_inside_rect', 'numpy', gu.points_inside_rect,
+                   ([0, 100, 0], [0, 0, 0], [100, 0, 0], [100, 100, 0], resolution)))
+
+    vec0 = square[0] - square[1]
+    vec2 = square[2] - square[1]
+    result += [
+        ('search_rect_inside_bound_1', 'numba', lambda v, a, b, p: gun.search_rect_inside_bound_1(v.copy(), a, b, p),
+         (square, square[0] - square[1], square[3] - square[2], points)),
+        ('search_rect_inside_bound_2', 'numpy', gu.search_rect_inside_bound_2, (square[1], vec0, vec2, points)),
+        ('search_rect_inside_bound_2', 'numba', lambda v, a, b, p: gun.search_rect_inside_bound_2(v.copy(), a, b, p),
+         (square, vec0, vec2, points)),
+        ('search_rect_inside_bound_3', 'numpy', gu.search_rect_inside_bound_3,
+         (square[1], square[2], square[0] - square[1], square[3] - square[2], points)),
+        ('search_rect_inside_bound_3', 'numba', lambda v, p: gun.search_rect_inside_bound_3(v.copy(), p), (square, points)),
+    ]
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000],
+                        help='triangles, segments and points per case')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--max-python', type=int, default=10000,
+                        help='largest size for the per-element Python loops of geom_utils')
+    parser.add_argument('--output', default='bench_geom_utils.json')
+    args = parser.parse_args()
+
+    results = []
+    for size in args.sizes:
+        rng = np.random.default_rng(args.seed)
+        for kernel, implementation, func, func_args in cases(rng, size, args.max_python):
+            timing = time_case(func, func_args, args.repeat)
+            results.append(dict(kernel=kernel, implementation=implementation, size=size, **timing))
+            print(f"{kernel:<32}{implementation:<22}{size:>8}  first (jit/cache) {timing['first_call_jit_or_cache_load_s'] * 1e3:10.2f} ms"
+                  f"  min {timing['min_s'] * 1e3:10.3f} ms")
+
+    report = {
+        'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'numba': nb.__version__,
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'numba_threads': nb.config.NUMBA_NUM_THREADS,
+        'numba_cache_dir': nb.config.CACHE_DIR or None,
+        'args': vars(args),
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
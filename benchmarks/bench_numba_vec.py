@@ -0,0 +1,152 @@
+"""
+Heap allocations and run time of the geometry kernels in Utils/geom_utils_numba.py
+against the same kernels written with the array returning Utils/numba_vec functions.
+
+    python benchmarks/bench_numba_vec.py [--calls N]
+
+Allocations are counted by the numba runtime (NRT) statistics, which must be enabled
+before numba is imported.
+"""
+import os
+os.environ.setdefault('NUMBA_NRT_STATS', '1')
+
+import argparse
+import sys
+import time
+
+import numba as nb
+import numpy as np
+from numba.core.runtime import rtsys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import Utils.numba_vec as nbv
+import Utils.geom_utils_numba as gun
+
+
+# kernels as written on the array returning numba_vec API
+
+@nb.njit(fastmath=True)
+def ray_triangle_intersect_arrays(ray_origin, ray_direction, tri_v0, tri_v1, tri_v2):
+    v0v1 = nbv.sub(tri_v0, tri_v1)
+    v0v2 = nbv.sub(tri_v0, tri_v2)
+    pvec = nbv.cross(ray_direction, v0v2)
+    det = nbv.dot(v0v1, pvec)
+    if abs(det) < 0.000001:
+        return -np.inf
+    invDet = 1.0 / det
+    tvec = nbv.sub(tri_v0, ray_origin)
+    u = nbv.dot(tvec, pvec) * invDet
+    if u < 0 or u > 1:
+        return -np.inf
+    qvec = nbv.cross(tvec, v0v1)
+    v = nbv.dot(ray_direction, qvec) * invDet
+    if v < 0 or u + v > 1:
+        return -np.inf
+    return nbv.dot(v0v2, qvec) * invDet
+
+
+@nb.njit(fastmath=True)
+def dist_pnt_line_arrays(query_pnt, pnt0, pnt1, normal):
+    query_dir = nbv.sub(pnt0, query_pnt)
+    line_dir = nbv.sub(pnt0, pnt1)
+    perp_dir = nbv.cross(normal, line_dir)
+    perp_dir = nbv.div(nbv.calc_l2_norm(perp_dir), perp_dir)
+    return nbv.dot(query_dir, perp_dir)
+
+
+@nb.njit(fastmath=True)
+def ray_segment_intersect_arrays(ray_pnt, ray_dir, pnt1, pnt2):
+    thres = 0.000001
+    seg_dir = nbv.sub(pnt1, pnt2)
+    ray_dir = nbv.div(nbv.norm(ray_dir), ray_dir)
+    vec1 = nbv.sub(ray_pnt, pnt1)
+    vec2 = nbv.sub(ray_pnt, pnt2)
+    if nbv.norm(nbv.cross(vec1, vec2)) < thres:
+        return 0.0
+    normal = nbv.cross(seg_dir, ray_dir)
+    if nbv.norm(normal) < thres:
+        return -np.inf
+    if nbv.dot(vec1, ray_dir) < 0 and nbv.dot(vec2, ray_dir) < 0:
+        return -np.inf
+    if nbv.dot(nbv.cross(vec1, ray_dir), nbv.cross(vec2, ray_dir)) > 0:
+        return -np.inf
+    seg_normal = nbv.cross(normal, seg_dir)
+    seg_normal = nbv.div(nbv.norm(seg_normal), seg_normal)
+    return nbv.dot(vec1, seg_normal) / nbv.dot(ray_dir, seg_normal)
+
+
+# drivers calling a kernel for every row, so dispatch overhead is not measured
+
+def make_ray_triangle_driver(kernel):
+    @nb.njit
+    def driver(origins, directions, tris):
+        total = 0.0
+        for i in range(origins.shape[0]):
+            t = kernel(origins[i], directions[i], tris[i, 0], tris[i, 1], tris[i, 2])
+            if t > 0:
+                total += t
+        return total
+    return driver
+
+
+def make_dist_line_driver(kernel):
+    @nb.njit
+    def driver(points, lines, normals):
+        total = 0.0
+        for i in range(points.shape[0]):
+            total += kernel(points[i], lines[i, 0], lines[i, 1], normals[i])
+        return total
+    return driver
+
+
+def make_ray_segment_driver(kernel):
+    @nb.njit
+    def driver(origins, directions, segs):
+        total = 0.0
+        for i in range(origins.shape[0]):
+            t = kernel(origins[i], directions[i], segs[i, 0], segs[i, 1])
+            if t > 0:
+                total += t
+        return total
+    return driver
+
+
+def measure(driver, args):
+    driver(*args)  # JIT warm-up
+    before = rtsys.get_allocation_stats().alloc
+    start = time.perf_counter()
+    driver(*args)
+    seconds = time.perf_counter() - start
+    return rtsys.get_allocation_stats().alloc - before, seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--calls', type=int, default=1000000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    n = args.calls
+    origins = rng.random((n, 3))
+    directions = rng.normal(size=(n, 3))
+    pairs = rng.random((n, 3, 3))
+
+    cases = [
+        ('ray_triangle_intersect', make_ray_triangle_driver, ray_triangle_intersect_arrays,
+         gun.ray_triangle_intersect, (origins, directions, pairs)),
+        ('dist_pnt_line', make_dist_line_driver, dist_pnt_line_arrays,
+         gun.dist_pnt_line, (origins, pairs[:, :2], directions)),
+        ('ray_segment_intersect', make_ray_segment_driver, ray_segment_intersect_arrays,
+         gun.ray_segment_intersect, (origins, directions, pairs[:, :2])),
+    ]
+
+    print(f"{'kernel':<24}{'variant':<10}{'allocs/call':>14}{'ns/call':>12}")
+    for name, make_driver, array_kernel, tuple_kernel, data in cases:
+        for variant, kernel in (('arrays', array_kernel), ('tuples', tuple_kernel)):
+            allocs, seconds = measure(make_driver(kernel), data)
+            print(f"{name:<24}{variant:<10}{allocs / n:>14.2f}{seconds * 1e9 / n:>12.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+"""
+Benchmark of the triangulation readers in Utils/occ_utils.py: triangulation_from_shape (Python lists)
+against triangulation_arrays_from_shape (NumPy arrays), next to the BRepMesh time of the same shape,
+and the serial array reader against triangulation_arrays_sharded on a process pool.
+
+    python benchmarks/bench_triangulation.py [--step part.step] [--scales 1 10 50] [--copies 200] [--processes 8]
+                                             [--chunk-size 100] [--output results.json]
+
+pythonocc exposes no bulk accessor for Poly_Triangulation, so both readers still fetch every node,
+UV node and triangle with one Python call. The benchmark measures what that per node read costs
+compared to meshing, and what the array reader saves on the list handling around it. The sharded
+time includes starting the pool and serialising the shards, and its arrays are checked to be equal
+to the serial ones.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+
+import numpy as np
+from OCC.Core.BRep import BRep_Builder
+from OCC.Core.BRepMesh import BRepMesh_IncrementalMesh
+from OCC.Core.BRepPrimAPI import BRepPrimAPI_MakeTorus
+from OCC.Core.BRepTools import breptools
+from OCC.Core.TopoDS import TopoDS_Compound
+from OCC.Core.gp import gp_Ax2, gp_Pnt
+from OCC.Extend.DataExchange import read_step_file
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import Utils.occ_utils as occ_utils
+
+# both readers mesh with these settings first, a shape meshed with them is not meshed again
+LINEAR_DEFLECTION = 0.01
+ANGULAR_DEFLECTION = 0.5
+
+
+def fresh_shape(args, scale):
+    if args.step:
+        shape = read_step_file(args.step)
+    else:
+        # a row of separate tori, so the sharded reader has faces to split
+        shape = TopoDS_Compound()
+        builder = BRep_Builder()
+        builder.MakeCompound(shape)
+        for i in range(args.copies):
+            axes = gp_Ax2(gp_Pnt(30.0 * scale * i, 0.0, 0.0), gp_Ax2().Direction())
+            builder.Add(shape, BRepPrimAPI_MakeTorus(axes, 10.0 * scale, 3.0 * scale).Shape())
+    breptools.Clean(shape)
+    return shape
+
+
+def time_call(func, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start)
+    return result, min(times), statistics.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--step', help='STEP file to read, a row of tori by default')
+    parser.add_argument('--copies', type=int, default=200, help='number of tori')
+    parser.add_argument('--scales', type=float, nargs='+', default=[1.0, 10.0, 50.0],
+                        help='torus scale factors, larger tori give more nodes at the fixed deflection')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--processes', type=int, help="PERFORMANCE_SETTINGS['batch_processing']['num_processes'] by default")
+    parser.add_argument('--chunk-size', type=int, help="PERFORMANCE_SETTINGS['batch_processing']['chunk_size'] by default")
+    parser.add_argument('--output', default='bench_triangulation.json')
+    args = parser.parse_args()
+
+    results = []
+    for scale in ([1.0] if args.step else args.scales):
+        shape = fresh_shape(args, scale)
+        start = time.perf_counter()
+        BRepMesh_IncrementalMesh(shape, LINEAR_DEFLECTION, False, ANGULAR_DEFLECTION, True)
+        mesh_s = time.perf_counter() - start
+
+        (pts, _, _, _), list_min, list_median = time_call(lambda: occ_utils.triangulation_from_shape(shape), args.repeat)
+        _, array_min, array_median = time_call(lambda: occ_utils.triangulation_arrays_from_shape(shape), args.repeat)
+        num_nodes = len(pts)
+
+        faces = occ_utils.list_face(shape)
+        serial, serial_min, serial_median = time_call(
+            lambda: occ_utils.triangulation_arrays_sharded(faces, num_processes=1), args.repeat)
+        sharded, sharded_min, sharded_median = time_call(
+            lambda: occ_utils.triangulation_arrays_sharded(faces, True, args.processes, args.chunk_size), args.repeat)
+        same = all(np.array_equal(a, b) for a, b in zip(serial, sharded))
+
+        result = {'scale': scale, 'faces': len(faces), 'nodes': num_nodes, 'mesh_s': mesh_s,
+                  'lists_min_s': list_min, 'lists_median_s': list_median,
+                  'arrays_min_s': array_min, 'arrays_median_s': array_median,
+                  'arrays_nodes_per_s': num_nodes / array_min if array_min > 0 else 0.0,
+                  'serial_min_s': serial_min, 'serial_median_s': serial_median,
+                  'sharded_min_s': sharded_min, 'sharded_median_s': sharded_median,
+                  'sharded_speedup': serial_min / sharded_min if sharded_min > 0 else 0.0,
+                  'sharded_equal': same}
+        results.append(result)
+        print(f"scale {scale:<8}{num_nodes:>10} nodes  mesh {mesh_s * 1e3:10.1f} ms  "
+              f"lists {list_min * 1e3:10.1f} ms  arrays {array_min * 1e3:10.1f} ms  "
+              f"({result['arrays_nodes_per_s'] / 1e6:.2f} M nodes/s)")
+        print(f"    {len(faces)} faces  serial {serial_min * 1e3:10.1f} ms  sharded {sharded_min * 1e3:10.1f} ms  "
+              f"x{result['sharded_speedup']:.2f}{'' if same else '  ARRAYS DIFFER'}")
+
+    report = {
+        'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'args': vars(args),
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+
+from Utils.bvh_numba import build_bvh, bvh_any_hit, bvh_closest_hit, bvh_closest_hits
+import Utils.geom_utils_numba as gun
+
+
+def random_triangles(rng, num_tris):
+    centers = rng.uniform(-5.0, 5.0, (num_tris, 1, 3))
+    return centers + rng.uniform(-1.0, 1.0, (num_tris, 3, 3))
+
+
+def random_rays(rng, num_rays):
+    origins = rng.uniform(-8.0, 8.0, (num_rays, 3))
+    # aim at the triangle cloud, so most rays hit something
+    dirs = rng.uniform(-3.0, 3.0, (num_rays, 3)) - origins
+    return origins, dirs / np.linalg.norm(dirs, axis=1)[:, None]
+
+
+def brute_force_hit(triangles, origin, direction):
+    best_t, best_id = np.inf, -1
+    for i, tri in enumerate(triangles):
+        t = gun.ray_triangle_intersect(origin, direction, tri[0], tri[1], tri[2])
+        if 0 < t < best_t:
+            best_t, best_id = t, i
+    if best_id < 0:
+        return -np.inf, -1
+    return best_t, best_id
+
+
+@pytest.mark.parametrize('leaf_size', [1, 4, 16])
+def test_closest_hit_matches_brute_force(leaf_size):
+    rng = np.random.default_rng(0)
+    triangles = random_triangles(rng, 300)
+    bvh = build_bvh(triangles, leaf_size)
+    origins, dirs = random_rays(rng, 200)
+
+    num_hits = 0
+    for origin, direction in zip(origins, dirs):
+        t, tri_id = bvh_closest_hit(bvh, origin, direction)
+        ref_t, ref_id = brute_force_hit(triangles, origin, direction)
+        assert tri_id == ref_id
+        assert t == pytest.approx(ref_t)
+        assert bvh_any_hit(bvh, origin, direction) == (ref_id >= 0)
+        num_hits += ref_id >= 0
+    assert 0 < num_hits < len(origins)
+
+
+def test_closest_hits_matches_single_rays():
+    rng = np.random.default_rng(1)
+    triangles = random_triangles(rng, 200)
+    bvh = build_bvh(triangles)
+    origins, dirs = random_rays(rng, 100)
+
+    ts, tri_ids = bvh_closest_hits(bvh, origins, dirs)
+    for r in range(len(origins)):
+        ref_t, ref_id = brute_force_hit(triangles, origins[r], dirs[r])
+        assert tri_ids[r] == ref_id
+        assert ts[r] == pytest.approx(ref_t)
+
+
+def test_axis_aligned_rays():
+    # zero direction components take the guarded inverse in the box test
+    triangles = np.array([[[0.0, 0.0, 1.0], [1.0, 0.0, 1.0], [0.0, 1.0, 1.0]],
+                          [[0.0, 0.0, 3.0], [1.0, 0.0, 3.0], [0.0, 1.0, 3.0]]])
+    bvh = build_bvh(triangles, leaf_size=1)
+
+    t, tri_id = bvh_closest_hit(bvh, np.array([0.2, 0.2, 0.0]), np.array([0.0, 0.0, 1.0]))
+    assert (t, tri_id) == (pytest.approx(1.0), 0)
+    t, tri_id = bvh_closest_hit(bvh, np.array([0.2, 0.2, 2.0]), np.array([0.0, 0.0, 1.0]))
+    assert (t, tri_id) == (pytest.approx(1.0), 1)
+    t, tri_id = bvh_closest_hit(bvh, np.array([2.0, 2.0, 0.0]), np.array([0.0, 0.0, 1.0]))
+    assert (t, tri_id) == (-np.inf, -1)
+
+
+def test_empty_bvh():
+    bvh = build_bvh(np.empty((0, 3, 3)))
+    assert bvh_closest_hit(bvh, np.zeros(3), np.array([0.0, 0.0, 1.0])) == (-np.inf, -1)
+    assert not bvh_any_hit(bvh, np.zeros(3), np.array([0.0, 0.0, 1.0]))
@@ -0,0 +1,25 @@
+import collections
+
+import pytest
+
+pytest.importorskip('OCC.Core')
+
+import Utils.occ_utils as occ_utils
+import Utils.shape_factory as shape_factory
+
+
+def label_multiset(shape, name_map):
+    seg_map = name_map[0] if isinstance(name_map, tuple) else name_map
+    return collections.Counter(seg_map.get(face, shape_factory.LABEL_INDEX['other'])
+                               for face in occ_utils.list_face(shape))
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_batch_matches_sequential(seed):
+    shape, name_map, _, shape_name = shape_factory.shape_drain(seed, batch=False)
+    batch_shape, batch_name_map, _, batch_shape_name = shape_factory.shape_drain(seed, batch=True)
+
+    # the same seed draws the same feature type and wires in both modes
+    assert batch_shape_name == shape_name
+    assert len(occ_utils.list_face(batch_shape)) == len(occ_utils.list_face(shape))
+    assert label_multiset(batch_shape, batch_name_map) == label_multiset(shape, name_map)
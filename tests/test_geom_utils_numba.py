@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+import Utils.geom_utils as geom_utils
+import Utils.geom_utils_numba as gun
+
+SQUARE = np.array([[0.0, 0.0, 0.0], [1.0, 0.0, 0.0], [1.0, 1.0, 0.0], [0.0, 1.0, 0.0]])
+HEXAGON = np.array([[np.cos(a), np.sin(a), 0.5] for a in np.linspace(0.0, 2 * np.pi, 6, endpoint=False)])
+
+
+def polygon_points(verts):
+    rng = np.random.default_rng(0)
+    pnts = rng.uniform(-1.5, 1.5, (500, 3))
+    pnts[:, 2] = verts[0, 2]
+    edge_t = rng.uniform(0.0, 1.0, (len(verts), 1))
+    edge_pnts = verts + edge_t * (np.roll(verts, -1, axis=0) - verts)
+    return np.concatenate([pnts, verts, edge_pnts, verts.mean(axis=0, keepdims=True)])
+
+
+def numba_mask(pnts, verts):
+    closed = np.append(verts, [verts[0]], axis=0)
+    normal = np.cross(verts[1] - verts[0], verts[2] - verts[1])
+    return gun.points_in_polygon_mask(pnts, closed, normal)
+
+
+@pytest.mark.parametrize('verts', [SQUARE, HEXAGON,
+                                   # a duplicate vertex gives a zero length edge
+                                   np.insert(SQUARE, 3, SQUARE[2], axis=0)])
+def test_mask_matches_numpy(verts):
+    pnts = polygon_points(verts)
+    mask = numba_mask(pnts, verts)
+    assert np.array_equal(mask, geom_utils.points_in_polygon_mask(pnts, verts))
+    # the centroid is inside, points on vertices and edges are not
+    assert mask[-1]
+    assert not np.any(mask[500:-1])
+
+
+def test_points_in_polygon_matches_numpy():
+    pnts = polygon_points(HEXAGON)
+    assert np.array_equal(gun.points_in_polygon(pnts, HEXAGON), geom_utils.points_in_polygon(pnts, HEXAGON))
+
+
+def test_segment_with_normal():
+    verts = np.array([[0.0, 0.0, 0.0], [1.0, 0.0, 0.0]])
+    normal = np.array([0.0, 0.0, 1.0])
+    pnts = np.array([[0.5, 0.5, 0.0], [0.5, -0.5, 0.0], [0.5, 0.0, 0.0]])
+    assert np.array_equal(gun.points_in_polygon(pnts, verts, False, normal),
+                          geom_utils.points_in_polygon(pnts, verts, False, normal))
@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+
+import Utils.numba_vec as nbv
+
+
+@pytest.fixture
+def vecs():
+    rng = np.random.default_rng(0)
+    return rng.normal(size=(2, 3))
+
+
+@pytest.mark.parametrize('as_tuple', [False, True])
+def test_tuple_helpers_match_numpy(vecs, as_tuple):
+    a, b = vecs
+    if as_tuple:
+        a, b = tuple(a), tuple(b)
+    na, nb = np.asarray(a), np.asarray(b)
+
+    assert np.allclose(nbv.add_t(a, b), na + nb)
+    # sub_t(a, b) is b - a, like sub
+    assert np.allclose(nbv.sub_t(a, b), nb - na)
+    assert np.allclose(nbv.mul_t(2.5, a), 2.5 * na)
+    assert np.allclose(nbv.div_t(2.5, a), na / 2.5)
+    assert np.allclose(nbv.cross_t(a, b), np.cross(na, nb))
+
+
+def test_tuple_helpers_match_array_versions(vecs):
+    a, b = vecs
+    assert np.allclose(nbv.add_t(a, b), nbv.add(a, b))
+    assert np.allclose(nbv.sub_t(a, b), nbv.sub(a, b))
+    assert np.allclose(nbv.mul_t(2.5, a), nbv.mul(2.5, a))
+    assert np.allclose(nbv.div_t(2.5, a), nbv.div(2.5, a))
+    assert np.allclose(nbv.cross_t(a, b), nbv.cross(a, b))
+
+
+def test_tuples_feed_array_helpers(vecs):
+    a, b = vecs
+    c = nbv.cross_t(a, b)
+    assert nbv.dot(c, a) == pytest.approx(0.0, abs=1e-12)
+    assert nbv.norm(c) == pytest.approx(np.linalg.norm(np.cross(a, b)))
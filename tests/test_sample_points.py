@@ -0,0 +1,103 @@
+import numpy as np
+import pytest
+
+pytest.importorskip('OCC.Core')
+
+from OCC.Core.BRepPrimAPI import BRepPrimAPI_MakeBox, BRepPrimAPI_MakeCylinder
+from OCC.Core.TopLoc import TopLoc_Location
+from OCC.Core.TopoDS import topods
+from OCC.Core.gp import gp_Trsf, gp_Vec
+
+import Utils.occ_utils as occ_utils
+
+SIZE = np.array([1.0, 2.0, 3.0])
+
+
+def box_faces(offset=(0.0, 0.0, 0.0)):
+    box = BRepPrimAPI_MakeBox(*SIZE).Shape()
+    if any(offset):
+        trsf = gp_Trsf()
+        trsf.SetTranslation(gp_Vec(*offset))
+        box = box.Moved(TopLoc_Location(trsf))
+    return occ_utils.list_face(box)
+
+
+def outward_normal(pts, offset):
+    '''
+        the axis a box face is flat in, and the outward normal that side of the box gives
+    '''
+    local = pts - offset
+    axis = int(np.argmin(np.ptp(local, axis=0)))
+    normal = np.zeros(3)
+    normal[axis] = 1.0 if np.mean(local[:, axis]) > SIZE[axis] / 2 else -1.0
+    return axis, normal
+
+
+@pytest.mark.parametrize('project', [False, True])
+@pytest.mark.parametrize('offset', [(0.0, 0.0, 0.0), (5.0, -3.0, 2.0)])
+def test_points_on_box_faces(project, offset):
+    rng = np.random.default_rng(0)
+    offset = np.array(offset)
+    for face in box_faces(offset):
+        pts, normals = occ_utils.sample_points(face, 200, project=project, rng=rng)
+        assert pts.shape == (200, 3) and normals.shape == (200, 3)
+
+        local = pts - offset
+        assert np.all(local >= -1e-9) and np.all(local <= SIZE + 1e-9)
+        axis, normal = outward_normal(pts, offset)
+        assert np.allclose(local[:, axis], 0.0, atol=1e-9) or np.allclose(local[:, axis], SIZE[axis], atol=1e-9)
+        assert np.allclose(np.linalg.norm(normals, axis=1), 1.0)
+        assert np.allclose(normals, normal)
+
+
+@pytest.mark.parametrize('project', [False, True])
+def test_reversed_face_flips_normals(project):
+    for face in box_faces():
+        _, normals = occ_utils.sample_points(face, 50, project=project, rng=np.random.default_rng(1))
+        _, reversed_normals = occ_utils.sample_points(topods.Face(face.Reversed()), 50, project=project,
+                                                      rng=np.random.default_rng(1))
+        assert np.allclose(reversed_normals, -normals)
+
+
+def test_cylinder_points_and_normals():
+    radius, height = 2.0, 5.0
+    cylinder = BRepPrimAPI_MakeCylinder(radius, height).Shape()
+    lateral = [f for f in occ_utils.list_face(cylinder) if occ_utils.type_face(f) == 'cylinder'][0]
+    pts, normals = occ_utils.sample_points(lateral, 500, project=True, rng=np.random.default_rng(2))
+
+    radial = pts[:, :2] / np.linalg.norm(pts[:, :2], axis=1)[:, None]
+    assert np.allclose(np.linalg.norm(pts[:, :2], axis=1), radius)
+    assert np.all((pts[:, 2] >= -1e-9) & (pts[:, 2] <= height + 1e-9))
+    assert np.allclose(np.linalg.norm(normals, axis=1), 1.0)
+    assert np.allclose(normals[:, :2], radial, atol=1e-6)
+    assert np.allclose(normals[:, 2], 0.0, atol=1e-6)
+
+
+def test_area_weighting_is_uniform():
+    num_points = 20000
+    # the mesh of the lateral face has triangles of different sizes along the seam and the caps
+    cylinder = BRepPrimAPI_MakeCylinder(1.0, 4.0).Shape()
+    lateral = [f for f in occ_utils.list_face(cylinder) if occ_utils.type_face(f) == 'cylinder'][0]
+    pts, _ = occ_utils.sample_points(lateral, num_points, rng=np.random.default_rng(3))
+
+    angles = np.arctan2(pts[:, 1], pts[:, 0])
+    quadrants = np.bincount(((angles + np.pi) // (np.pi / 2)).astype(int) % 4, minlength=4) / num_points
+    assert np.allclose(quadrants, 0.25, atol=0.02)
+    heights = np.bincount(np.minimum(pts[:, 2] // 1.0, 3).astype(int), minlength=4) / num_points
+    assert np.allclose(heights, 0.25, atol=0.02)
+
+    face = box_faces()[0]
+    pts, _ = occ_utils.sample_points(face, num_points, rng=np.random.default_rng(4))
+    axis, _ = outward_normal(pts, np.zeros(3))
+    u, v = [a for a in range(3) if a != axis]
+    cells = (pts[:, u] > SIZE[u] / 2).astype(int) * 2 + (pts[:, v] > SIZE[v] / 2).astype(int)
+    assert np.allclose(np.bincount(cells, minlength=4) / num_points, 0.25, atol=0.02)
+
+
+def test_project_without_uv_nodes_raises(monkeypatch):
+    face = box_faces()[0]
+    occ_utils.sample_points(face, 1)
+    pts, _, triangles = occ_utils.face_triangulation_arrays(face)
+    monkeypatch.setattr(occ_utils, 'face_triangulation_arrays', lambda face, with_uvs=True: (pts, None, triangles))
+    with pytest.raises(ValueError):
+        occ_utils.sample_points(face, 10, project=True)
@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+from Utils.geom_utils import SegmentGrid, point_segment_distances
+
+
+def polylines(rng, num_lines, num_pnts):
+    '''random walks, labelled by the polyline they belong to'''
+    segments, labels = [], []
+    for label in range(num_lines):
+        pnts = rng.uniform(-5.0, 5.0, 3) + np.cumsum(rng.normal(scale=0.5, size=(num_pnts, 3)), axis=0)
+        segments.append(np.stack([pnts[:-1], pnts[1:]], axis=1))
+        labels.append(np.full(num_pnts - 1, label))
+    return np.concatenate(segments), np.concatenate(labels)
+
+
+def brute_force(pnt, segments, labels, slack):
+    dists = np.empty(len(segments))
+    for s, (a, b) in enumerate(segments):
+        ab = b - a
+        t = np.clip(np.dot(pnt - a, ab) / np.dot(ab, ab), 0.0, 1.0)
+        dists[s] = np.linalg.norm(a + t * ab - pnt)
+    nearest = {}
+    for label, dist in zip(labels, dists):
+        nearest[label] = min(dist, nearest.get(label, np.inf))
+    best = dists.min()
+    return {label: dist for label, dist in nearest.items() if dist <= best + slack}
+
+
+@pytest.mark.parametrize('slack', [0.0, 0.3])
+@pytest.mark.parametrize('resolution', [4, 64])
+def test_candidates_match_brute_force(slack, resolution):
+    rng = np.random.default_rng(0)
+    segments, labels = polylines(rng, 12, 30)
+    grid = SegmentGrid(segments, labels, slack, resolution)
+    # points inside the grid and well outside it
+    pnts = np.concatenate([rng.uniform(-6.0, 6.0, (100, 3)), rng.uniform(-30.0, 30.0, (10, 3))])
+
+    for pnt in pnts:
+        found = grid.candidates(pnt)
+        ref = brute_force(pnt, segments, labels, slack)
+        assert set(found) == set(ref)
+        for label, dist in found.items():
+            assert dist == pytest.approx(ref[label])
+
+
+def test_point_segment_distances():
+    segments = np.array([[[0.0, 0.0, 0.0], [1.0, 0.0, 0.0]],
+                         [[0.0, 0.0, 0.0], [0.0, 0.0, 0.0]]])
+    pnt = np.array([2.0, 1.0, 0.0])
+    assert np.allclose(point_segment_distances(pnt, segments), [np.sqrt(2.0), np.sqrt(5.0)])
+
+
+def test_empty_grid():
+    grid = SegmentGrid(np.empty((0, 2, 3)), np.empty(0, dtype=np.int32))
+    assert grid.candidates([0.0, 0.0, 0.0]) == {}
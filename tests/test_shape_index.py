@@ -0,0 +1,115 @@
+import numpy as np
+import pytest
+
+pytest.importorskip('OCC.Core')
+
+from OCC.Core.BRepPrimAPI import BRepPrimAPI_MakeBox
+from OCC.Core.TopoDS import topods
+
+from Utils.shape_index import (FaceIndex, TopologyIndex, face_descriptor_of, invalidate_topology_index,
+                               topology_index)
+
+SIZE = np.array([1.0, 2.0, 3.0])
+
+
+@pytest.fixture
+def box():
+    return BRepPrimAPI_MakeBox(*SIZE).Shape()
+
+
+def test_face_index_accepts_numpy_ids(box):
+    face_index = FaceIndex(box)
+    labels = face_index.new_labels()
+    labels[[1, 4]] = 0
+    for fid in np.flatnonzero(labels >= 0):
+        assert isinstance(fid, np.int64)
+        assert face_index.index(face_index.face(fid)) == fid
+
+
+def test_topology_index_accepts_numpy_ids(box):
+    topology = TopologyIndex(box)
+    for fid in np.arange(6, dtype=np.int64):
+        assert topology.face_id(topology.face(fid)) == fid
+    for eid in np.arange(12, dtype=np.int64):
+        assert topology.edge_id(topology.edge(eid)) == eid
+    for vid in np.arange(8, dtype=np.int64):
+        assert topology.vertex_id(topology.vertex(vid)) == vid
+
+
+def test_face_descriptors(box):
+    table = TopologyIndex(box).face_descriptors()
+    assert len(table) == 6
+    assert np.all(table['surface_type'] == 0)   # GeomAbs_Plane
+    assert np.isclose(table['area'].sum(), 2 * (SIZE[0] * SIZE[1] + SIZE[1] * SIZE[2] + SIZE[0] * SIZE[2]))
+    for row in table:
+        normal = row['normal']
+        assert np.isclose(np.linalg.norm(normal), 1.0)
+        assert np.allclose(normal, row['centroid_normal'])
+        # the outward normal points from the box center to the face centroid
+        assert np.allclose(normal, np.sign(row['centroid'] - SIZE / 2) * np.abs(normal))
+        assert np.all(row['box'][:3] <= row['centroid']) and np.all(row['centroid'] <= row['box'][3:])
+
+
+def test_face_descriptors_are_computed_on_request(box):
+    topology = TopologyIndex(box)
+    table = topology.face_descriptors([np.int64(2)])
+    assert table['area'][2] > 0
+    assert np.all(table['area'][[0, 1, 3, 4, 5]] == 0)
+    assert topology.face_descriptors() is table
+    assert np.all(table['area'] > 0)
+
+
+def test_face_descriptors_compute_only_requested_fields(box):
+    topology = TopologyIndex(box)
+    table = topology.face_descriptors(fields=('surface_type', 'area', 'centroid', 'normal'))
+    assert np.all(table['area'] > 0)
+    assert np.allclose(np.linalg.norm(table['normal'], axis=1), 1.0)
+    assert np.all(table['box'] == 0) and np.all(table['centroid_normal'] == 0)
+
+    table = topology.face_descriptors([0], ('box',))
+    assert np.any(table['box'][0] != 0) and np.all(table['box'][1:] == 0)
+    assert np.allclose(topology.face_descriptors()['centroid_normal'], table['normal'])
+
+
+def test_face_descriptor_of_follows_face_orientation(box):
+    invalidate_topology_index()
+    face = topology_index(box).face(0)
+    row = face_descriptor_of(box, face)
+    reversed_row = face_descriptor_of(box, topods.Face(face.Reversed()))
+    assert np.allclose(reversed_row['normal'], -row['normal'])
+    assert np.allclose(reversed_row['centroid_normal'], -row['centroid_normal'])
+    assert np.allclose(reversed_row['centroid'], row['centroid'])
+    # the cached table keeps the orientation of the shape
+    assert np.allclose(face_descriptor_of(box, face)['normal'], row['normal'])
+
+    other = BRepPrimAPI_MakeBox(1.0, 1.0, 1.0).Shape()
+    assert face_descriptor_of(box, topology_index(other).face(0)) is None
+
+
+def test_invalidate_topology_index(box):
+    invalidate_topology_index()
+    other = BRepPrimAPI_MakeBox(1.0, 1.0, 1.0).Shape()
+    index, other_index = topology_index(box), topology_index(other)
+    assert topology_index(box) is index
+
+    invalidate_topology_index(box)
+    assert topology_index(box) is not index
+    assert topology_index(other) is other_index
+
+    invalidate_topology_index()
+    assert topology_index(other) is not other_index
+
+
+def test_face_helpers_read_the_table(box):
+    import Utils.occ_utils as occ_utils
+    import Utils.shape_factory as shape_factory
+
+    invalidate_topology_index()
+    for face in occ_utils.list_face(box):
+        assert occ_utils.type_face(face, box) == occ_utils.type_face(face)
+        assert np.allclose(shape_factory.ask_face_centroid(face, box), shape_factory.ask_face_centroid(face))
+        assert occ_utils.normal_to_face_center(face, box).IsEqual(occ_utils.normal_to_face_center(face), 1e-9)
+        centroid_uv = shape_factory.ask_point_uv2(shape_factory.ask_face_centroid(face), face)
+        row = face_descriptor_of(box, face)
+        assert np.allclose(row['centroid_uv'], centroid_uv)
+        assert np.allclose(row['centroid_normal'], shape_factory.ask_point_normal_face(centroid_uv, face))